@@ -1,24 +1,86 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
+import hmac
 import json
+import os
+import select
+import socket
+import threading
+import time
 from database import Database
 from services import AIGCService
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_ADJUST, PRIORITY_BATCH
+from plan_cache import PlanCache
+from plan_model import dumps_plan
+from llm_cache import request_key
+from bulk_generate import BulkGenerator, REQUIRED_FIELDS, load_demands
+from rate_limiter import RateLimiter
+from response_utils import compress_response, parse_projection, project_plan, plan_etag
+from traffic_capture import get_traffic_recorder
+from request_profiler import (
+    RequestProfiler, ProfiledJSONProvider, stage, PROFILE_HEADER, PROFILE_ID_HEADER, PROFILE_MODES
+)
 
 # 创建Flask应用
 app = Flask(__name__)
+# 请求体解析与响应序列化计入请求剖析的json阶段
+app.json = ProfiledJSONProvider(app)
+# 中文不转义为\uXXXX，方案JSON体积约减少一半
+app.json.ensure_ascii = False
 
 # 配置CORS处理跨域
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "ETag",
+                           PROFILE_ID_HEADER],
+        # 预检请求结果缓存一天，减少OPTIONS往返
+        "max_age": 86400
     }
 })
 
 # 初始化数据库和服务
 db = Database()
 aigc_service = AIGCService()
+# LLM请求调度器（交互请求优先，按客户端加权公平排队）
+llm_scheduler = LLMScheduler()
+# LLM请求最长排队时间（秒）
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 30))
+# 需求 -> 方案缓存
+plan_cache = PlanCache()
+# 相似需求复用：相似度达到阈值直接返回历史方案，LLM不可用时按较低阈值降级返回；预算相差比例上限
+DEMAND_MATCH_THRESHOLD = float(os.getenv('DEMAND_MATCH_THRESHOLD', 0.85))
+DEMAND_FALLBACK_THRESHOLD = float(os.getenv('DEMAND_FALLBACK_THRESHOLD', 0.5))
+DEMAND_BUDGET_BAND = float(os.getenv('DEMAND_BUDGET_BAND', 0.15))
+if db.demand_index is not None:
+    # 启动时在后台构建需求索引，不阻塞首个请求
+    threading.Thread(target=db.demand_index.sync, kwargs={"force": True}, daemon=True).start()
+# 后台定期归档已被取代的历史方案版本（PLAN_ARCHIVE_INTERVAL秒，0表示不启动）
+db.archive.start()
+# 管理接口密钥（未配置时管理接口不可用）
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
+# 批量生成任务文件目录、单个任务的最大并发数与运行中的任务
+BULK_JOB_DIR = os.getenv('BULK_JOB_DIR', 'bulk_jobs')
+BULK_MAX_CONCURRENCY = int(os.getenv('BULK_MAX_CONCURRENCY', 16))
+bulk_jobs = {}
+# 按客户端限流（令牌桶），各接口对应的配额类别
+rate_limiter = RateLimiter()
+# 按API Key单独计算配额的客户端（逗号分隔），其余请求按IP计算
+RATE_LIMIT_API_KEYS = {key.strip() for key in os.getenv('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()}
+RATE_LIMIT_SCOPES = {
+    'receive_demand': 'input',
+    'generate_plan': 'generate',
+    'adjust_plan': 'adjust'
+}
+# 流量录制（配置TRAFFIC_CAPTURE_PATH时开启）及录制的接口
+traffic_recorder = get_traffic_recorder()
+CAPTURE_ENDPOINTS = ('receive_demand', 'generate_plan', 'adjust_plan', 'get_plan')
+# 请求剖析：分阶段耗时、慢请求栈采样与慢请求日志
+request_profiler = RequestProfiler()
+request_profiler.start()
+PROFILE_ENDPOINTS = ('receive_demand', 'generate_plan', 'adjust_plan', 'get_plan')
 
 def validate_required_fields(data, required_fields):
     """验证必需字段"""
@@ -28,6 +90,162 @@ def validate_required_fields(data, required_fields):
             missing_fields.append(field)
     return missing_fields
 
+def get_client_id():
+    """获取客户端标识：已登记的API Key按Key区分，其余（未携带或未登记的Key）按客户端IP
+
+    X-API-Key未经校验，若直接作为标识，客户端每次更换Key即可绕过限流与公平排队
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in RATE_LIMIT_API_KEYS:
+        return f"key:{api_key}"
+    return f"ip:{request.remote_addr}"
+
+def client_disconnected(environ):
+    """检测HTTP客户端是否已断开连接（连接可读但读不到数据即为对端关闭）"""
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+def is_admin():
+    """请求是否携带有效的管理员密钥"""
+    return bool(ADMIN_API_KEY) and hmac.compare_digest(request.headers.get('X-Admin-Key', ''), ADMIN_API_KEY)
+
+def require_admin():
+    """校验管理员密钥，未通过时返回错误响应，通过时返回None"""
+    if not ADMIN_API_KEY:
+        return jsonify({
+            "success": False,
+            "error": "管理接口未启用"
+        }), 403
+    if not is_admin():
+        return jsonify({
+            "success": False,
+            "error": "无权访问管理接口"
+        }), 403
+    return None
+
+def get_projection():
+    """读取查询参数中的方案裁剪参数（请求体中的days是行程天数，不用于裁剪）"""
+    return parse_projection(request.args.get('fields'), request.args.get('days'))
+
+def load_similar_plan(similar, budget):
+    """读取相似需求的方案并按当前预算校验（读取失败或不是结构化方案时返回None）"""
+    row = db.get_parsed_travel_plan(similar["plan_id"])
+    plan = row['plan'] if row else None
+    if not isinstance(plan, dict) or "raw_content" in plan:
+        return None
+    return aigc_service.ensure_plan_budget(plan, budget)
+
+def run_llm_task(fn, priority, **kwargs):
+    """通过调度器执行LLM任务，客户端断开时取消仍在排队的任务"""
+    environ = request.environ
+    return llm_scheduler.run(
+        # 工作线程中的耗时与调用栈计入当前请求的剖析记录
+        request_profiler.bind(fn),
+        priority=priority,
+        client_id=get_client_id(),
+        timeout=LLM_QUEUE_TIMEOUT,
+        is_cancelled=lambda: client_disconnected(environ),
+        **kwargs
+    )
+
+@app.before_request
+def start_profile():
+    """跟踪方案接口的请求耗时；携带X-Profile请求头的管理员请求做cProfile或栈采样剖析"""
+    if request.endpoint not in PROFILE_ENDPOINTS:
+        return
+    mode = request.headers.get(PROFILE_HEADER)
+    if mode not in PROFILE_MODES or not is_admin():
+        mode = None
+    g.request_profile = request_profiler.begin(request.method, request.path, mode)
+
+@app.before_request
+def start_capture():
+    """按采样率标记需要录制的请求（在限流之前，被限流的请求同样录制）"""
+    if traffic_recorder is not None and request.endpoint in CAPTURE_ENDPOINTS and traffic_recorder.sampled():
+        g.capture_started = time.perf_counter()
+        # 请求到达时间：回放按到达时间安排发送，而不是完成时间
+        g.capture_ts = time.time()
+
+@app.before_request
+def enforce_rate_limit():
+    """按客户端与接口类别限流，超出配额时返回429"""
+    scope = RATE_LIMIT_SCOPES.get(request.endpoint)
+    if scope is None or request.method == 'OPTIONS':
+        return None
+    allowed, headers = rate_limiter.check(scope, get_client_id())
+    g.rate_limit_headers = headers
+    if not allowed:
+        return jsonify({
+            "success": False,
+            "error": "请求过于频繁，请稍后重试"
+        }), 429, headers
+    return None
+
+@app.after_request
+def compress(response):
+    """按Accept-Encoding压缩JSON响应"""
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+@app.after_request
+def add_rate_limit_headers(response):
+    """在正常响应上附加剩余配额信息"""
+    headers = g.get('rate_limit_headers')
+    if headers and response.status_code != 429:
+        response.headers.extend(headers)
+    return response
+
+@app.after_request
+def capture_traffic(response):
+    """录制请求与耗时（最后注册，先于压缩执行，记录的是未压缩的响应大小）"""
+    started = g.pop('capture_started', None)
+    arrived_at = g.pop('capture_ts', None)
+    if started is None:
+        return response
+    duration_ms = (time.perf_counter() - started) * 1000
+    # 记录生成的方案id，回放时据此把后续请求中的方案id映射为本地生成的id
+    plan_id = None
+    if response.status_code == 200 and request.endpoint in ('generate_plan', 'adjust_plan'):
+        data = (response.get_json(silent=True) or {}).get('data') or {}
+        plan_id = data.get('plan_id') or data.get('new_plan_id')
+    traffic_recorder.record_request(
+        method=request.method,
+        path=request.path,
+        query=request.query_string.decode('utf-8', 'replace'),
+        body=request.get_json(silent=True),
+        client=get_client_id(),
+        status=response.status_code,
+        duration_ms=duration_ms,
+        response_bytes=response.calculate_content_length(),
+        plan_id=plan_id,
+        ts=arrived_at
+    )
+    return response
+
+@app.after_request
+def finish_profile(response):
+    """结束请求剖析（最后注册、最先执行，耗时不含录制与压缩），被剖析的请求返回剖析记录id"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        entry = request_profiler.end(profile, response.status_code)
+        if entry is not None and profile.mode:
+            response.headers[PROFILE_ID_HEADER] = str(entry["id"])
+    return response
+
+@app.teardown_request
+def discard_profile(error):
+    """未执行after_request（处理请求时抛出异常）的请求同样结束跟踪"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        request_profiler.end(profile, 500)
+
 @app.route('/api/plan/input', methods=['POST'])
 def receive_demand():
     """接口1：需求接收"""
@@ -122,6 +340,14 @@ def generate_plan():
                 "error": "days必须是整数，budget必须是数字"
             }), 400
         
+        try:
+            fields, selected_days = get_projection()
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
         # 先存储需求（如果还没有存储的话）
         demand_id = db.insert_user_demand(
             scene=data['scene'],
@@ -131,33 +357,79 @@ def generate_plan():
             demand=data['demand']
         )
         
-        # 调用AIGC服务生成方案
-        plan_result = aigc_service.generate_travel_plan(
-            scene=data['scene'],
-            days=days,
-            budget=budget,
-            interest=data['interest'],
-            demand=data['demand']
-        )
+        demand_fields = {
+            "scene": data['scene'],
+            "days": days,
+            "budget": budget,
+            "interest": data['interest'],
+            "demand": data['demand']
+        }
         
-        if not plan_result["success"]:
-            return jsonify({
-                "success": False,
-                "error": plan_result["error"]
-            }), 500
+        with stage('cache_lookup'):
+            # 相同需求优先使用已缓存的方案（refresh为true时强制重新生成）
+            cached = None if data.get('refresh') else plan_cache.get(**demand_fields)
+            # 其次查找目的地与天数相同、表述相近且预算接近的历史需求
+            similar = None
+            if not cached and db.demand_index is not None:
+                similar = db.demand_index.search(budget_band=DEMAND_BUDGET_BAND, **demand_fields)
+        
+        degraded = False
+        if cached:
+            plan = cached["plan"]
+        elif not data.get('refresh') and similar and similar["destinations"] \
+                and similar["similarity"] >= DEMAND_MATCH_THRESHOLD:
+            # 未识别出目的地的需求无法确认是同一目的地，只作为降级结果
+            plan = load_similar_plan(similar, budget)
+        else:
+            plan = None
+        
+        if plan is None:
+            # 调用AIGC服务生成方案
+            plan_result = run_llm_task(
+                aigc_service.generate_travel_plan,
+                PRIORITY_INTERACTIVE,
+                # 强制重新生成时同样跳过LLM响应缓存，否则会返回相同的结果
+                refresh=bool(data.get('refresh')),
+                **demand_fields
+            )
+            
+            if plan_result["success"]:
+                plan = plan_result["data"]
+            elif similar and similar["similarity"] >= DEMAND_FALLBACK_THRESHOLD:
+                # LLM不可用时降级返回最相近的历史方案
+                plan = load_similar_plan(similar, budget)
+                degraded = plan is not None
+            if plan is None:
+                return jsonify({
+                    "success": False,
+                    "error": plan_result["error"]
+                }), 503 if plan_result.get("throttled") else 500
+            if not degraded:
+                similar = None
         
         # 存储生成的方案
-        plan_content = json.dumps(plan_result["data"], ensure_ascii=False)
+        with stage('json'):
+            plan_content = dumps_plan(plan).decode('utf-8')
         plan_id = db.insert_travel_plan(demand_id, plan_content)
+        if not cached and not degraded:
+            plan_cache.put(plan_id=plan_id, demand_id=demand_id, plan=plan, **demand_fields)
+        
+        response_data = {
+            "plan_id": plan_id,
+            "demand_id": demand_id,
+            "plan": project_plan(plan, fields, selected_days),
+            "from_cache": bool(cached or similar)
+        }
+        if similar:
+            response_data["similar_demand_id"] = similar["demand_id"]
+            response_data["similarity"] = similar["similarity"]
+        if degraded:
+            response_data["degraded"] = True
         
         return jsonify({
             "success": True,
             "message": "旅游方案生成成功",
-            "data": {
-                "plan_id": plan_id,
-                "demand_id": demand_id,
-                "plan": plan_result["data"]
-            }
+            "data": response_data
         }), 200
         
     except Exception as e:
@@ -190,14 +462,22 @@ def adjust_plan():
             }), 400
         
         # 验证调整类型
-        if data['adjust_type'] not in ['weather', 'crowd']:
+        if data['adjust_type'] not in ['weather', 'crowd', 'route']:
+            return jsonify({
+                "success": False,
+                "error": "adjust_type必须是'weather'、'crowd'或'route'"
+            }), 400
+        
+        try:
+            fields, selected_days = get_projection()
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "error": "adjust_type必须是'weather'或'crowd'"
+                "error": str(e)
             }), 400
         
-        # 获取原始方案
-        plan_data = db.get_travel_plan(data['plan_id'])
+        # 获取原始方案（热点缓存中保存的是已解析的方案）
+        plan_data = db.get_parsed_travel_plan(data['plan_id'])
         
         if not plan_data:
             return jsonify({
@@ -205,10 +485,8 @@ def adjust_plan():
                 "error": "找不到指定的旅游方案"
             }), 404
         
-        # 解析原始方案
-        try:
-            original_plan = json.loads(plan_data[2])  # plan_content字段
-        except json.JSONDecodeError:
+        original_plan = plan_data['plan']
+        if original_plan is None:
             return jsonify({
                 "success": False,
                 "error": "原始方案数据格式错误"
@@ -217,33 +495,118 @@ def adjust_plan():
         # 获取城市信息（从需求中提取或使用默认值）
         city = data.get('city', '北京')  # 可以从原始需求中提取城市信息
         
-        # 调用调整服务
-        adjust_result = aigc_service.adjust_plan_by_weather(
-            original_plan=original_plan,
-            city=city,
-            adjust_type=data['adjust_type']
-        )
+        # 调用调整服务（route类型基于本地通行时间矩阵，不调用LLM）
+        adjust_result = None
+        if data['adjust_type'] == 'route':
+            with stage('local_adjust'):
+                adjust_result = aigc_service.adjust_plan_by_route(
+                    original_plan=original_plan,
+                    city=city
+                )
+        elif data['adjust_type'] == 'crowd':
+            # 先按热度曲线在本地错峰，仅在仍处于高峰时请求LLM推荐替代景点；没有人流量数据时退回LLM整体调整
+            with stage('local_adjust'):
+                adjust_result = aigc_service.adjust_plan_by_crowd(
+                    original_plan=original_plan,
+                    city=city,
+                    start_date=data.get('start_date')
+                )
+            if adjust_result.get("no_data"):
+                adjust_result = None
+            elif adjust_result["success"] and adjust_result["crowded"]:
+                substitute_result = run_llm_task(
+                    aigc_service.substitute_crowded_items,
+                    PRIORITY_ADJUST,
+                    plan=adjust_result["data"],
+                    city=city,
+                    crowded=adjust_result["crowded"]
+                )
+                if substitute_result["success"]:
+                    adjust_result["data"] = substitute_result["data"]
+                    adjust_result["substituted"] = substitute_result["substituted"]
+                else:
+                    # 替代景点推荐失败时保留本地错峰结果
+                    print(f"替代景点推荐失败: {substitute_result['error']}")
+                    adjust_result["substituted"] = 0
+        
+        if adjust_result is None:
+            adjust_result = run_llm_task(
+                aigc_service.adjust_plan_by_weather,
+                PRIORITY_ADJUST,
+                original_plan=original_plan,
+                city=city,
+                adjust_type=data['adjust_type']
+            )
         
         if not adjust_result["success"]:
             return jsonify({
                 "success": False,
                 "error": adjust_result["error"]
-            }), 500
+            }), 503 if adjust_result.get("throttled") else 500
         
         # 存储调整后的方案
-        adjusted_content = json.dumps(adjust_result["data"], ensure_ascii=False)
-        new_plan_id = db.insert_travel_plan(plan_data[1], adjusted_content)  # demand_id
+        with stage('json'):
+            adjusted_content = dumps_plan(adjust_result["data"]).decode('utf-8')
+        new_plan_id = db.insert_travel_plan(plan_data['demand_id'], adjusted_content)
+        
+        response_data = {
+            "original_plan_id": data['plan_id'],
+            "new_plan_id": new_plan_id,
+            "adjust_type": data['adjust_type'],
+            "adjusted_plan": project_plan(adjust_result["data"], fields, selected_days)
+        }
+        for key in ("saved_minutes", "moved", "crowded", "substituted"):
+            if key in adjust_result:
+                response_data[key] = adjust_result[key]
         
         return jsonify({
             "success": True,
             "message": f"方案{data['adjust_type']}调整成功",
+            "data": response_data
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}"
+        }), 500
+
+@app.route('/api/plan/<int:plan_id>', methods=['GET'])
+def get_plan(plan_id):
+    """接口4：方案查询（支持fields/days裁剪与ETag条件请求）"""
+    try:
+        try:
+            fields, selected_days = get_projection()
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        # 方案写入后不再修改，ETag匹配时只需确认方案仍然存在（可能已被归档保留策略删除），无需读取方案内容
+        etag = plan_etag(plan_id, fields, selected_days)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            if db.travel_plan_exists(plan_id):
+                return '', 304, cache_headers
+            plan_data = None
+        else:
+            plan_data = db.get_parsed_travel_plan(plan_id)
+        if not plan_data:
+            return jsonify({
+                "success": False,
+                "error": "找不到指定的旅游方案"
+            }), 404
+        
+        return jsonify({
+            "success": True,
             "data": {
-                "original_plan_id": data['plan_id'],
-                "new_plan_id": new_plan_id,
-                "adjust_type": data['adjust_type'],
-                "adjusted_plan": adjust_result["data"]
+                "plan_id": plan_id,
+                "demand_id": plan_data['demand_id'],
+                "create_time": str(plan_data.get('create_time') or ''),
+                "plan": project_plan(plan_data['plan'], fields, selected_days)
             }
-        }), 200
+        }), 200, cache_headers
         
     except Exception as e:
         return jsonify({
@@ -251,6 +614,224 @@ def adjust_plan():
             "error": f"服务器内部错误: {str(e)}"
         }), 500
 
+@app.route('/api/admin/bulk_generate', methods=['POST'])
+def bulk_generate():
+    """管理接口：批量预热生成方案（后台执行，相同需求列表重复提交时从检查点继续）"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    demands = data.get('demands')
+    if not isinstance(demands, list) or not demands:
+        return jsonify({
+            "success": False,
+            "error": "demands必须是非空的需求列表"
+        }), 400
+    
+    try:
+        concurrency = int(data.get('concurrency', os.getenv('BULK_CONCURRENCY', 4)))
+    except (TypeError, ValueError):
+        return jsonify({
+            "success": False,
+            "error": "concurrency必须是整数"
+        }), 400
+    if not 1 <= concurrency <= BULK_MAX_CONCURRENCY:
+        return jsonify({
+            "success": False,
+            "error": f"concurrency必须在1到{BULK_MAX_CONCURRENCY}之间"
+        }), 400
+    
+    for index, demand in enumerate(demands):
+        missing_fields = validate_required_fields(demand, REQUIRED_FIELDS) if isinstance(demand, dict) else REQUIRED_FIELDS
+        if missing_fields:
+            return jsonify({
+                "success": False,
+                "error": f"第{index + 1}条需求缺少必需参数: {', '.join(missing_fields)}"
+            }), 400
+    
+    job_id = request_key(demands=demands)[:16]
+    job = bulk_jobs.get(job_id)
+    if job and not job.progress()["finished"]:
+        return jsonify({
+            "success": True,
+            "message": "批量生成任务正在运行",
+            "data": {"job_id": job_id, "progress": job.progress()}
+        }), 200
+    
+    # 需求列表落盘，检查点与之放在一起，便于中断后继续
+    os.makedirs(BULK_JOB_DIR, exist_ok=True)
+    input_path = os.path.join(BULK_JOB_DIR, f"{job_id}.jsonl")
+    with open(input_path, 'w', encoding='utf-8') as f:
+        for demand in demands:
+            f.write(json.dumps({field: demand[field] for field in REQUIRED_FIELDS}, ensure_ascii=False) + "\n")
+    demand_items, invalid = load_demands(input_path)
+    if invalid:
+        return jsonify({
+            "success": False,
+            "error": f"days必须是整数，budget必须是数字（第{', '.join(map(str, invalid))}条）"
+        }), 400
+    
+    def generate(**demand):
+        return llm_scheduler.run(
+            aigc_service.generate_travel_plan,
+            priority=PRIORITY_BATCH,
+            client_id='bulk',
+            **demand
+        )
+    
+    job = BulkGenerator(db, plan_cache, generate, concurrency=concurrency)
+    bulk_jobs[job_id] = job
+    threading.Thread(
+        target=job.run,
+        args=(demand_items, f"{input_path}.checkpoint"),
+        daemon=True
+    ).start()
+    
+    return jsonify({
+        "success": True,
+        "message": "批量生成任务已启动",
+        "data": {"job_id": job_id, "total": len(demand_items)}
+    }), 202
+
+@app.route('/api/admin/bulk_generate/<job_id>', methods=['GET'])
+def bulk_generate_progress(job_id):
+    """管理接口：查询批量生成任务进度"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    job = bulk_jobs.get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "找不到指定的批量生成任务"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "data": {"job_id": job_id, "progress": job.progress()}
+    }), 200
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def admin_metrics():
+    """管理接口：缓存命中率、LLM调度与token用量等运行指标"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "hot_plan_cache": db.plan_cache.stats(),
+            "plan_cache": plan_cache.stats(),
+            "demand_index": db.demand_index.stats() if db.demand_index else None,
+            "llm_cache": aigc_service.llm_cache.stats(),
+            "llm_scheduler": llm_scheduler.stats(),
+            "token_usage": aigc_service.token_limiter.stats(),
+            "models": aigc_service.model_router.stats(),
+            "rate_limits": rate_limiter.stats(),
+            "replicas": db.replica_status(),
+            "plan_archive": db.archive.stats(),
+            "shared_cache": aigc_service.shared_cache.stats() if aigc_service.shared_cache else None,
+            "traffic_capture": traffic_recorder.stats() if traffic_recorder else None,
+            "upstream_replay": aigc_service.upstream_replay.stats() if aigc_service.upstream_replay else None,
+            "request_profiler": request_profiler.stats()
+        }
+    }), 200
+
+@app.route('/api/admin/archive', methods=['POST'])
+def run_plan_archive():
+    """管理接口：立即执行一次方案归档（可用max_batches限制本次处理的批数）"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        max_batches = int(data['max_batches']) if data.get('max_batches') else None
+    except (TypeError, ValueError):
+        return jsonify({
+            "success": False,
+            "error": "max_batches必须是整数"
+        }), 400
+    
+    try:
+        result = db.archive.run(max_batches=max_batches)
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"方案归档失败: {str(e)}"
+        }), 500
+    if result is None:
+        return jsonify({
+            "success": False,
+            "error": "归档不可用或正在运行"
+        }), 409
+    
+    return jsonify({
+        "success": True,
+        "data": result
+    }), 200
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """管理接口：进行中的请求与最近的慢请求/剖析记录（slow=1时只返回慢请求）"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "limit必须是整数"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "stats": request_profiler.stats(),
+            "in_flight": request_profiler.in_flight(),
+            "recent": request_profiler.recent(limit, slow_only=request.args.get('slow') == '1')
+        }
+    }), 200
+
+@app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """管理接口：单个请求的剖析结果（阶段耗时、最常出现的调用栈、cProfile函数耗时）"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    entry = request_profiler.get(profile_id)
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "error": "找不到指定的剖析记录"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "data": entry
+    }), 200
+
+@app.route('/api/admin/profiles/stacks', methods=['GET'])
+def thread_stack_snapshot():
+    """管理接口：当前全部线程的调用栈，及定期快照中各线程最常出现的调用栈"""
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "current": request_profiler.snapshot(),
+            "history": request_profiler.snapshot_history()
+        }
+    }), 200
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+方案模型微基准测试
+对比嵌套字典 + json 与 TravelPlan（__slots__ + orjson）的单个方案内存占用和序列化/反序列化耗时
+
+用法：
+    python bench_plan_model.py [天数] [每日行程项数] [循环次数]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from plan_model import TravelPlan, dumps_plan, orjson
+
+
+def sample_plan(days=5, items_per_day=4):
+    """构造与qwen输出结构一致的示例方案"""
+    return {
+        "title": f"北京{days}日美食文化之旅",
+        "total_days": days,
+        "total_budget": 1500 * days,
+        "daily_plans": [
+            {
+                "day": d + 1,
+                "date": f"第{d + 1}天",
+                "schedule": [
+                    {
+                        "time": f"{9 + i * 2:02d}:00-{10 + i * 2:02d}:30",
+                        "attraction": f"故宫博物院第{i + 1}站",
+                        "transportation": "地铁1号线转2号线，步行约10分钟",
+                        "dining": "王府井小吃街（推荐炸酱面、豆汁）",
+                        "budget": 120 + i * 10
+                    }
+                    for i in range(items_per_day)
+                ],
+                "daily_total": sum(120 + i * 10 for i in range(items_per_day))
+            }
+            for d in range(days)
+        ],
+        "tips": ["携带学生证可享受门票优惠", "建议提前预约热门景点", "注意防晒补水"],
+        "special_notes": "学生证优惠相关注意事项：大部分景点对学生有半价优惠"
+    }
+
+
+def measure_memory(factory, count=200):
+    """平均每个对象占用的内存字节数"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    return total / count
+
+
+def measure_time(fn, loops):
+    """平均每次调用耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return (time.perf_counter() - start) / loops * 1e6
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    items_per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    loops = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    plan = sample_plan(days, items_per_day)
+    content = json.dumps(plan, ensure_ascii=False)
+    content_bytes = content.encode('utf-8')
+    model = TravelPlan.from_dict(plan)
+
+    print(f"示例方案: {days}天 × {items_per_day}项/天，JSON {len(content_bytes)} 字节，orjson: {'已安装' if orjson else '未安装'}")
+    print("=" * 60)
+
+    dict_memory = measure_memory(lambda: json.loads(content))
+    model_memory = measure_memory(lambda: TravelPlan.loads(content_bytes))
+    print(f"内存/方案   嵌套字典: {dict_memory:10.0f} B   TravelPlan: {model_memory:10.0f} B   "
+          f"({model_memory / dict_memory:.0%})")
+
+    results = [
+        ("序列化", lambda: json.dumps(plan, ensure_ascii=False), model.dumps),
+        ("反序列化", lambda: json.loads(content), lambda: TravelPlan.loads(content_bytes)),
+        ("字典序列化", lambda: json.dumps(plan, ensure_ascii=False), lambda: dumps_plan(plan)),
+    ]
+    for name, baseline, candidate in results:
+        baseline_us = measure_time(baseline, loops)
+        candidate_us = measure_time(candidate, loops)
+        print(f"{name:<8} json: {baseline_us:8.1f} µs   模型路径: {candidate_us:8.1f} µs   "
+              f"({baseline_us / candidate_us:.1f}x)")
+
+    prompt_json = json.dumps(plan, ensure_ascii=False)
+    prompt_compact = model.to_prompt()
+    print(f"提示词长度  JSON: {len(prompt_json)} 字符   紧凑格式: {len(prompt_compact)} 字符 "
+          f"({len(prompt_compact) / len(prompt_json):.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+方案输出格式基准测试
+对比完整JSON与紧凑格式（plan_compact）的输出token数；指定在线轮数且配置了DASHSCOPE_API_KEY时，
+用两种提示词实际调用模型，统计输出token（以接口返回的usage为准）与端到端生成耗时
+
+用法：
+    python bench_plan_output.py [天数] [每日行程项数] [在线轮数，默认0只做离线估算]
+"""
+
+import json
+import os
+import sys
+import time
+from bench_plan_model import sample_plan
+from plan_compact import compact_plan, expand_plan
+from token_budget import estimate_tokens, size_plan_max_tokens
+
+DEMAND = {"scene": "大学生独自游", "interest": "美食", "demand": "学生证优惠"}
+
+
+def offline(days, items_per_day):
+    """同一方案两种输出格式的token估算"""
+    plan = sample_plan(days, items_per_day)
+    # 模型按提示词中的示例缩进输出完整JSON
+    full = json.dumps(plan, ensure_ascii=False, indent=4)
+    compact = json.dumps(compact_plan(plan), ensure_ascii=False, separators=(',', ':'))
+    full_tokens = estimate_tokens(full)
+    compact_tokens = estimate_tokens(compact)
+    print(f"示例方案: {days}天 × {items_per_day}项/天")
+    print("=" * 60)
+    print(f"输出字符   完整JSON: {len(full):6d}   紧凑格式: {len(compact):6d}   ({len(compact) / len(full):.0%})")
+    print(f"估算token  完整JSON: {full_tokens:6d}   紧凑格式: {compact_tokens:6d}   ({compact_tokens / full_tokens:.0%})")
+    print(f"max_tokens 完整JSON: {size_plan_max_tokens(days, items_per_day):6d}   "
+          f"紧凑格式: {size_plan_max_tokens(days, items_per_day, compact=True):6d}")
+
+    loops = 2000
+    start = time.perf_counter()
+    for _ in range(loops):
+        expand_plan(json.loads(compact), 1500 * days)
+    print(f"本地展开耗时: {(time.perf_counter() - start) / loops * 1e6:.1f} µs/方案")
+
+
+def online(days, items_per_day, rounds):
+    """两种提示词分别实际调用模型（不经过响应缓存）"""
+    import dashscope
+    from services import AIGCService
+
+    service = AIGCService()
+    budget = 1500 * days
+    model = service.model_router.full_model
+    print(f"\n在线测试: 模型 {model}，每种格式 {rounds} 轮")
+    print("=" * 60)
+    for name, compact in (("完整JSON", False), ("紧凑格式", True)):
+        prompt = service.build_plan_prompt(DEMAND["scene"], days, budget, DEMAND["interest"], DEMAND["demand"],
+                                           compact=compact)
+        output_tokens = []
+        elapsed = []
+        valid = 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = dashscope.Generation.call(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的旅游规划师，擅长制定详细的旅游计划。"},
+                    {"role": "user", "content": prompt}
+                ],
+                result_format='message',
+                max_tokens=size_plan_max_tokens(days, items_per_day, compact=compact),
+                temperature=0.7
+            )
+            elapsed.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                print(f"{name} 调用失败: {response.message}")
+                continue
+            output_tokens.append(response.usage.output_tokens)
+            try:
+                plan = expand_plan(json.loads(response.output.choices[0].message.content), budget)
+                valid += isinstance(plan, dict) and len(plan.get('daily_plans') or []) == days
+            except ValueError:
+                pass
+        if output_tokens:
+            print(f"{name}: 平均输出 {sum(output_tokens) / len(output_tokens):7.1f} token   "
+                  f"平均耗时 {sum(elapsed) / len(elapsed):6.2f} s   结构完整 {valid}/{rounds}")
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    items_per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    offline(days, items_per_day)
+    if rounds:
+        if not os.getenv('DASHSCOPE_API_KEY'):
+            print("\n未配置DASHSCOPE_API_KEY，跳过在线测试")
+            return
+        online(days, items_per_day, rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旅游方案预算校验与再平衡模块
+将方案中的行程项展开为数组，批量校验每日小计与总预算，并按比例缩放或裁剪超支项目
+"""
+
+import json
+import re
+import sys
+import numpy as np
+
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def to_number(value):
+    """将预算字段转换为数字（兼容"200元"之类的文本）"""
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_PATTERN.search(value.replace(',', ''))
+        if match:
+            return float(match.group())
+    return 0.0
+
+
+def _daily_plans(plan):
+    """获取方案中的每日行程列表"""
+    if not isinstance(plan, dict):
+        return []
+    daily_plans = plan.get('daily_plans')
+    return daily_plans if isinstance(daily_plans, list) else []
+
+
+def _schedule(day):
+    """获取单日行程项列表"""
+    if not isinstance(day, dict):
+        return []
+    schedule = day.get('schedule')
+    return schedule if isinstance(schedule, list) else []
+
+
+def plan_to_arrays(plan):
+    """将方案展开为数组：(行程项所属天序号, 行程项预算, 每日声明小计)"""
+    day_index = []
+    amounts = []
+    stated_totals = []
+    for d, day in enumerate(_daily_plans(plan)):
+        for item in _schedule(day):
+            day_index.append(d)
+            amounts.append(to_number(item.get('budget') if isinstance(item, dict) else None))
+        stated_totals.append(to_number(day.get('daily_total') if isinstance(day, dict) else None))
+    return (
+        np.asarray(day_index, dtype=np.intp),
+        np.asarray(amounts, dtype=np.float64),
+        np.asarray(stated_totals, dtype=np.float64)
+    )
+
+
+def validate_plan_budget(plan, budget, tolerance=0.5):
+    """校验单个方案的每日小计与总预算"""
+    day_index, amounts, stated_totals = plan_to_arrays(plan)
+    daily_sums = np.bincount(day_index, weights=amounts, minlength=len(stated_totals))
+    mismatch = np.flatnonzero(np.abs(daily_sums - stated_totals) > tolerance)
+    total = float(amounts.sum())
+    budget = float(budget)
+
+    return {
+        "valid": bool(total <= budget + tolerance and mismatch.size == 0),
+        "total": total,
+        "budget": budget,
+        "over_budget": max(total - budget, 0.0),
+        "daily_totals": daily_sums.tolist(),
+        "daily_mismatch": (mismatch + 1).tolist()  # 以第几天表示
+    }
+
+
+def _scale_amounts(amounts, budget):
+    """按比例缩放全部项目，取整后保证总额不超过预算"""
+    total = amounts.sum()
+    if total <= budget or total <= 0:
+        return amounts
+    return np.floor(amounts * (budget / total))
+
+
+def _trim_amounts(amounts, day_index, budget):
+    """从最贵的项目开始裁剪（每天至少保留一项），直到总额不超过预算"""
+    keep = np.ones(amounts.size, dtype=bool)
+    excess = amounts.sum() - budget
+    if excess <= 0:
+        return keep
+
+    # 每天最便宜的一项不参与裁剪，保证每天仍有行程
+    order = np.lexsort((amounts, day_index))
+    first_of_day = np.ones(order.size, dtype=bool)
+    first_of_day[1:] = day_index[order][1:] != day_index[order][:-1]
+    protected = order[first_of_day]
+
+    candidates = np.setdiff1d(np.arange(amounts.size), protected)
+    candidates = candidates[np.argsort(-amounts[candidates], kind='stable')]
+    removed = np.cumsum(amounts[candidates])
+    count = int(np.searchsorted(removed, excess, side='left')) + 1
+    keep[candidates[:count]] = False
+    return keep
+
+
+def rebalance_plan_budget(plan, budget, mode='scale'):
+    """再平衡方案预算：重新计算每日小计，超支时按比例缩放(scale)或裁剪(trim)项目"""
+    daily_plans = _daily_plans(plan)
+    if not daily_plans:
+        return plan
+
+    day_index, amounts, _ = plan_to_arrays(plan)
+    keep = np.ones(amounts.size, dtype=bool)
+    if mode == 'trim':
+        keep = _trim_amounts(amounts, day_index, float(budget))
+        amounts = np.where(keep, amounts, 0.0)
+    amounts = _scale_amounts(amounts, float(budget))
+    daily_sums = np.bincount(day_index, weights=amounts, minlength=len(daily_plans))
+
+    # 只复制被修改的层级，避免深拷贝整个方案
+    new_days = []
+    position = 0
+    for d, day in enumerate(daily_plans):
+        if not isinstance(day, dict):
+            new_days.append(day)
+            continue
+        new_schedule = []
+        for item in _schedule(day):
+            if keep[position]:
+                if isinstance(item, dict):
+                    item = dict(item)
+                    item['budget'] = _as_plain_number(amounts[position])
+                new_schedule.append(item)
+            position += 1
+        new_day = dict(day)
+        if 'schedule' in day:
+            new_day['schedule'] = new_schedule
+        new_day['daily_total'] = _as_plain_number(daily_sums[d])
+        new_days.append(new_day)
+
+    new_plan = dict(plan)
+    new_plan['daily_plans'] = new_days
+    return new_plan
+
+
+def _as_plain_number(value):
+    """numpy数值转换为可JSON序列化的int/float"""
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def validate_plans_bulk(plans, budgets, tolerance=0.5):
+    """批量校验多个方案，返回每个方案的总额、超支金额与小计不一致天数"""
+    plan_count = len(plans)
+    budgets = np.asarray(budgets, dtype=np.float64)
+
+    plan_index = []
+    global_day = []
+    amounts = []
+    stated_totals = []
+    for p, plan in enumerate(plans):
+        for day in _daily_plans(plan):
+            day_id = len(stated_totals)
+            stated_totals.append(to_number(day.get('daily_total') if isinstance(day, dict) else None))
+            for item in _schedule(day):
+                plan_index.append(p)
+                global_day.append(day_id)
+                amounts.append(to_number(item.get('budget') if isinstance(item, dict) else None))
+    day_owner = np.empty(len(stated_totals), dtype=np.intp)
+    position = 0
+    for p, plan in enumerate(plans):
+        count = len(_daily_plans(plan))
+        day_owner[position:position + count] = p
+        position += count
+
+    amounts = np.asarray(amounts, dtype=np.float64)
+    totals = np.bincount(np.asarray(plan_index, dtype=np.intp), weights=amounts, minlength=plan_count)
+    daily_sums = np.bincount(np.asarray(global_day, dtype=np.intp), weights=amounts, minlength=len(stated_totals))
+    day_mismatch = np.abs(daily_sums - np.asarray(stated_totals, dtype=np.float64)) > tolerance
+    mismatch_counts = np.bincount(day_owner[day_mismatch], minlength=plan_count)
+    over_budget = np.maximum(totals - budgets, 0.0)
+
+    return {
+        "totals": totals,
+        "over_budget": over_budget,
+        "daily_mismatch_counts": mismatch_counts,
+        "valid": (over_budget <= tolerance) & (mismatch_counts == 0)
+    }
+
+
+def main():
+    """批量校验数据库中已存储的方案"""
+    from database import Database
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    db = Database()
+
+    checked = invalid = over = mismatch = 0
+    for rows in db.iter_travel_plans_with_budget(batch_size=batch_size):
+        plans, budgets = [], []
+        for row in rows:
+            try:
+                plans.append(json.loads(row['plan_content']))
+            except (TypeError, ValueError):
+                plans.append({})
+            budgets.append(float(row['budget']))
+        report = validate_plans_bulk(plans, budgets)
+        checked += len(plans)
+        invalid += int((~report['valid']).sum())
+        over += int((report['over_budget'] > 0).sum())
+        mismatch += int((report['daily_mismatch_counts'] > 0).sum())
+
+    print(f"已校验方案: {checked}")
+    print(f"不合格方案: {invalid}")
+    print(f"  超出预算: {over}")
+    print(f"  每日小计不一致: {mismatch}")
+
+
+if __name__ == '__main__':
+    main()
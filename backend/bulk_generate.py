@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量方案生成模块（热门需求预热）
+读取JSONL需求文件，以有限并发生成方案，批量写入数据库并填充方案缓存；
+每批写入后记录检查点，中断或失败后重新运行会跳过已完成的需求
+
+用法：
+    python bulk_generate.py demands.jsonl [并发数] [每批写入条数]
+
+需求文件每行一个JSON：{"scene": "...", "days": 3, "budget": 1500, "interest": "...", "demand": "..."}
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from plan_model import dumps_plan
+
+REQUIRED_FIELDS = ('scene', 'days', 'budget', 'interest', 'demand')
+
+
+def load_demands(path):
+    """读取需求文件，返回 [(行号, 需求), ...]，格式错误的行记为无效"""
+    demands = []
+    invalid = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                demand = {field: data[field] for field in REQUIRED_FIELDS}
+                demand['days'] = int(demand['days'])
+                demand['budget'] = float(demand['budget'])
+                demands.append((line_no, demand))
+            except (ValueError, KeyError, TypeError):
+                invalid.append(line_no)
+    return demands, invalid
+
+
+def load_checkpoint(path):
+    """读取检查点中已完成的行号"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.add(int(line))
+    return done
+
+
+class BulkGenerator:
+    """批量生成任务：有限并发调用生成函数，结果按批次写库、填充缓存并记录检查点"""
+
+    def __init__(self, db, plan_cache, generate, concurrency=4, batch_size=20, report_interval=10.0):
+        self.db = db
+        self.plan_cache = plan_cache
+        self.generate = generate  # generate(**demand) -> {"success", "data"/"error"}
+        self.concurrency = max(int(concurrency), 1)
+        self.batch_size = max(int(batch_size), 1)
+        self.report_interval = report_interval
+
+        self.total = 0
+        self.skipped = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+        self.errors = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._checkpoint_file = None
+
+    def progress(self):
+        """进度与吞吐量报告"""
+        with self._lock:
+            done = self.succeeded + self.failed
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            throughput = done / elapsed * 60 if elapsed > 0 else 0.0
+            remaining = self.total - self.skipped - done
+            return {
+                "total": self.total,
+                "skipped": self.skipped,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "remaining": remaining,
+                "elapsed_seconds": round(elapsed, 1),
+                "plans_per_minute": round(throughput, 2),
+                "eta_seconds": round(remaining / throughput * 60, 1) if throughput > 0 else None,
+                "finished": self.finished_at is not None,
+                "recent_errors": self.errors[-10:]
+            }
+
+    def run(self, demands, checkpoint_path, progress_callback=None):
+        """执行批量生成；demands为 [(行号, 需求), ...]"""
+        done = load_checkpoint(checkpoint_path)
+        todo = [(line_no, demand) for line_no, demand in demands if line_no not in done]
+        self.total = len(demands)
+        self.skipped = len(demands) - len(todo)
+        self.started_at = time.time()
+
+        stop_reporting = threading.Event()
+        reporter = None
+        if progress_callback is not None:
+            def report_loop():
+                while not stop_reporting.wait(self.report_interval):
+                    progress_callback(self.progress())
+            reporter = threading.Thread(target=report_loop, daemon=True)
+            reporter.start()
+
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint_file:
+            self._checkpoint_file = checkpoint_file
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for line_no, demand in todo:
+                    executor.submit(self._generate_one, line_no, demand)
+            self._flush()
+            self._checkpoint_file = None
+
+        self.finished_at = time.time()
+        stop_reporting.set()
+        if progress_callback is not None:
+            progress_callback(self.progress())
+        return self.progress()
+
+    def _generate_one(self, line_no, demand):
+        """生成单个需求的方案，结果暂存待批量写入"""
+        try:
+            result = self.generate(**demand)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if not result.get("success") or "raw_content" in result.get("data", {}):
+            with self._lock:
+                self.failed += 1
+                self.errors.append({"line": line_no, "error": result.get("error", "方案不是有效JSON")})
+            return
+
+        with self._lock:
+            self._pending.append((line_no, demand, result["data"]))
+            should_flush = len(self._pending) >= self.batch_size
+        if should_flush:
+            self._flush()
+
+    def _flush(self):
+        """批量写库、填充方案缓存并记录检查点"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            items = [
+                dict(demand, plan_content=dumps_plan(plan).decode('utf-8'))
+                for _, demand, plan in batch
+            ]
+            try:
+                ids = self.db.insert_demand_plans_bulk(items)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                    self.errors.extend({"line": line_no, "error": f"写入数据库失败: {e}"} for line_no, _, _ in batch)
+                return
+
+            for (line_no, demand, plan), (demand_id, plan_id) in zip(batch, ids):
+                if self.plan_cache is not None:
+                    self.plan_cache.put(plan_id=plan_id, demand_id=demand_id, plan=plan, **demand)
+                self._checkpoint_file.write(f"{line_no}\n")
+            self._checkpoint_file.flush()
+            os.fsync(self._checkpoint_file.fileno())
+
+            with self._lock:
+                self.succeeded += len(batch)
+
+
+def print_progress(progress):
+    """命令行进度输出"""
+    print(
+        f"进度: 成功 {progress['succeeded']} / 失败 {progress['failed']} / 跳过 {progress['skipped']} / "
+        f"剩余 {progress['remaining']}，吞吐 {progress['plans_per_minute']} 个/分钟，"
+        f"预计剩余 {progress['eta_seconds']} 秒"
+    )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python bulk_generate.py demands.jsonl [并发数] [每批写入条数]")
+        sys.exit(1)
+
+    from database import Database
+    from services import AIGCService
+    from plan_cache import PlanCache
+
+    input_path = sys.argv[1]
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else int(os.getenv('BULK_CONCURRENCY', 4))
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    demands, invalid = load_demands(input_path)
+    if invalid:
+        print(f"忽略格式错误的行: {invalid}")
+
+    service = AIGCService()
+    generator = BulkGenerator(Database(), PlanCache(), service.generate_travel_plan,
+                              concurrency=concurrency, batch_size=batch_size)
+    progress = generator.run(demands, f"{input_path}.checkpoint", progress_callback=print_progress)
+
+    print("=" * 50)
+    print(f"批量生成完成，耗时 {progress['elapsed_seconds']} 秒")
+    print(f"成功: {progress['succeeded']}，失败: {progress['failed']}，跳过（已完成）: {progress['skipped']}")
+    if progress['failed']:
+        print("失败的需求未写入检查点，重新运行相同命令即可重试")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+景点人流量数据与错峰调整模块
+人流量数据源可插拔，提供各景点按小时的热度曲线（0-100），按城市与星期几预处理并缓存；
+错峰算法在本地把每日景点调换到人少的时间段，只有调换后仍处于高峰的景点才需要LLM推荐替代景点
+
+本地数据文件格式（JSON，按城市存放于 CROWD_DATA_DIR/<城市>.json，曲线为0-23点共24个值）：
+{
+    "attractions": {
+        "故宫博物院": {
+            "weekday": [0, 0, ..., 35, 60, 85, ...],
+            "weekend": [...],
+            "5": [...],
+            "open": "08:30",
+            "close": "16:00"
+        }
+    }
+}
+曲线按 星期几（"0"为周一）> weekend/weekday > default 的顺序选取
+"""
+
+import abc
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+import numpy as np
+from route_optimizer import PlaceIndex, city_data_path, parse_minutes, slot_start
+
+# 不在开放时间内的惩罚热度，远大于任何实际热度
+CLOSED_PENALTY = 1000
+# 景点数不超过该值时穷举全部排列，否则使用两两交换的局部搜索
+EXHAUSTIVE_LIMIT = 7
+
+
+def slot_end(time_range, default_minutes=60):
+    """获取"09:00-11:00"格式时间段的结束分钟数，缺少结束时间时按开始时间加默认时长"""
+    start = slot_start(time_range)
+    if start is None:
+        return None
+    parts = str(time_range).replace('～', '-').replace('~', '-').split('-')
+    end = parse_minutes(parts[1]) if len(parts) > 1 else None
+    return end if end is not None and end > start else start + default_minutes
+
+
+class CrowdProfiles(PlaceIndex):
+    """某城市某个星期几的景点热度曲线"""
+
+    def __init__(self, curves, windows=None):
+        super().__init__(curves.keys(), windows)
+        self.curves = np.asarray([curves[name] for name in self.places], dtype=np.float64).reshape(-1, 24)
+
+    def level(self, place, start, end):
+        """时间段内的平均热度（按与各小时重叠的分钟数加权），不在开放时间内时加惩罚"""
+        start = max(start, 0)
+        end = min(max(end, start + 1), 24 * 60)
+        total = 0.0
+        minute = start
+        while minute < end:
+            hour = minute // 60
+            step = min(end, (hour + 1) * 60) - minute
+            total += self.curves[place, min(hour, 23)] * step
+            minute += step
+        level = total / (end - start)
+        if self.outside_window(place, start):
+            level += CLOSED_PENALTY
+        return level
+
+
+class CrowdProvider(abc.ABC):
+    """人流量数据源基类：子类实现 fetch(city, weekday)，结果按城市与星期几缓存"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('CROWD_CACHE_TTL', 3600))
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def fetch(self, city, weekday):
+        """返回 {景点: {"curve": [24个热度值], "open": "08:30", "close": "16:00"}}，没有数据时返回None"""
+
+    def version(self, city):
+        """数据版本（变化时缓存失效），默认不做版本检查"""
+        return None
+
+    def profiles(self, city, weekday):
+        """获取预处理后的热度曲线（CrowdProfiles），没有数据时返回None"""
+        key = (city, weekday)
+        version = self.version(city)
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version and (not self.ttl or now - cached[1] < self.ttl):
+                return cached[2]
+
+        data = self.fetch(city, weekday)
+        profiles = None
+        if data:
+            profiles = CrowdProfiles(
+                {name: info['curve'] for name, info in data.items()},
+                {name: (info.get('open'), info.get('close')) for name, info in data.items()
+                 if info.get('open') and info.get('close')}
+            )
+        with self._lock:
+            self._cache[key] = (version, now, profiles)
+        return profiles
+
+
+class FileCrowdProvider(CrowdProvider):
+    """本地文件数据源（离线统计或测试用），文件修改后自动重新加载"""
+
+    def __init__(self, data_dir=None, ttl=None):
+        super().__init__(ttl)
+        self.data_dir = data_dir or os.getenv('CROWD_DATA_DIR', 'crowd_data')
+
+    def version(self, city):
+        path = city_data_path(self.data_dir, city)
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+
+    def fetch(self, city, weekday):
+        # 城市名来自请求参数，不合法（含路径分隔符、..等）时视为没有数据
+        path = city_data_path(self.data_dir, city)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        day_type = 'weekend' if weekday >= 5 else 'weekday'
+        result = {}
+        for name, info in (data.get('attractions') or {}).items():
+            curve = info.get(str(weekday)) or info.get(day_type) or info.get('default')
+            if isinstance(curve, list) and len(curve) == 24:
+                result[name] = {"curve": curve, "open": info.get('open'), "close": info.get('close')}
+        return result
+
+
+PROVIDERS = {
+    'file': FileCrowdProvider
+}
+
+
+def load_crowd_provider(name=None):
+    """按名称创建数据源：已注册的名称、"模块:类名"，或 off 关闭"""
+    name = name or os.getenv('CROWD_PROVIDER', 'file')
+    if name == 'off':
+        return None
+    if name in PROVIDERS:
+        return PROVIDERS[name]()
+    module_name, _, class_name = name.partition(':')
+    try:
+        return getattr(importlib.import_module(module_name), class_name)()
+    except (ImportError, AttributeError, TypeError, ValueError) as e:
+        print(f"人流量数据源 {name} 加载失败: {e}")
+        return None
+
+
+def _best_assignment(costs):
+    """为各景点分配时间段使总热度最低，costs[k][s]为景点k放在时间段s的热度，返回各时间段对应的景点"""
+    n = len(costs)
+    identity = list(range(n))
+
+    def total(order):
+        return sum(costs[k][s] for s, k in enumerate(order))
+
+    if n <= EXHAUSTIVE_LIMIT:
+        return list(min(itertools.permutations(identity), key=total))
+
+    order = identity
+    best = total(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                candidate = list(order)
+                candidate[i], candidate[j] = candidate[j], candidate[i]
+                cost = total(candidate)
+                if cost < best - 1e-9:
+                    order, best = candidate, cost
+                    improved = True
+    return order
+
+
+def shift_day_schedule(schedule, profiles, peak_level=80):
+    """单日错峰：时间段保持不变，把景点调换到热度更低的时间段
+
+    返回 (新行程, 调换的行程项数, 调换后仍处于高峰的 [(位置, 热度)])
+    """
+    positions = []
+    places = []
+    for position, item in enumerate(schedule):
+        if isinstance(item, dict) and slot_start(item.get('time')) is not None:
+            place = profiles.lookup(item.get('attraction'))
+            if place is not None:
+                positions.append(position)
+                places.append(place)
+    if not positions:
+        return schedule, 0, []
+
+    slots = [(slot_start(schedule[p].get('time')), slot_end(schedule[p].get('time'))) for p in positions]
+    costs = [[profiles.level(place, start, end) for start, end in slots] for place in places]
+    order = _best_assignment(costs)
+    if sum(costs[k][s] for s, k in enumerate(order)) >= sum(costs[k][k] for k in range(len(places))) - 1e-9:
+        order = list(range(len(places)))
+
+    new_schedule = list(schedule)
+    moved = 0
+    crowded = []
+    for s, k in enumerate(order):
+        slot = positions[s]
+        if k != s:
+            item = dict(schedule[positions[k]])
+            item['time'] = schedule[slot].get('time')
+            new_schedule[slot] = item
+            moved += 1
+        if costs[k][s] >= peak_level:
+            crowded.append((slot, round(min(costs[k][s], 100), 1)))
+    return new_schedule, moved, crowded
+
+
+def shift_plan_crowds(plan, profiles_for_day, peak_level=80):
+    """对方案每天的行程错峰，profiles_for_day(第几天) 返回当天的 CrowdProfiles
+
+    返回 (新方案, 调换的行程项数, 仍处于高峰的行程项列表)
+    """
+    daily_plans = plan.get('daily_plans') if isinstance(plan, dict) else None
+    if not isinstance(daily_plans, list):
+        return plan, 0, []
+
+    moved_total = 0
+    crowded_items = []
+    new_days = []
+    for i, day in enumerate(daily_plans):
+        schedule = day.get('schedule') if isinstance(day, dict) else None
+        profiles = profiles_for_day(i)
+        if not isinstance(schedule, list) or profiles is None:
+            new_days.append(day)
+            continue
+        new_schedule, moved, crowded = shift_day_schedule(schedule, profiles, peak_level)
+        if moved:
+            day = dict(day)
+            day['schedule'] = new_schedule
+            moved_total += moved
+        for position, level in crowded:
+            crowded_items.append({
+                "day": i + 1,
+                "index": position,
+                "time": new_schedule[position].get('time'),
+                "attraction": new_schedule[position].get('attraction'),
+                "level": level
+            })
+        new_days.append(day)
+
+    new_plan = dict(plan)
+    new_plan['daily_plans'] = new_days
+    return new_plan, moved_total, crowded_items
+
+
+def apply_replacements(plan, replacements):
+    """用LLM推荐的替代景点替换高峰行程项（按天数与位置匹配），返回 (新方案, 替换数)"""
+    daily_plans = [dict(day) if isinstance(day, dict) else day for day in plan.get('daily_plans') or []]
+    replaced = 0
+    for replacement in replacements or []:
+        if not isinstance(replacement, dict):
+            continue
+        try:
+            day_index = int(replacement.get('day')) - 1
+            position = int(replacement.get('index'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= day_index < len(daily_plans) or not isinstance(daily_plans[day_index], dict):
+            continue
+        schedule = list(daily_plans[day_index].get('schedule') or [])
+        if not 0 <= position < len(schedule) or not replacement.get('attraction'):
+            continue
+
+        item = dict(schedule[position])
+        for field in ('attraction', 'transportation', 'dining', 'budget'):
+            if replacement.get(field) not in (None, ''):
+                item[field] = replacement[field]
+        schedule[position] = item
+        daily_plans[day_index]['schedule'] = schedule
+        replaced += 1
+
+    new_plan = dict(plan)
+    new_plan['daily_plans'] = daily_plans
+    return new_plan, replaced
@@ -1,33 +1,87 @@
 import pymysql
 import sqlite3
 import os
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
+from hot_plan_cache import HotPlanCache
+from shared_cache import get_shared_cache
+from demand_index import DemandIndex
+from plan_archive import PlanArchive
+from request_profiler import profiled
 
 # 加载环境变量
 load_dotenv()
 
+# 允许批量导入导出的表（按外键依赖顺序）
+EXPORT_TABLES = ('user_demand', 'travel_plan')
+
+class Replica:
+    """只读副本：MySQL为 host:port，SQLite为文件路径"""
+    def __init__(self, address):
+        self.address = address
+        self.lag = 0.0
+        self.last_check = 0.0
+        self.down_until = 0.0
+        self.lock = threading.Lock()  # 保护延迟与暂停状态（多个请求线程并发选择副本）
+
 class Database:
-    def __init__(self):
+    def __init__(self, backend=None, sqlite_path=None, replicas=None):
+        """backend: 'mysql'、'sqlite'，默认（或DB_BACKEND=auto）优先MySQL，失败时切换到SQLite
+        replicas: 只读副本列表（MySQL为 host:port，SQLite为文件路径），默认读取环境变量
+        """
         self.host = os.getenv('MYSQL_HOST', 'localhost')
         self.port = int(os.getenv('MYSQL_PORT', 3306))
         self.user = os.getenv('MYSQL_USER', 'admin')
         self.password = os.getenv('MYSQL_PASSWORD', 'password')
         self.database = os.getenv('MYSQL_DATABASE', 'example_db')
         self.charset = 'utf8mb4'
-        self.use_sqlite = False
+        self.sqlite_path = sqlite_path or os.getenv('SQLITE_PATH', 'travel_planning.db')
+        backend = backend or os.getenv('DB_BACKEND', 'auto')
+        self.use_sqlite = backend == 'sqlite'
         
-        try:
-            self.init_database()
-        except pymysql.Error as e:
-            print(f"MySQL数据库初始化失败: {e}，将切换到SQLite数据库")
-            self.use_sqlite = True
+        if self.use_sqlite:
             self.init_sqlite_database()
+        else:
+            try:
+                self.init_database()
+            except pymysql.Error as e:
+                if backend == 'mysql':
+                    raise
+                print(f"MySQL数据库初始化失败: {e}，将切换到SQLite数据库")
+                self.use_sqlite = True
+                self.init_sqlite_database()
+        
+        # 读写分离：读方法优先路由到只读副本
+        if replicas is None:
+            replica_env = 'SQLITE_REPLICA_PATHS' if self.use_sqlite else 'MYSQL_REPLICA_HOSTS'
+            replicas = [item.strip() for item in os.getenv(replica_env, '').split(',') if item.strip()]
+        self.replicas = [Replica(address) for address in replicas]
+        self.replica_max_lag = float(os.getenv('REPLICA_MAX_LAG', 5))
+        self.replica_check_interval = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 2))
+        self.replica_retry_after = float(os.getenv('REPLICA_RETRY_AFTER', 30))
+        # 刚写入的方案在该时间窗口内从主库读取（读己之写）
+        self.read_your_writes_window = float(os.getenv('READ_YOUR_WRITES_WINDOW', 10))
+        self._recent_writes = {}
+        self._replica_lock = threading.Lock()
+        self._replica_cursor = 0
+        # 跨进程共享缓存：多个worker之间共享读己之写记录与副本延迟检测结果
+        self.shared_cache = get_shared_cache() if self.replicas else None
+        # 热点方案缓存（方案写入后不再修改，按id缓存解析结果）
+        self.plan_cache = HotPlanCache()
+        # 历史需求相似度索引（DEMAND_INDEX=off关闭），首次检索时从数据库构建
+        self.demand_index = None
+        if os.getenv('DEMAND_INDEX', 'on') != 'off':
+            self.demand_index = DemandIndex(loader=self.iter_demand_plans_since)
+        # 方案归档存储（已被取代的历史版本移出热表，读取时回退查询）
+        self.archive = PlanArchive(self)
     
+    @profiled('db_connect')
     def get_connection(self):
         """获取数据库连接"""
         if self.use_sqlite:
-            conn = sqlite3.connect('travel_planning.db')
+            conn = sqlite3.connect(self.sqlite_path, timeout=30)
             conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
             return conn
         else:
@@ -46,6 +100,141 @@ class Database:
                 print(f"数据库连接失败: {e}")
                 raise
     
+    @profiled('db_connect')
+    def get_replica_connection(self, replica):
+        """获取只读副本连接"""
+        if self.use_sqlite:
+            conn = sqlite3.connect(f"file:{replica.address}?mode=ro", uri=True, timeout=5)
+            conn.row_factory = sqlite3.Row
+            return conn
+        host, _, port = replica.address.partition(':')
+        return pymysql.connect(
+            host=host,
+            port=int(port or self.port),
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            charset=self.charset,
+            cursorclass=pymysql.cursors.DictCursor,
+            connect_timeout=3
+        )
+    
+    def _check_replica_lag(self, replica):
+        """查询MySQL副本的复制延迟（秒），复制中断时返回None；SQLite副本无法度量延迟，视为0"""
+        if self.use_sqlite:
+            return 0.0
+        conn = self.get_replica_connection(replica)
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.Error:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            if not status:
+                return 0.0  # 未配置复制（如本地测试用的独立实例）
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+            return None if lag is None else float(lag)
+        finally:
+            conn.close()
+    
+    def _pick_replica(self):
+        """轮询选择一个可用且延迟在阈值内的副本，没有可用副本时返回None"""
+        now = time.time()
+        with self._replica_lock:
+            count = len(self.replicas)
+            start = self._replica_cursor
+            self._replica_cursor = (start + 1) % max(count, 1)
+        
+        for offset in range(count):
+            replica = self.replicas[(start + offset) % count]
+            if self._replica_usable(replica, now):
+                return replica
+        return None
+    
+    def _replica_usable(self, replica, now):
+        """判断副本当前是否可用，到检测周期时刷新延迟（同一副本同一时间只有一个线程检测）"""
+        with replica.lock:
+            if replica.down_until > now:
+                return False
+            if now - replica.last_check < self.replica_check_interval:
+                return replica.lag <= self.replica_max_lag
+            # 占用本轮检测，其他线程在检测完成前沿用上次的结果
+            replica.last_check = now
+        
+        # 其他worker刚检测过时直接使用其结果，避免每个进程都去查询副本状态
+        shared = self.shared_cache.get_json('replica', replica.address) if self.shared_cache else None
+        if shared is not None:
+            with replica.lock:
+                replica.lag = float('inf') if shared['lag'] is None else shared['lag']
+                replica.down_until = shared['down_until']
+        else:
+            try:
+                lag = self._check_replica_lag(replica)
+            except Exception as e:
+                print(f"只读副本{replica.address}不可用: {e}")
+                self._mark_replica_down(replica)
+                return False
+            with replica.lock:
+                replica.lag = float('inf') if lag is None else lag
+            self._share_replica_state(replica)
+        with replica.lock:
+            return replica.down_until <= now and replica.lag <= self.replica_max_lag
+    
+    def _mark_replica_down(self, replica):
+        """副本出错后暂停使用一段时间"""
+        with replica.lock:
+            replica.down_until = time.time() + self.replica_retry_after
+        self._share_replica_state(replica)
+    
+    def _share_replica_state(self, replica):
+        """把副本检测结果写入共享缓存，有效期为一个检测周期"""
+        if self.shared_cache is None:
+            return
+        with replica.lock:
+            lag, down_until = replica.lag, replica.down_until
+        now = time.time()
+        ttl = self.replica_check_interval
+        if down_until > now:
+            ttl = max(ttl, down_until - now)
+        self.shared_cache.set_json('replica', replica.address, {
+            "lag": None if lag == float('inf') else lag,
+            "down_until": down_until
+        }, ttl=ttl)
+    
+    def _record_write(self, plan_id):
+        """记录刚写入的方案id，窗口期内的读取走主库"""
+        if not self.replicas:
+            return
+        now = time.time()
+        if self.shared_cache is not None:
+            # 后续读取可能由其他worker处理，写入记录需要跨进程可见
+            self.shared_cache.set('write', plan_id, b'1', ttl=self.read_your_writes_window)
+        with self._replica_lock:
+            self._recent_writes[plan_id] = now
+            if len(self._recent_writes) > 10000:
+                expired = now - self.read_your_writes_window
+                self._recent_writes = {k: t for k, t in self._recent_writes.items() if t > expired}
+    
+    def _recently_written(self, plan_id):
+        if not str(plan_id).isdigit():
+            return False
+        with self._replica_lock:
+            written_at = self._recent_writes.get(int(plan_id))
+        if written_at is not None and time.time() - written_at <= self.read_your_writes_window:
+            return True
+        return self.shared_cache is not None and self.shared_cache.get('write', int(plan_id)) is not None
+    
+    def replica_status(self):
+        """各只读副本的状态"""
+        now = time.time()
+        status = []
+        for replica in self.replicas:
+            with replica.lock:
+                status.append({"address": replica.address, "lag": replica.lag,
+                               "available": replica.down_until <= now})
+        return status
+    
     def init_database(self):
         """初始化MySQL数据库和表"""
         try:
@@ -102,7 +291,7 @@ class Database:
     def init_sqlite_database(self):
         """初始化SQLite数据库和表"""
         try:
-            conn = sqlite3.connect('travel_planning.db')
+            conn = sqlite3.connect(self.sqlite_path)
             cursor = conn.cursor()
             
             # 创建用户需求表
@@ -128,6 +317,8 @@ class Database:
                     FOREIGN KEY (demand_id) REFERENCES user_demand (id) ON DELETE CASCADE
                 )
             ''')
+            # SQLite不会为外键自动建索引，归档任务按需求查找更新版本时需要
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_travel_plan_demand ON travel_plan (demand_id)')
             
             conn.commit()
             conn.close()
@@ -136,6 +327,7 @@ class Database:
             print(f"SQLite数据库初始化失败: {e}")
             raise
     
+    @profiled('db')
     def insert_user_demand(self, scene, days, budget, interest, demand):
         """插入用户需求数据"""
         conn = self.get_connection()
@@ -158,6 +350,8 @@ class Database:
                     demand_id = cursor.lastrowid
             
             conn.commit()
+            if self.demand_index is not None:
+                self.demand_index.add_demand(demand_id, scene, days, budget, interest, demand)
             return demand_id
         except Exception as e:
             if hasattr(conn, 'rollback'):
@@ -167,6 +361,7 @@ class Database:
         finally:
             conn.close()
     
+    @profiled('db')
     def insert_travel_plan(self, demand_id, plan_content):
         """插入旅游方案数据"""
         conn = self.get_connection()
@@ -189,6 +384,9 @@ class Database:
                     plan_id = cursor.lastrowid
             
             conn.commit()
+            self._record_write(plan_id)
+            if self.demand_index is not None:
+                self.demand_index.attach_plan(demand_id, plan_id)
             return plan_id
         except Exception as e:
             if hasattr(conn, 'rollback'):
@@ -198,9 +396,93 @@ class Database:
         finally:
             conn.close()
     
+    def insert_demand_plans_bulk(self, items):
+        """在同一连接、同一事务中批量插入需求及其方案
+
+        items: [{"scene", "days", "budget", "interest", "demand", "plan_content"}, ...]
+        返回: [(demand_id, plan_id), ...]，顺序与items一致
+        """
+        placeholder = '?' if self.use_sqlite else '%s'
+        demand_sql = f'''
+            INSERT INTO user_demand (scene, days, budget, interest, demand, create_time)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+        '''
+        plan_sql = f'''
+            INSERT INTO travel_plan (demand_id, plan_content, create_time)
+            VALUES ({placeholder}, {placeholder}, {placeholder})
+        '''
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            ids = []
+            now = datetime.now()
+            for item in items:
+                cursor.execute(demand_sql, (
+                    item['scene'], item['days'], item['budget'], item['interest'], item['demand'], now
+                ))
+                demand_id = cursor.lastrowid
+                cursor.execute(plan_sql, (demand_id, item['plan_content'], now))
+                ids.append((demand_id, cursor.lastrowid))
+            cursor.close()
+            conn.commit()
+            for (demand_id, plan_id), item in zip(ids, items):
+                self._record_write(plan_id)
+                if self.demand_index is not None:
+                    self.demand_index.add(demand_id, plan_id, item['scene'], item['days'], item['budget'],
+                                          item['interest'], item['demand'])
+            return ids
+        except Exception as e:
+            if hasattr(conn, 'rollback'):
+                conn.rollback()
+            print(f"批量插入需求与方案失败: {e}")
+            raise
+        finally:
+            conn.close()
+
+    @profiled('db')
     def get_travel_plan(self, plan_id):
-        """获取旅游方案"""
+        """获取旅游方案（优先读只读副本；刚写入的方案或副本中查不到时回退主库，主库热表中没有时查询归档）"""
+        if self.replicas and not self._recently_written(plan_id):
+            replica = self._pick_replica()
+            if replica is not None:
+                try:
+                    result = self._query_travel_plan(self.get_replica_connection(replica), plan_id)
+                    if result:
+                        return result
+                except Exception as e:
+                    print(f"从只读副本{replica.address}读取方案失败: {e}，回退主库")
+                    self._mark_replica_down(replica)
+        result = self._query_travel_plan(self.get_connection(), plan_id)
+        if result is None and self.archive.enabled:
+            result = self.archive.get(plan_id)
+        return result
+    
+    def travel_plan_exists(self, plan_id):
+        """方案是否仍然存在（主库按主键查询，热表中没有时查询归档索引，不读取方案内容）"""
+        placeholder = '?' if self.use_sqlite else '%s'
         conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT tp.id FROM travel_plan tp JOIN user_demand ud ON tp.demand_id = ud.id "
+                           f"WHERE tp.id = {placeholder}", (plan_id,))
+            found = cursor.fetchone() is not None
+            cursor.close()
+        finally:
+            conn.close()
+        return found or self.archive.contains(plan_id)
+    
+    def get_parsed_travel_plan(self, plan_id):
+        """获取方案行并附带解析后的plan字段（解析失败时为None，不含plan_content原文）"""
+        row = self.plan_cache.get(plan_id)
+        if row is not None:
+            return row
+        row = self.get_travel_plan(plan_id)
+        if not row:
+            return None
+        return self.plan_cache.put(plan_id, row)
+    
+    def _query_travel_plan(self, conn, plan_id):
+        """在指定连接上查询方案及其需求"""
         try:
             if self.use_sqlite:
                 # SQLite游标不支持上下文管理器协议
@@ -235,4 +517,156 @@ class Database:
             print(f"获取旅游方案失败: {e}")
             raise
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+    def iter_travel_plans_with_budget(self, batch_size=1000):
+        """按批次遍历全部方案及其需求预算（按id递增分页，避免一次性载入整表）"""
+        placeholder = '?' if self.use_sqlite else '%s'
+        query = f'''
+            SELECT tp.id, tp.demand_id, tp.plan_content, ud.budget
+            FROM travel_plan tp
+            JOIN user_demand ud ON tp.demand_id = ud.id
+            WHERE tp.id > {placeholder}
+            ORDER BY tp.id
+            LIMIT {placeholder}
+        '''
+        last_id = 0
+        while True:
+            replica = self._pick_replica() if self.replicas else None
+            conn = self.get_replica_connection(replica) if replica else self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(query, (last_id, batch_size))
+                rows = [dict(row) for row in cursor.fetchall()]
+                cursor.close()
+            except Exception as e:
+                print(f"批量读取旅游方案失败: {e}")
+                raise
+            finally:
+                conn.close()
+
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1]['id']
+
+    def iter_demand_plans_since(self, last_plan_id=0, batch_size=5000):
+        """按方案id递增遍历 last_plan_id 之后写入的方案及其需求（不含方案内容），供需求索引同步
+
+        首次全量构建（last_plan_id为0）时先遍历归档中的方案，方案全部被归档的需求同样能被检索到
+        """
+        if not last_plan_id and self.archive.enabled:
+            yield from self.archive.iter_rows(batch_size, with_demand=True)
+        placeholder = '?' if self.use_sqlite else '%s'
+        query = f'''
+            SELECT tp.id AS plan_id, tp.demand_id, ud.scene, ud.days, ud.budget, ud.interest, ud.demand
+            FROM travel_plan tp
+            JOIN user_demand ud ON tp.demand_id = ud.id
+            WHERE tp.id > {placeholder}
+            ORDER BY tp.id
+            LIMIT {placeholder}
+        '''
+        while True:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(query, (last_plan_id, batch_size))
+                rows = [dict(row) for row in cursor.fetchall()]
+                cursor.close()
+            except Exception as e:
+                print(f"读取需求索引数据失败: {e}")
+                raise
+            finally:
+                conn.close()
+
+            if not rows:
+                break
+            yield rows
+            last_plan_id = rows[-1]['plan_id']
+
+    def stream_rows(self, table, batch_size=5000):
+        """以服务端游标流式读取整表（按id顺序），每次产出一批字典行，整表不会载入内存"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"不支持的表: {table}")
+        
+        if self.use_sqlite:
+            conn = self.get_connection()
+        else:
+            # SSDictCursor为无缓冲游标，结果集保留在服务端按需读取
+            conn = pymysql.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                database=self.database,
+                charset=self.charset,
+                cursorclass=pymysql.cursors.SSDictCursor
+            )
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT * FROM {table} ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+            cursor.close()
+        finally:
+            conn.close()
+    
+    def count_existing_ids(self, table, ids):
+        """统计指定id中在表里存在的数量"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"不支持的表: {table}")
+        if not ids:
+            return 0
+        placeholder = '?' if self.use_sqlite else '%s'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            existing = 0
+            # SQLite单条语句的参数个数有上限，分批查询
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                cursor.execute(
+                    f"SELECT COUNT(*) AS n FROM {table} WHERE id IN ({', '.join(placeholder for _ in batch)})",
+                    tuple(batch)
+                )
+                existing += cursor.fetchone()['n']
+            cursor.close()
+            return existing
+        finally:
+            conn.close()
+
+    def bulk_insert_rows(self, table, columns, rows):
+        """批量插入（保留原id），已存在的id会被跳过，便于重复导入；返回实际插入的行数
+
+        MySQL的INSERT IGNORE同样会跳过违反外键等约束的行，调用方可用 count_existing_ids 核对是否有行丢失
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"不支持的表: {table}")
+        if not rows:
+            return 0
+        
+        column_list = ', '.join(columns)
+        if self.use_sqlite:
+            sql = f"INSERT OR IGNORE INTO {table} ({column_list}) VALUES ({', '.join('?' for _ in columns)})"
+        else:
+            sql = f"INSERT IGNORE INTO {table} ({column_list}) VALUES ({', '.join('%s' for _ in columns)})"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(sql, [tuple(row[column] for column in columns) for row in rows])
+            # executemany的rowcount为各行影响行数之和，被忽略的行不计入
+            inserted = cursor.rowcount
+            cursor.close()
+            conn.commit()
+            return inserted
+        except Exception as e:
+            if hasattr(conn, 'rollback'):
+                conn.rollback()
+            print(f"批量插入{table}失败: {e}")
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+需求相似度索引模块
+以兴趣偏好与特殊需求的字符n-gram（一元+二元）TF-IDF向量索引历史需求及其首个生成的方案，
+按（出行场景、天数、目的地）分区存放在NumPy矩阵中，查询时在预算区间内做余弦相似度检索；
+目的地从兴趣偏好与特殊需求中按目的地名称表提取（scene是出行场景而不是目的地），
+新需求与方案写入时增量更新，并定期从数据库增量同步其他worker写入的方案
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+
+# 哈希特征维度（float32，每条需求占 4×维度 字节）
+DEFAULT_DIM = 1024
+# 等待关联方案的需求最多保留条数
+MAX_PENDING = 10000
+
+_SEPARATORS = re.compile(r'[\s,，、;；。.!！?？/]+')
+
+# 常见目的地名称（不含"市"等后缀，"成都市"同样能匹配"成都"），可用 DEMAND_DESTINATIONS 追加
+DESTINATIONS = (
+    '北京', '上海', '天津', '重庆', '香港', '澳门', '台北',
+    '成都', '广州', '深圳', '杭州', '南京', '苏州', '西安', '武汉', '长沙', '厦门', '青岛', '大连', '昆明',
+    '丽江', '大理', '香格里拉', '西双版纳', '桂林', '阳朔', '三亚', '海口', '拉萨', '林芝', '哈尔滨', '长春',
+    '沈阳', '呼和浩特', '乌鲁木齐', '喀什', '伊犁', '兰州', '敦煌', '西宁', '银川', '贵阳', '遵义', '南宁',
+    '北海', '福州', '泉州', '南昌', '景德镇', '婺源', '合肥', '黄山', '济南', '泰安', '曲阜', '烟台', '威海',
+    '郑州', '洛阳', '开封', '太原', '平遥', '大同', '石家庄', '承德', '秦皇岛', '宁波', '绍兴', '舟山',
+    '千岛湖', '扬州', '无锡', '乐山', '峨眉山', '九寨沟', '稻城', '张家界', '凤凰', '珠海', '延安', '武夷山'
+)
+
+
+def normalize_scene(scene):
+    """出行场景规范化：去掉空白"""
+    return re.sub(r'\s+', '', str(scene or ''))
+
+
+def _destination_pattern():
+    extra = [name.strip() for name in os.getenv('DEMAND_DESTINATIONS', '').split(',') if name.strip()]
+    # 长名称优先匹配（"峨眉山"不被拆成更短的名称）
+    names = sorted(set(DESTINATIONS) | set(extra), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(name) for name in names))
+
+
+_DESTINATION_PATTERN = _destination_pattern()
+
+
+def extract_destinations(*texts):
+    """从需求文本中提取目的地名称，返回排序后的元组（未识别出目的地时为空元组）"""
+    found = set()
+    for text in texts:
+        found.update(_DESTINATION_PATTERN.findall(str(text or '')))
+    return tuple(sorted(found))
+
+
+def partition_key(scene, days, interest, demand):
+    """索引分区键：（出行场景、天数、目的地），不同目的地的需求不会互相匹配"""
+    return normalize_scene(scene), int(days), extract_destinations(interest, demand)
+
+
+def char_ngrams(text):
+    """按分隔符切分后取字符一元与二元组"""
+    grams = []
+    for segment in _SEPARATORS.split(str(text or '').lower()):
+        chars = [ch for ch in segment if ch.isalnum()]
+        grams.extend(chars)
+        grams.extend(a + b for a, b in zip(chars, chars[1:]))
+    return grams
+
+
+class _Partition:
+    """同一出行场景、天数与目的地的需求向量（按容量倍增的预分配矩阵）"""
+
+    def __init__(self, dim):
+        self.count = 0
+        self.vectors = np.zeros((8, dim), dtype=np.float32)
+        self.budgets = np.zeros(8, dtype=np.float64)
+        self.demand_ids = np.zeros(8, dtype=np.int64)
+        self.plan_ids = np.zeros(8, dtype=np.int64)
+
+    def append(self, vector, budget, demand_id, plan_id):
+        if self.count == len(self.budgets):
+            capacity = self.count * 2
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.budgets = np.resize(self.budgets, capacity)
+            self.demand_ids = np.resize(self.demand_ids, capacity)
+            self.plan_ids = np.resize(self.plan_ids, capacity)
+        i = self.count
+        self.vectors[i] = vector
+        self.budgets[i] = budget
+        self.demand_ids[i] = demand_id
+        self.plan_ids[i] = plan_id
+        self.count += 1
+
+
+class DemandIndex:
+    """历史需求的相似度索引
+
+    loader(last_plan_id) 按方案id递增返回新写入的 {"plan_id", "demand_id", "scene", "days", "budget",
+    "interest", "demand"} 批次，用于首次构建与定期增量同步
+    """
+
+    def __init__(self, loader=None, dim=None, sync_interval=None):
+        self.loader = loader
+        self.dim = dim or int(os.getenv('DEMAND_INDEX_DIM', DEFAULT_DIM))
+        self.sync_interval = sync_interval if sync_interval is not None else float(
+            os.getenv('DEMAND_INDEX_SYNC_INTERVAL', 30))
+        self._partitions = {}
+        self._pending = {}   # 尚无方案的需求：demand_id -> (分区键, 向量, 预算)
+        self._indexed = set()
+        self._df = np.zeros(self.dim, dtype=np.float64)
+        self._docs = 0
+        self._last_plan_id = 0
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    def _vectorize(self, interest, demand):
+        """次线性词频的哈希特征向量（未乘IDF）"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram in char_ngrams(interest) + char_ngrams(demand):
+            vector[zlib.crc32(gram.encode('utf-8')) % self.dim] += 1
+        nonzero = vector > 0
+        vector[nonzero] = 1 + np.log(vector[nonzero])
+        return vector
+
+    def add_demand(self, demand_id, scene, days, budget, interest, demand):
+        """登记新需求（方案生成后再调用 attach_plan 才能被检索到）"""
+        key = partition_key(scene, days, interest, demand)
+        with self._lock:
+            if demand_id not in self._indexed:
+                self._pending[demand_id] = (key, self._vectorize(interest, demand), float(budget))
+                if len(self._pending) > MAX_PENDING:
+                    # 生成失败的需求不会再关联方案，丢弃最早登记的
+                    self._pending.pop(next(iter(self._pending)))
+
+    def attach_plan(self, demand_id, plan_id):
+        """为已登记的需求关联方案（只保留首个生成的方案，调整版本不替换）"""
+        with self._lock:
+            entry = self._pending.pop(demand_id, None)
+            if entry is None:
+                return False
+            self._insert(demand_id, plan_id, *entry)
+            return True
+
+    def add(self, demand_id, plan_id, scene, days, budget, interest, demand):
+        """直接加入已有方案的需求"""
+        self.add_demand(demand_id, scene, days, budget, interest, demand)
+        self.attach_plan(demand_id, plan_id)
+
+    def _insert(self, demand_id, plan_id, key, vector, budget):
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(self.dim)
+        partition.append(vector, budget, demand_id, plan_id)
+        self._df += vector > 0
+        self._docs += 1
+        self._indexed.add(demand_id)
+
+    def sync(self, force=False):
+        """从数据库增量加载上次同步之后写入的方案（首次调用时完成全量构建）"""
+        if self.loader is None or (not force and time.time() - self._last_sync < self.sync_interval):
+            return 0
+        if not self._sync_lock.acquire(blocking=False):
+            return 0  # 其他线程正在同步
+        try:
+            added = 0
+            for rows in self.loader(self._last_plan_id):
+                with self._lock:
+                    for row in rows:
+                        if row['demand_id'] in self._indexed:
+                            self._last_plan_id = max(self._last_plan_id, int(row['plan_id']))
+                            continue
+                        self._pending.pop(row['demand_id'], None)
+                        key = partition_key(row['scene'], row['days'], row['interest'], row['demand'])
+                        self._insert(row['demand_id'], row['plan_id'], key,
+                                     self._vectorize(row['interest'], row['demand']), float(row['budget']))
+                        # 同步游标只由数据库同步推进，本进程增量加入的方案不会跳过其他worker写入的更早方案
+                        self._last_plan_id = max(self._last_plan_id, int(row['plan_id']))
+                        added += 1
+            self._last_sync = time.time()
+            return added
+        except Exception as e:
+            print(f"需求索引同步失败: {e}")
+            return 0
+        finally:
+            self._sync_lock.release()
+
+    def search(self, scene, days, budget, interest, demand, budget_band=0.15, exclude_demand_id=None):
+        """检索同一出行场景、天数与目的地，且预算相差不超过budget_band比例的最相似需求
+
+        返回 {"demand_id", "plan_id", "similarity", "budget", "destinations"}，没有候选时返回None；
+        destinations为空表示未识别出目的地，调用方不应直接复用该方案
+        """
+        self.sync()
+        key = partition_key(scene, days, interest, demand)
+        budget = float(budget)
+        query = self._vectorize(interest, demand)
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None or partition.count == 0 or not query.any():
+                return None
+            n = partition.count
+            budgets = partition.budgets[:n]
+            candidates = np.abs(budgets - budget) <= budget * budget_band
+            if exclude_demand_id is not None:
+                candidates &= partition.demand_ids[:n] != exclude_demand_id
+            if not candidates.any():
+                return None
+            rows = np.flatnonzero(candidates)
+            vectors = partition.vectors[rows]
+            idf = (np.log((1 + self._docs) / (1 + self._df)) + 1).astype(np.float32)
+            demand_ids = partition.demand_ids[rows]
+            plan_ids = partition.plan_ids[rows]
+            candidate_budgets = budgets[rows]
+
+        weighted_query = query * idf
+        query_norm = float(np.linalg.norm(weighted_query))
+        weighted = vectors * idf
+        norms = np.linalg.norm(weighted, axis=1)
+        scores = (weighted @ weighted_query) / np.maximum(norms * query_norm, 1e-12)
+        best = int(np.argmax(scores))
+        return {
+            "demand_id": int(demand_ids[best]),
+            "plan_id": int(plan_ids[best]),
+            "similarity": round(float(scores[best]), 4),
+            "budget": float(candidate_budgets[best]),
+            "destinations": list(key[2])
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._docs,
+                "partitions": len(self._partitions),
+                "pending": len(self._pending),
+                "dim": self.dim,
+                "bytes": sum(p.vectors.nbytes for p in self._partitions.values()),
+                "last_plan_id": self._last_plan_id
+            }
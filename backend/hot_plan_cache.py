@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点方案内存缓存模块
+按方案id缓存已解析的方案对象（方案写入后不再修改，无需失效处理），按估算字节数做LRU淘汰，
+并以跨进程共享的磁盘缓存层作为第二级，进程重启或多个worker之间也能复用
+方案按存储时的原样解析缓存（不做模型规范化），各次读取共享同一个解析结果，不再同时保留原始JSON文本
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from llm_cache import DiskLRUStore
+from shared_cache import get_shared_cache
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时退回标准库json
+    orjson = None
+
+# 嵌套字典相对UTF-8 JSON文本的内存放大系数（见 bench_plan_model.py，约3.1倍）
+PARSED_OVERHEAD = 4
+
+
+class HotPlanCache:
+    """方案id -> 方案行（含解析后的plan字段）的内存LRU缓存
+
+    缓存条目保存方案行的元数据与解析后的方案字典。每次读取返回新的行字典，但其中的plan在各次读取之间共享，
+    调用方只能读取：需要修改时按写时复制只复制被修改的层级（route_optimizer、crowd_data、budget_validator
+    与 response_utils.project_plan 均如此），不能原地修改
+    """
+
+    def __init__(self, max_bytes=None, shared_path=None):
+        self.max_bytes = max_bytes or int(float(os.getenv('HOT_PLAN_CACHE_MB', 64)) * 1024 * 1024)
+        self._entries = OrderedDict()  # plan_id -> (元数据, 方案字典, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # 共享缓存层：单独配置的文件，否则使用节点内的跨进程共享缓存
+        self.shared = None
+        shared_path = shared_path or os.getenv('HOT_PLAN_SHARED_PATH')
+        if shared_path:
+            try:
+                self.shared = DiskLRUStore(shared_path, int(float(os.getenv('HOT_PLAN_SHARED_MB', 256)) * 1024 * 1024))
+            except sqlite3.Error as e:
+                print(f"共享方案缓存初始化失败: {e}，仅使用进程内缓存")
+        else:
+            shared_cache = get_shared_cache()
+            if shared_cache is not None:
+                self.shared = shared_cache.namespace('plan')
+
+    @staticmethod
+    def estimate_size(plan_content):
+        """估算缓存条目占用的内存字节数"""
+        return len((plan_content or '').encode('utf-8')) * PARSED_OVERHEAD + 512
+
+    @staticmethod
+    def _materialize(meta, plan):
+        """由缓存条目生成方案行（行字典为新建，plan为共享的只读对象）"""
+        row = dict(meta)
+        row['plan'] = plan
+        return row
+
+    def get(self, plan_id):
+        """读取缓存，先查进程内缓存，再查共享缓存层"""
+        key = str(plan_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return self._materialize(entry[0], entry[1])
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                row = self._put_local(key, json.loads(value))
+                with self._lock:
+                    self.shared_hits += 1
+                return row
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, plan_id, row):
+        """写入缓存（row为数据库行字典），返回附加了解析后plan字段的方案行"""
+        key = str(plan_id)
+        if self.shared is not None:
+            stored = {k: v for k, v in row.items() if k != 'plan'}
+            try:
+                self.shared.set(key, json.dumps(stored, ensure_ascii=False, default=str).encode('utf-8'))
+            except sqlite3.Error as e:
+                print(f"写入共享方案缓存失败: {e}")
+        return self._put_local(key, row)
+
+    def _put_local(self, key, row):
+        """解析方案并写入进程内缓存，返回方案行"""
+        plan_content = row.get('plan_content')
+        meta = {k: v for k, v in row.items() if k not in ('plan_content', 'plan')}
+        plan = parse_plan(plan_content)
+        result = self._materialize(meta, plan)
+
+        size = self.estimate_size(plan_content)
+        if size > self.max_bytes:
+            return result
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (meta, plan, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return result
+
+    def stats(self):
+        """命中率与容量统计"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+def parse_plan(plan_content):
+    """按存储时的原样解析方案JSON，格式错误时返回None"""
+    try:
+        return orjson.loads(plan_content) if orjson is not None else json.loads(plan_content)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM响应缓存模块
+以完整请求（模型、消息、温度、max_tokens）的稳定哈希为键，将响应内容缓存到单文件磁盘存储，
+按总字节数做LRU淘汰，使重复生成、调整重试及测试/基准运行可以离线即时回放
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def request_key(**request):
+    """计算请求的稳定哈希（键排序、紧凑分隔符，保证相同请求得到相同键）"""
+    canonical = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class DiskLRUStore:
+    """基于SQLite单文件的键值存储，按总字节数进行LRU淘汰，支持按条目设置过期时间（多进程可共享同一文件）
+
+    总字节数由触发器维护在 cache_meta 表中，写入时不再对全表求和
+    """
+
+    # 命中时距上次刷新访问时间超过该秒数才更新，避免每次读取都产生写事务
+    TOUCH_INTERVAL = 30
+    # 已有的键走UPDATE分支（INSERT OR REPLACE删除旧行时不触发DELETE触发器，总字节数会失准）
+    UPSERT_SQL = (
+        'INSERT INTO cache_entry (key, value, size, last_access, expires_at) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, '
+        'last_access = excluded.last_access, expires_at = excluded.expires_at'
+    )
+
+    def __init__(self, path, max_bytes, compress=True, mmap_bytes=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress = compress
+        # 大于0时以内存映射方式读取数据库文件，同一节点的进程共享操作系统页缓存
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entry (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL
+            )
+        ''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cache_entry)')]
+        if 'expires_at' not in columns:
+            conn.execute('ALTER TABLE cache_entry ADD COLUMN expires_at REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entry_access ON cache_entry (last_access)')
+        conn.commit()
+        self._init_total(conn)
+
+    def _init_total(self, conn):
+        """创建总字节数计数及维护它的触发器（已有数据的旧文件按现有条目求和一次）"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entry_total_insert AFTER INSERT ON cache_entry BEGIN
+                    UPDATE cache_meta SET value = value + NEW.size WHERE name = 'total_bytes';
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entry_total_delete AFTER DELETE ON cache_entry BEGIN
+                    UPDATE cache_meta SET value = value - OLD.size WHERE name = 'total_bytes';
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS cache_entry_total_update AFTER UPDATE OF size ON cache_entry BEGIN
+                    UPDATE cache_meta SET value = value - OLD.size + NEW.size WHERE name = 'total_bytes';
+                END
+            ''')
+            conn.execute('''
+                INSERT OR IGNORE INTO cache_meta (name, value)
+                SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM cache_entry
+            ''')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _total(self, conn):
+        """当前总字节数（由触发器维护）"""
+        return conn.execute("SELECT value FROM cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _connection(self):
+        """获取当前线程的连接（SQLite连接不能跨线程使用）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if self.mmap_bytes:
+                conn.execute(f'PRAGMA mmap_size={int(self.mmap_bytes)}')
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, value):
+        return zlib.compress(value) if self.compress else value
+
+    def _decode(self, blob):
+        return zlib.decompress(blob) if self.compress else bytes(blob)
+
+    def get(self, key):
+        """读取缓存值，已过期视为不存在；命中时按需刷新访问时间"""
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, last_access, expires_at FROM cache_entry WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[2] is not None and row[2] <= now:
+            conn.execute('DELETE FROM cache_entry WHERE key = ? AND expires_at <= ?', (key, now))
+            conn.commit()
+            return None
+        if now - row[1] >= self.TOUCH_INTERVAL:
+            conn.execute('UPDATE cache_entry SET last_access = ? WHERE key = ?', (now, key))
+            conn.commit()
+        return self._decode(row[0])
+
+    def set(self, key, value, ttl=None):
+        """写入缓存值（bytes），ttl为有效秒数（None表示不过期），超出容量时淘汰最久未访问的条目"""
+        blob = self._encode(value)
+        now = time.time()
+        conn = self._connection()
+        conn.execute(self.UPSERT_SQL, (key, blob, len(blob), now, now + ttl if ttl else None))
+        self._evict(conn)
+        conn.commit()
+
+    def update(self, key, fn, ttl=None):
+        """原子地读取-修改-写入：fn(旧值或None)返回新值，返回None时删除条目；多进程并发更新同一键时依次执行"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache_entry WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)', (key, now)
+            ).fetchone()
+            value = fn(self._decode(row[0]) if row else None)
+            if value is None:
+                conn.execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+            else:
+                blob = self._encode(value)
+                conn.execute(self.UPSERT_SQL, (key, blob, len(blob), now, now + ttl if ttl else None))
+                self._evict(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return value
+
+    def delete(self, key):
+        """删除缓存条目"""
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+        conn.commit()
+
+    def _evict(self, conn):
+        """淘汰最久未访问的条目直到总大小不超过上限"""
+        if self._total(conn) <= self.max_bytes:
+            return
+        # 先清理已过期的条目
+        conn.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (time.time(),))
+        total = self._total(conn)
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute('SELECT key, size FROM cache_entry ORDER BY last_access'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany('DELETE FROM cache_entry WHERE key = ?', victims)
+
+    def stats(self):
+        """返回条目数与总字节数"""
+        conn = self._connection()
+        count = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        return {"entries": count, "bytes": self._total(conn), "max_bytes": self.max_bytes}
+
+
+class LLMResponseCache:
+    """LLM调用层的响应缓存
+
+    缓存策略（LLM_CACHE_POLICY）：
+    - all（默认）：缓存所有请求，相同请求直接返回上次的结果；需要新结果时调用方传use_cache=False
+      （如生成接口的refresh参数）跳过读取
+    - deterministic：仅缓存temperature为0的确定性请求（采样请求每次都调用模型）
+    - off：关闭缓存
+    """
+
+    def __init__(self, path=None, max_bytes=None, policy=None):
+        self.policy = policy or os.getenv('LLM_CACHE_POLICY', 'all')
+        self.hits = 0
+        self.misses = 0
+        self.store = None
+        if self.policy != 'off':
+            path = path or os.getenv('LLM_CACHE_PATH', 'llm_cache.db')
+            max_bytes = max_bytes or int(float(os.getenv('LLM_CACHE_MAX_MB', 256)) * 1024 * 1024)
+            try:
+                self.store = DiskLRUStore(path, max_bytes)
+            except sqlite3.Error as e:
+                print(f"LLM响应缓存初始化失败: {e}，将不使用缓存")
+
+    def cacheable(self, request):
+        """判断请求是否符合缓存策略"""
+        if self.store is None:
+            return False
+        if self.policy == 'deterministic':
+            return request.get('temperature') == 0
+        return True
+
+    def get(self, request):
+        """查询缓存，命中时返回响应内容字符串"""
+        if not self.cacheable(request):
+            return None
+        try:
+            value = self.store.get(request_key(**request))
+        except sqlite3.Error as e:
+            print(f"读取LLM响应缓存失败: {e}")
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def put(self, request, content):
+        """写入响应内容"""
+        if not self.cacheable(request):
+            return
+        try:
+            self.store.set(request_key(**request), content.encode('utf-8'))
+        except sqlite3.Error as e:
+            print(f"写入LLM响应缓存失败: {e}")
+
+    def stats(self):
+        """缓存命中统计"""
+        stats = {"policy": self.policy, "hits": self.hits, "misses": self.misses}
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
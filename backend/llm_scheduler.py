@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM请求调度模块
+在AIGCService前按优先级分类排队：同一优先级内按客户端做加权公平排队（WFQ），
+支持截止时间与取消排队中的任务，并为交互请求预留工作线程，批量任务只使用空闲容量
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# 优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0   # /api/plan/generate
+PRIORITY_ADJUST = 1        # /api/plan/adjust
+PRIORITY_BATCH = 2         # 批量/后台生成
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_ADJUST: "adjust",
+    PRIORITY_BATCH: "batch"
+}
+
+
+class LLMTask:
+    """调度任务，提供类似Future的等待与取消接口"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+    EXPIRED = 'expired'
+
+    def __init__(self, fn, args, kwargs, priority, client_id, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.client_id = client_id
+        self.deadline = deadline
+        self.state = self.QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.start_tag = 0.0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """取消排队中的任务，已开始执行的任务无法取消"""
+        with self._lock:
+            if self.state != self.QUEUED:
+                return False
+            self.state = self.CANCELLED
+        self._done.set()
+        return True
+
+    def _start(self):
+        """工作线程领取任务，已取消或已过截止时间的任务返回False"""
+        with self._lock:
+            if self.state != self.QUEUED:
+                return False
+            if self.deadline is not None and time.time() > self.deadline:
+                self.state = self.EXPIRED
+                self._done.set()
+                return False
+            self.state = self.RUNNING
+            self.started_at = time.time()
+            return True
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self.state = self.DONE
+            self.result = result
+            self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+
+class LLMScheduler:
+    """优先级 + 加权公平排队调度器"""
+
+    # 客户端完成时间记录超过该数量后才扫描清理（之后阈值为清理后数量的两倍，均摊为O(1)）
+    PRUNE_MIN = 1024
+
+    def __init__(self, workers=None, interactive_reserved=None, client_weights=None):
+        self.workers = workers or int(os.getenv('LLM_WORKERS', 4))
+        # 为交互请求预留的工作线程数：批量任务最多使用 workers - reserved 个线程
+        reserved = interactive_reserved if interactive_reserved is not None else int(os.getenv('LLM_INTERACTIVE_RESERVED', 1))
+        self.interactive_reserved = min(max(reserved, 0), self.workers - 1)
+        self.client_weights = client_weights if client_weights is not None else self._parse_weights(
+            os.getenv('LLM_CLIENT_WEIGHTS', '')
+        )
+
+        self._queues = {priority: [] for priority in PRIORITY_NAMES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_NAMES}
+        # 优先级 -> {客户端: 上一个任务的虚拟完成时间}；不超过虚拟时间的记录与不存在等价，会被清理
+        self._last_finish = {priority: {} for priority in PRIORITY_NAMES}
+        self._prune_at = {priority: self.PRUNE_MIN for priority in PRIORITY_NAMES}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = {priority: 0 for priority in PRIORITY_NAMES}
+        self._counters = {"completed": 0, "cancelled": 0, "expired": 0, "failed": 0}
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+            thread.start()
+
+    @staticmethod
+    def _parse_weights(text):
+        """解析 "key1:3,key2:1" 格式的客户端权重配置"""
+        weights = {}
+        for part in text.split(','):
+            if ':' in part:
+                client_id, weight = part.rsplit(':', 1)
+                try:
+                    weights[client_id.strip()] = max(float(weight), 0.01)
+                except ValueError:
+                    continue
+        return weights
+
+    def submit(self, fn, *args, priority=PRIORITY_INTERACTIVE, client_id='anonymous', deadline=None,
+               cost=1.0, **kwargs):
+        """提交任务，返回LLMTask；deadline为绝对时间戳，超过后仍在排队的任务不再执行"""
+        task = LLMTask(fn, args, kwargs, priority, client_id, deadline)
+        weight = self.client_weights.get(client_id, 1.0)
+        with self._condition:
+            last_finish = self._last_finish[priority]
+            start_tag = max(self._virtual_time[priority], last_finish.get(client_id, 0.0))
+            finish_tag = start_tag + cost / weight
+            last_finish[client_id] = finish_tag
+            task.start_tag = start_tag
+            heapq.heappush(self._queues[priority], (finish_tag, next(self._sequence), task))
+            self._condition.notify()
+        return task
+
+    def run(self, fn, *args, priority=PRIORITY_INTERACTIVE, client_id='anonymous', timeout=None,
+            is_cancelled=None, poll_interval=0.2, **kwargs):
+        """提交并等待任务结束；is_cancelled返回True（如客户端已断开）时取消排队中的任务
+
+        返回任务结果；任务被取消或排队超时时返回 {"success": False, ...}，执行出错时抛出原异常
+        """
+        deadline = time.time() + timeout if timeout else None
+        task = self.submit(fn, *args, priority=priority, client_id=client_id, deadline=deadline, **kwargs)
+        while not task.wait(poll_interval):
+            if is_cancelled is not None and is_cancelled():
+                if task.cancel():
+                    return {"success": False, "error": "客户端已断开，请求已取消"}
+            if deadline is not None and time.time() > deadline and task.state == LLMTask.QUEUED:
+                if task.cancel():
+                    return {"success": False, "error": "请求排队超时，请稍后重试", "throttled": True}
+
+        if task.state == LLMTask.EXPIRED:
+            return {"success": False, "error": "请求排队超时，请稍后重试", "throttled": True}
+        if task.state == LLMTask.CANCELLED:
+            return {"success": False, "error": "请求已取消"}
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def _can_start(self, priority):
+        """批量任务只能使用未预留给交互请求的线程"""
+        if priority < PRIORITY_BATCH:
+            return True
+        busy = sum(self._running.values())
+        return busy < self.workers - self.interactive_reserved
+
+    def _next_task(self):
+        """按优先级取出下一个可执行任务（调用方持有锁）"""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue and queue[0][2].state != LLMTask.QUEUED:
+                self._count_discarded(heapq.heappop(queue)[2])
+            if queue and self._can_start(priority):
+                task = heapq.heappop(queue)[2]
+                # 虚拟时间推进到正在服务任务的开始标签（SFQ）
+                self._virtual_time[priority] = max(self._virtual_time[priority], task.start_tag)
+                self._prune(priority)
+                return task
+        return None
+
+    def _prune(self, priority):
+        """清理客户端完成时间记录（调用方持有锁）：队列已空时忙期结束，全部清空；
+        否则在记录数超过阈值时删除不超过当前虚拟时间的记录"""
+        last_finish = self._last_finish[priority]
+        if not self._queues[priority]:
+            last_finish.clear()
+        elif len(last_finish) > self._prune_at[priority]:
+            virtual_time = self._virtual_time[priority]
+            for client_id in [c for c, finish in last_finish.items() if finish <= virtual_time]:
+                del last_finish[client_id]
+        else:
+            return
+        self._prune_at[priority] = max(self.PRUNE_MIN, 2 * len(last_finish))
+
+    def _count_discarded(self, task):
+        if task.state == LLMTask.CANCELLED:
+            self._counters["cancelled"] += 1
+        elif task.state == LLMTask.EXPIRED:
+            self._counters["expired"] += 1
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None:
+                    self._condition.wait(1.0)
+                    task = self._next_task()
+                if not task._start():
+                    self._count_discarded(task)
+                    continue
+                self._running[task.priority] += 1
+
+            try:
+                task._finish(result=task.fn(*task.args, **task.kwargs))
+                outcome = "completed"
+            except Exception as e:
+                task._finish(error=e)
+                outcome = "failed"
+
+            with self._condition:
+                self._running[task.priority] -= 1
+                self._counters[outcome] += 1
+                self._condition.notify_all()
+
+    def stats(self):
+        """各优先级排队/执行数量与累计计数"""
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "queued": {
+                    PRIORITY_NAMES[p]: sum(1 for entry in q if entry[2].state == LLMTask.QUEUED)
+                    for p, q in self._queues.items()
+                },
+                "running": {PRIORITY_NAMES[p]: n for p, n in self._running.items()},
+                "tracked_clients": sum(len(clients) for clients in self._last_finish.values()),
+                **self._counters
+            }
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多模型路由模块
+按任务类型与方案规模选择模型档位（完整生成用qwen-max，小规模调整用更快的档位），
+失败或输出不合法时依次回退到下一个模型；可选对冲请求：主模型超过其p95延迟仍未返回时，
+向备用模型发出第二个请求，采用最先返回的合法结果。按模型统计延迟与输出合格率
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from request_profiler import stage
+
+# 任务类型
+TASK_GENERATE = 'generate'
+TASK_WEATHER = 'weather'
+TASK_CROWD = 'crowd'
+
+# 计算p95所需的最少延迟样本数，样本不足时使用默认对冲延迟
+MIN_LATENCY_SAMPLES = 20
+
+
+class ModelStats:
+    """单个模型的延迟与质量计数"""
+
+    def __init__(self, window=200):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.invalid = 0
+        self.hedges = 0      # 作为备用模型被对冲调用的次数
+        self.hedge_wins = 0  # 对冲调用中先返回合法结果的次数
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+    def snapshot(self):
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        valid = self.calls - self.errors - self.invalid
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "invalid": self.invalid,
+            "valid_rate": round(valid / self.calls, 4) if self.calls else None,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+class ModelRouter:
+    """按任务选择模型列表，执行回退与对冲调用"""
+
+    def __init__(self, full_model=None, fast_model=None, small_plan_items=None,
+                 hedge=None, hedge_delay=None, hedge_workers=None):
+        self.full_model = full_model or os.getenv('LLM_MODEL_FULL', 'qwen-max')
+        self.fast_model = fast_model or os.getenv('LLM_MODEL_FAST', 'qwen-plus')
+        # 行程项不超过该数量的调整任务视为小任务，优先使用快速档位
+        self.small_plan_items = small_plan_items or int(os.getenv('LLM_SMALL_PLAN_ITEMS', 16))
+        self.hedge = hedge if hedge is not None else os.getenv('LLM_HEDGE', '0') == '1'
+        # p95样本不足时的对冲延迟（秒）
+        self.hedge_delay = hedge_delay or float(os.getenv('LLM_HEDGE_DELAY', 8))
+        # 每个对冲调用同时占用两个线程（主模型与备用模型），默认按LLM调用工作线程数的2倍配置，
+        # 避免主模型请求在线程池中排队
+        hedge_workers = hedge_workers or int(os.getenv('LLM_HEDGE_WORKERS', 0)) or 2 * int(os.getenv('LLM_WORKERS', 4))
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='llm-hedge')
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, task, plan_items=None):
+        """返回按优先顺序排列的模型列表"""
+        if task == TASK_GENERATE:
+            models = [self.full_model, self.fast_model]
+        elif plan_items is not None and plan_items <= self.small_plan_items:
+            models = [self.fast_model, self.full_model]
+        else:
+            models = [self.full_model, self.fast_model]
+        # 两个档位配置为同一模型时不重复调用
+        return list(dict.fromkeys(models))
+
+    def _model_stats(self, model):
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def delay_for(self, model):
+        """对冲延迟：主模型近期延迟的p95"""
+        with self._lock:
+            stats = self._model_stats(model)
+            if len(stats.latencies) < MIN_LATENCY_SAMPLES:
+                return self.hedge_delay
+            return stats.percentile(0.95)
+
+    def _record(self, model, result, elapsed, valid):
+        """记录一次调用结果（缓存命中不计入延迟统计）"""
+        if result.get("cached"):
+            return
+        with self._lock:
+            stats = self._model_stats(model)
+            stats.calls += 1
+            if not result["success"]:
+                stats.errors += 1
+                return
+            stats.latencies.append(elapsed)
+            if not valid:
+                stats.invalid += 1
+
+    def _attempt(self, call, model, validate):
+        """调用单个模型，返回 (结果, 是否合法)"""
+        started = time.time()
+        try:
+            result = call(model)
+        except Exception as e:
+            result = {"success": False, "error": f"模型{model}调用异常: {e}"}
+        valid = result["success"] and (validate is None or validate(result["content"]))
+        self._record(model, result, time.time() - started, valid)
+        result["model"] = model
+        return result, valid
+
+    def call(self, call, task, plan_items=None, validate=None):
+        """按路由调用模型
+
+        call(model) 执行单次调用并返回 {"success", "content"/"error"}；
+        validate(content) 判断输出是否合法，不合法时视为失败并回退到下一个模型。
+        所有模型都不合法时返回最后一次的原始输出，由调用方按原始文本处理
+        """
+        models = self.route(task, plan_items)
+        if self.hedge and len(models) > 1:
+            return self._hedged(call, models[0], models[1], validate)
+
+        fallback = None
+        for model in models:
+            result, valid = self._attempt(call, model, validate)
+            if valid or result.get("throttled"):
+                # token配额对所有模型共享，被限流时换模型重试也无济于事
+                return result
+            if fallback is None or not fallback["success"]:
+                fallback = result
+            print(f"模型{model}调用失败或输出不合法，尝试下一个模型")
+        return fallback
+
+    def _hedged(self, call, primary, backup, validate):
+        """对冲调用：主模型超过p95延迟未返回时调用备用模型，返回最先得到的合法结果
+
+        对冲延迟从主模型请求实际开始执行时计时，线程池中的排队时间不计入。
+        对冲线程不继承请求剖析上下文（两个并行调用的耗时不能重复计入），由调用线程把整个等待计为upstream_llm阶段
+        """
+        with stage('upstream_llm'):
+            return self._race(call, primary, backup, validate)
+
+    def _race(self, call, primary, backup, validate):
+        """在对冲线程池中执行主模型调用，必要时发出备用调用，返回最先得到的合法结果"""
+        started = threading.Event()
+
+        def run_primary():
+            started.set()
+            return self._attempt(call, primary, validate)
+
+        first = self._executor.submit(run_primary)
+        started.wait()
+        done, _ = wait([first], timeout=self.delay_for(primary))
+        if done:
+            result, valid = first.result()
+            if valid or result.get("throttled"):
+                return result
+            # 主模型很快失败，直接回退到备用模型
+            backup_result, valid = self._attempt(call, backup, validate)
+            return backup_result if valid or not result["success"] else result
+
+        with self._lock:
+            self._model_stats(backup).hedges += 1
+        second = self._executor.submit(self._attempt, call, backup, validate)
+        fallback = None
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, valid = future.result()
+                if valid:
+                    if future is second:
+                        with self._lock:
+                            self._model_stats(backup).hedge_wins += 1
+                    # 未完成的请求无法中断，其结果仍会写入LLM响应缓存
+                    return result
+                if fallback is None or not fallback["success"]:
+                    fallback = result
+        return fallback
+
+    def stats(self):
+        """各模型调用次数、合格率与延迟分位数"""
+        with self._lock:
+            return {
+                "hedge": self.hedge,
+                "routes": {
+                    TASK_GENERATE: self.route(TASK_GENERATE),
+                    "adjust_small": self.route(TASK_WEATHER, 0),
+                    "adjust_large": self.route(TASK_WEATHER)
+                },
+                "models": {model: stats.snapshot() for model, stats in self._stats.items()}
+            }
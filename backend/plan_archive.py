@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+方案归档模块
+每次调整方案都会新增一个方案版本，travel_plan表只增不减。归档任务定期把已被新版本取代且超过一定天数的方案，
+以及超过最长保留天数的所有方案，以zlib压缩后移入归档存储，热表只保留近期方案与各需求的当前版本；
+按id读取方案时热表中查不到再回退到归档
+
+归档存储按方案创建月份分区：
+- MySQL：travel_plan_archive 表按 RANGE(archive_month) 分区，新月份自动增加分区，过期月份整区删除
+- SQLite：每月一张 travel_plan_archive_YYYYMM 表，travel_plan_archive_index 记录方案id所在的月份
+
+用法：
+    python plan_archive.py run      # 立即执行一次归档
+    python plan_archive.py stats    # 查看各月份归档规模
+"""
+
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from shared_cache import get_shared_cache
+
+ARCHIVE_TABLE = 'travel_plan_archive'
+INDEX_TABLE = 'travel_plan_archive_index'
+COMPRESS_LEVEL = 6
+
+
+def plan_month(create_time):
+    """方案创建时间所在月份（YYYYMM），兼容datetime与SQLite中保存的时间文本"""
+    if isinstance(create_time, datetime):
+        return create_time.year * 100 + create_time.month
+    text = str(create_time or '')
+    try:
+        return int(text[0:4]) * 100 + int(text[5:7])
+    except ValueError:
+        now = datetime.now()
+        return now.year * 100 + now.month
+
+
+def next_month(month):
+    year, m = divmod(month, 100)
+    return (year + 1) * 100 + 1 if m == 12 else month + 1
+
+
+def months_ago(months, now=None):
+    """当前月份往前推若干个月（YYYYMM）"""
+    now = now or datetime.now()
+    total = now.year * 12 + now.month - 1 - months
+    return (total // 12) * 100 + total % 12 + 1
+
+
+class PlanArchive:
+    """travel_plan 的归档存储与归档任务"""
+
+    def __init__(self, db, superseded_days=None, max_age_days=None, retention_months=None, batch_size=None):
+        self.db = db
+        # 被新版本取代超过该天数的方案归档
+        self.superseded_days = superseded_days if superseded_days is not None else float(
+            os.getenv('PLAN_ARCHIVE_SUPERSEDED_DAYS', 7))
+        # 创建超过该天数的方案无论是否为当前版本都归档（默认0，不按创建时间归档当前版本）
+        self.max_age_days = max_age_days if max_age_days is not None else float(
+            os.getenv('PLAN_ARCHIVE_MAX_AGE_DAYS', 0))
+        # 归档保留月数，更早月份的分区整体删除（0表示永久保留）
+        self.retention_months = retention_months if retention_months is not None else int(
+            os.getenv('PLAN_ARCHIVE_RETENTION_MONTHS', 0))
+        self.batch_size = batch_size or int(os.getenv('PLAN_ARCHIVE_BATCH', 500))
+        self.placeholder = '?' if db.use_sqlite else '%s'
+        self._run_lock = threading.Lock()
+        self.runs = 0
+        self.archived = 0
+        self.fallback_reads = 0
+        self.last_run = None
+        self.enabled = True
+        try:
+            self.init_schema()
+        except Exception as e:
+            print(f"方案归档存储初始化失败: {e}，归档不可用")
+            self.enabled = False
+
+    def init_schema(self):
+        """创建归档表（MySQL为分区表，SQLite为月份索引表，月份表在归档时按需创建）"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db.use_sqlite:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+                        id INTEGER PRIMARY KEY,
+                        archive_month INTEGER NOT NULL
+                    )
+                ''')
+            else:
+                # 分区表不支持外键，分区键需要包含在主键中
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+                        id INT NOT NULL,
+                        demand_id INT,
+                        plan_content MEDIUMBLOB NOT NULL,
+                        create_time TIMESTAMP NULL,
+                        archive_month INT NOT NULL,
+                        PRIMARY KEY (id, archive_month),
+                        KEY idx_archive_demand (demand_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                    PARTITION BY RANGE (archive_month) (
+                        PARTITION pmax VALUES LESS THAN MAXVALUE
+                    )
+                ''')
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _month_table(month):
+        return f"{ARCHIVE_TABLE}_{int(month)}"
+
+    def contains(self, plan_id):
+        """按id判断方案是否在归档中（只查询索引，不读取方案内容）"""
+        if not self.enabled or not str(plan_id).isdigit():
+            return False
+        p = self.placeholder
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db.use_sqlite:
+                cursor.execute(f"SELECT archive_month FROM {INDEX_TABLE} WHERE id = ?", (plan_id,))
+                located = cursor.fetchone()
+                if not located:
+                    return False
+                table = self._month_table(located['archive_month'])
+            else:
+                table = ARCHIVE_TABLE
+            cursor.execute(f"SELECT a.id FROM {table} a JOIN user_demand ud ON a.demand_id = ud.id WHERE a.id = {p}",
+                           (plan_id,))
+            found = cursor.fetchone() is not None
+            cursor.close()
+        finally:
+            conn.close()
+        return found
+
+    def get(self, plan_id):
+        """按id读取已归档的方案（结构与 Database.get_travel_plan 相同），不存在时返回None"""
+        if not self.enabled or not str(plan_id).isdigit():
+            return None
+        p = self.placeholder
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db.use_sqlite:
+                cursor.execute(f"SELECT archive_month FROM {INDEX_TABLE} WHERE id = ?", (plan_id,))
+                located = cursor.fetchone()
+                if not located:
+                    return None
+                table = self._month_table(located['archive_month'])
+            else:
+                table = ARCHIVE_TABLE
+            cursor.execute(f'''
+                SELECT a.id, a.demand_id, a.plan_content, a.create_time,
+                       ud.scene, ud.days, ud.budget, ud.interest, ud.demand
+                FROM {table} a
+                JOIN user_demand ud ON a.demand_id = ud.id
+                WHERE a.id = {p}
+            ''', (plan_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        row = dict(row)
+        row['plan_content'] = zlib.decompress(row['plan_content']).decode('utf-8')
+        self.fallback_reads += 1
+        return row
+
+    def iter_rows(self, batch_size=5000, with_demand=False):
+        """按id顺序分批遍历全部归档方案（plan_content已解压），供导出与迁移
+
+        with_demand为True时改为返回需求索引同步所需的字段（plan_id与需求字段，不含方案内容）
+        """
+        if not self.enabled:
+            return
+        p = self.placeholder
+        if with_demand:
+            columns = 'a.id AS plan_id, a.demand_id, ud.scene, ud.days, ud.budget, ud.interest, ud.demand'
+            join = 'JOIN user_demand ud ON a.demand_id = ud.id'
+        else:
+            columns = 'a.id, a.demand_id, a.plan_content, a.create_time'
+            join = ''
+        id_column = 'plan_id' if with_demand else 'id'
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db.use_sqlite:
+                tables = [self._month_table(partition['month']) for partition in self.partitions(cursor)]
+            else:
+                tables = [ARCHIVE_TABLE]
+            for table in tables:
+                last_id = 0
+                while True:
+                    cursor.execute(f'''
+                        SELECT {columns} FROM {table} a {join}
+                        WHERE a.id > {p} ORDER BY a.id LIMIT {p}
+                    ''', (last_id, batch_size))
+                    rows = [dict(row) for row in cursor.fetchall()]
+                    if not rows:
+                        break
+                    last_id = rows[-1][id_column]
+                    if not with_demand:
+                        for row in rows:
+                            row['plan_content'] = zlib.decompress(row['plan_content']).decode('utf-8')
+                    yield rows
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _select_batch(self, last_id, superseded_before, expired_before):
+        """按id顺序选出下一批待归档的方案"""
+        p = self.placeholder
+        conditions = f'''(tp.create_time < {p} AND EXISTS (
+                SELECT 1 FROM travel_plan newer WHERE newer.demand_id = tp.demand_id AND newer.id > tp.id
+            ))'''
+        params = [last_id, superseded_before]
+        if expired_before is not None:
+            conditions += f" OR tp.create_time < {p}"
+            params.append(expired_before)
+        params.append(self.batch_size)
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT tp.id, tp.demand_id, tp.plan_content, tp.create_time
+                FROM travel_plan tp
+                WHERE tp.id > {p} AND ({conditions})
+                ORDER BY tp.id
+                LIMIT {p}
+            ''', params)
+            rows = [dict(row) for row in cursor.fetchall()]
+            cursor.close()
+            return rows
+        finally:
+            conn.close()
+
+    def _ensure_partitions(self, cursor, months):
+        """MySQL：为新月份拆分出独立分区（pmax始终为空，拆分无需移动数据）"""
+        cursor.execute('''
+            SELECT PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ''', (ARCHIVE_TABLE,))
+        bounds = [int(row['PARTITION_DESCRIPTION']) for row in cursor.fetchall()
+                  if row['PARTITION_DESCRIPTION'] not in (None, 'MAXVALUE')]
+        highest = max(bounds) if bounds else 0
+        for month in sorted(set(months)):
+            # 早于已有分区上界的月份落入覆盖它的分区
+            if month >= highest:
+                cursor.execute(f'''
+                    ALTER TABLE {ARCHIVE_TABLE} REORGANIZE PARTITION pmax INTO (
+                        PARTITION p{month} VALUES LESS THAN ({next_month(month)}),
+                        PARTITION pmax VALUES LESS THAN MAXVALUE
+                    )
+                ''')
+                highest = next_month(month)
+
+    def _move(self, rows):
+        """在同一事务中把一批方案压缩写入归档并从热表删除"""
+        p = self.placeholder
+        archived = [
+            (row['id'], row['demand_id'], zlib.compress(row['plan_content'].encode('utf-8'), COMPRESS_LEVEL),
+             row['create_time'], plan_month(row['create_time']))
+            for row in rows
+        ]
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db.use_sqlite:
+                for month in {item[4] for item in archived}:
+                    cursor.execute(f'''
+                        CREATE TABLE IF NOT EXISTS {self._month_table(month)} (
+                            id INTEGER PRIMARY KEY,
+                            demand_id INTEGER,
+                            plan_content BLOB NOT NULL,
+                            create_time TIMESTAMP
+                        )
+                    ''')
+                for item in archived:
+                    cursor.execute(f"INSERT OR IGNORE INTO {self._month_table(item[4])} VALUES (?, ?, ?, ?)",
+                                   item[:4])
+                cursor.executemany(f"INSERT OR REPLACE INTO {INDEX_TABLE} (id, archive_month) VALUES (?, ?)",
+                                   [(item[0], item[4]) for item in archived])
+            else:
+                # 分区变更是DDL（隐式提交），需在写入数据之前完成
+                self._ensure_partitions(cursor, [item[4] for item in archived])
+                cursor.executemany(f'''
+                    INSERT IGNORE INTO {ARCHIVE_TABLE} (id, demand_id, plan_content, create_time, archive_month)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', archived)
+            ids = [item[0] for item in archived]
+            cursor.execute(f"DELETE FROM travel_plan WHERE id IN ({', '.join(p for _ in ids)})", ids)
+            cursor.close()
+            conn.commit()
+        except Exception:
+            if hasattr(conn, 'rollback'):
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def drop_expired(self):
+        """删除超过保留月数的归档分区，返回删除的分区（月份）列表"""
+        if not self.retention_months:
+            return []
+        cutoff = months_ago(self.retention_months)
+        dropped = []
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            for partition in self.partitions(cursor):
+                # MySQL的p月份分区只包含该月份及更早的方案，SQLite每张表只包含一个月份
+                month = partition['month']
+                if month < cutoff:
+                    if self.db.use_sqlite:
+                        cursor.execute(f"DROP TABLE IF EXISTS {self._month_table(month)}")
+                        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE archive_month = ?", (month,))
+                    else:
+                        cursor.execute(f"ALTER TABLE {ARCHIVE_TABLE} DROP PARTITION p{month}")
+                    dropped.append(month)
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+        return dropped
+
+    def partitions(self, cursor):
+        """各月份分区及行数（MySQL为统计信息中的估算值）"""
+        if self.db.use_sqlite:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                           (f"{ARCHIVE_TABLE}_%",))
+            result = []
+            for row in cursor.fetchall():
+                suffix = row['name'][len(ARCHIVE_TABLE) + 1:]
+                if suffix.isdigit():
+                    cursor.execute(f"SELECT COUNT(*) AS n FROM {row['name']}")
+                    result.append({"month": int(suffix), "rows": cursor.fetchone()['n']})
+            return sorted(result, key=lambda item: item['month'])
+        cursor.execute('''
+            SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME <> 'pmax'
+            ORDER BY PARTITION_ORDINAL_POSITION
+        ''', (ARCHIVE_TABLE,))
+        return [{"month": int(row['PARTITION_NAME'][1:]), "rows": row['TABLE_ROWS']} for row in cursor.fetchall()]
+
+    def run(self, max_batches=None):
+        """执行一次归档，返回本次统计；同一进程内已有归档在运行时返回None"""
+        if not self.enabled or not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.time()
+            now = datetime.now()
+            # SQLite中的时间为文本，按相同格式比较；MySQL同样接受该格式
+            superseded_before = (now - timedelta(days=self.superseded_days)).strftime('%Y-%m-%d %H:%M:%S')
+            expired_before = None
+            if self.max_age_days:
+                expired_before = (now - timedelta(days=self.max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+            moved = 0
+            batches = 0
+            last_id = 0
+            while not max_batches or batches < max_batches:
+                rows = self._select_batch(last_id, superseded_before, expired_before)
+                if not rows:
+                    break
+                self._move(rows)
+                moved += len(rows)
+                batches += 1
+                last_id = rows[-1]['id']
+
+            dropped = self.drop_expired()
+            self.runs += 1
+            self.archived += moved
+            self.last_run = {
+                "time": now.strftime('%Y-%m-%d %H:%M:%S'),
+                "archived": moved,
+                "dropped_months": dropped,
+                "seconds": round(time.time() - started, 3)
+            }
+            return self.last_run
+        finally:
+            self._run_lock.release()
+
+    def _acquire_lease(self, interval):
+        """多个worker时同一周期只由一个进程执行归档（没有共享缓存时各进程都执行，归档本身是幂等的）"""
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return True
+        now = time.time()
+        token = f"{os.getpid()}:{now}"
+
+        def claim(lease):
+            if lease and lease.get('until', 0) > now:
+                return lease
+            return {"owner": token, "until": now + interval * 0.9}
+
+        lease = shared_cache.update_json('archive', 'lease', claim, ttl=interval)
+        return lease is None or lease.get('owner') == token
+
+    def start(self, interval=None):
+        """启动后台归档线程，interval为执行间隔秒数（PLAN_ARCHIVE_INTERVAL，0表示不启动）"""
+        interval = interval if interval is not None else float(os.getenv('PLAN_ARCHIVE_INTERVAL', 3600))
+        if not self.enabled or not interval:
+            return False
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                if not self._acquire_lease(interval):
+                    continue
+                try:
+                    result = self.run()
+                    if result and (result['archived'] or result['dropped_months']):
+                        print(f"方案归档完成: {result}")
+                except Exception as e:
+                    print(f"方案归档失败: {e}")
+
+        threading.Thread(target=loop, daemon=True).start()
+        return True
+
+    def stats(self):
+        """归档配置、运行统计与各月份分区规模"""
+        stats = {
+            "enabled": self.enabled,
+            "superseded_days": self.superseded_days,
+            "max_age_days": self.max_age_days,
+            "retention_months": self.retention_months,
+            "runs": self.runs,
+            "archived": self.archived,
+            "fallback_reads": self.fallback_reads,
+            "last_run": self.last_run
+        }
+        if self.enabled:
+            conn = self.db.get_connection()
+            try:
+                cursor = conn.cursor()
+                stats["partitions"] = self.partitions(cursor)
+                cursor.close()
+            except Exception as e:
+                stats["error"] = str(e)
+            finally:
+                conn.close()
+        return stats
+
+
+def main():
+    from database import Database
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    db = Database()
+    if command == 'run':
+        print(db.archive.run())
+    elif command == 'stats':
+        print(db.archive.stats())
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+方案缓存模块
+以规范化后的需求（场景、天数、预算、兴趣、特殊需求）为键缓存已生成的方案，
+相同需求的访问者无需再等待LLM生成；可由批量预热任务提前填充
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from llm_cache import DiskLRUStore, request_key
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize_text(value):
+    """去除首尾及重复空白"""
+    return _WHITESPACE.sub(' ', str(value)).strip()
+
+
+def demand_key(scene, days, budget, interest, demand):
+    """计算需求的缓存键"""
+    return request_key(
+        scene=_normalize_text(scene),
+        days=int(days),
+        budget=round(float(budget), 2),
+        interest=_normalize_text(interest),
+        demand=_normalize_text(demand)
+    )
+
+
+class PlanCache:
+    """需求 -> 方案 的磁盘缓存（多进程共享同一文件）"""
+
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = path or os.getenv('PLAN_CACHE_PATH', 'plan_cache.db')
+        max_bytes = max_bytes or int(float(os.getenv('PLAN_CACHE_MAX_MB', 128)) * 1024 * 1024)
+        # 缓存有效期（秒），默认7天，0表示永不过期
+        self.ttl = ttl if ttl is not None else float(os.getenv('PLAN_CACHE_TTL', 7 * 24 * 3600))
+        self.hits = 0
+        self.misses = 0
+        self.store = None
+        try:
+            self.store = DiskLRUStore(self.path, max_bytes)
+        except sqlite3.Error as e:
+            print(f"方案缓存初始化失败: {e}，将不使用缓存")
+
+    def get(self, scene, days, budget, interest, demand):
+        """查询缓存，命中时返回 {"plan_id", "demand_id", "plan"}"""
+        if self.store is None:
+            return None
+        key = demand_key(scene, days, budget, interest, demand)
+        try:
+            value = self.store.get(key)
+        except sqlite3.Error as e:
+            print(f"读取方案缓存失败: {e}")
+            return None
+        if value is not None:
+            entry = json.loads(value)
+            if not self.ttl or time.time() - entry.get('cached_at', 0) <= self.ttl:
+                self.hits += 1
+                return entry
+            self.store.delete(key)
+        self.misses += 1
+        return None
+
+    def put(self, scene, days, budget, interest, demand, plan_id, demand_id, plan):
+        """写入缓存（原始文本方案不缓存）"""
+        if self.store is None or not isinstance(plan, dict) or "raw_content" in plan:
+            return
+        entry = {
+            "plan_id": plan_id,
+            "demand_id": demand_id,
+            "plan": plan,
+            "cached_at": time.time()
+        }
+        try:
+            self.store.set(
+                demand_key(scene, days, budget, interest, demand),
+                json.dumps(entry, ensure_ascii=False).encode('utf-8')
+            )
+        except sqlite3.Error as e:
+            print(f"写入方案缓存失败: {e}")
+
+    def stats(self):
+        """缓存命中统计"""
+        stats = {"hits": self.hits, "misses": self.misses}
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑方案输出格式模块
+生成方案时让模型输出短键名 + 每日行程行文本的紧凑JSON，减少输出token（输出token决定了生成耗时）；
+本地再展开为原有的方案结构，并重新计算 day / date / daily_total / total_days 等派生字段
+
+紧凑格式：
+{
+    "t": "方案标题",
+    "d": [
+        ["09:00-11:00|景点|交通|餐饮|200", "14:00-17:00|景点|交通|餐饮|300"],
+        ["..."]
+    ],
+    "tips": ["小贴士"],
+    "n": "注意事项"
+}
+"d" 中每个数组是一天的行程，每行字段顺序为 时间|景点|交通|餐饮|预算（与调整方案时提示词中的行程行格式一致）
+"""
+
+import re
+from budget_validator import to_number
+
+# 行程行的字段顺序
+ROW_FIELDS = ('time', 'attraction', 'transportation', 'dining', 'budget')
+
+_DIGITS = '零一二三四五六七八九'
+# 单独的金额字段（"200"、"200元"）
+_AMOUNT_PATTERN = re.compile(r'-?\d+(?:\.\d+)?\s*元?')
+
+
+def day_label(day):
+    """第几天的中文写法（"第一天"、"第十二天"），与原输出格式一致"""
+    if not 0 < day < 100:
+        return f"第{day}天"
+    tens, ones = divmod(day, 10)
+    if tens == 0:
+        text = _DIGITS[ones]
+    else:
+        text = ('' if tens == 1 else _DIGITS[tens]) + '十' + (_DIGITS[ones] if ones else '')
+    return f"第{text}天"
+
+
+def format_instructions(days, budget, demand=None):
+    """紧凑格式的输出说明（写入生成与调整方案的提示词）"""
+    notes = f"{demand}相关注意事项" if demand else "注意事项"
+    return f"""请只输出如下紧凑JSON（不要输出其他内容）：
+{{"t":"方案标题","d":[["09:00-11:00|景点名称|交通方式|餐饮安排|200","14:00-17:00|景点名称|交通方式|餐饮安排|300"]],"tips":["旅游小贴士1","旅游小贴士2"],"n":"{notes}"}}
+
+格式说明：
+- d 为{days}个数组，依次是每天的行程，每个字符串是一个行程项
+- 行程项字段以|分隔，依次为：时间|景点|交通|餐饮|预算（预算为整数元，字段内不要出现|）
+- 所有行程项预算之和不超过{budget}元"""
+
+
+def _money(value):
+    """金额统一为数字，整数金额不带小数"""
+    number = to_number(value)
+    return int(number) if number == int(number) else round(number, 2)
+
+
+def parse_row(row):
+    """解析一个行程项：时间|景点|交通|餐饮|预算；也接受已经是对象或数组的行程项"""
+    if isinstance(row, dict):
+        item = dict(row)
+        item['budget'] = _money(item.get('budget'))
+        return item
+    if isinstance(row, (list, tuple)):
+        parts = [str(part) for part in row]
+    else:
+        parts = str(row).split('|')
+    parts = [part.strip() for part in parts]
+    if len(parts) > len(ROW_FIELDS):
+        # 字段内误用了|：首尾两个字段位置固定，多出的部分并入餐饮
+        parts = parts[:3] + ['|'.join(parts[3:-1]), parts[-1]]
+    elif 1 < len(parts) < len(ROW_FIELDS) and _AMOUNT_PATTERN.fullmatch(parts[-1]):
+        # 缺少中间字段（如没有餐饮）：末尾的金额仍作为预算
+        parts = parts[:-1] + [''] * (len(ROW_FIELDS) - len(parts)) + parts[-1:]
+    parts += [''] * (len(ROW_FIELDS) - len(parts))
+    item = dict(zip(ROW_FIELDS, parts))
+    item['budget'] = _money(item['budget'])
+    return item
+
+
+def is_compact_plan(data):
+    """紧凑格式：没有daily_plans，且带有紧凑格式的短键名"""
+    return isinstance(data, dict) and 'daily_plans' not in data and ('d' in data or 't' in data)
+
+
+def expand_plan(data, budget=None):
+    """把紧凑格式展开为完整方案结构；已经是完整结构（模型没有按紧凑格式输出）时原样返回"""
+    if not is_compact_plan(data):
+        return data
+
+    days = data.get('d')
+    daily_plans = []
+    for i, rows in enumerate(days if isinstance(days, list) else []):
+        if isinstance(rows, dict):
+            # 兼容模型把每天写成 {"s": [...]} 之类的对象
+            rows = rows.get('s') or rows.get('schedule') or []
+        elif not isinstance(rows, list):
+            rows = [rows]
+        schedule = [parse_row(row) for row in rows if row not in (None, '')]
+        daily_plans.append({
+            "day": i + 1,
+            "date": day_label(i + 1),
+            "schedule": schedule,
+            "daily_total": _money(sum(item['budget'] for item in schedule))
+        })
+
+    tips = data.get('tips') or []
+    return {
+        "title": str(data.get('t') or ''),
+        "total_days": len(daily_plans),
+        "total_budget": _money(budget) if budget is not None else _money(sum(d['daily_total'] for d in daily_plans)),
+        "daily_plans": daily_plans,
+        "tips": [str(tip) for tip in (tips if isinstance(tips, list) else [tips])],
+        "special_notes": str(data.get('n') or '')
+    }
+
+
+def compact_plan(plan):
+    """完整方案转为紧凑格式（用于估算与基准测试）"""
+    return {
+        "t": plan.get('title', ''),
+        "d": [
+            ['|'.join(str(item.get(field, '')) for field in ROW_FIELDS) for item in day.get('schedule') or []]
+            for day in plan.get('daily_plans') or []
+        ],
+        "tips": plan.get('tips') or [],
+        "n": plan.get('special_notes', '')
+    }
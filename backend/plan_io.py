@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+需求/方案数据流式导入导出工具
+以服务端游标流式读取 user_demand / travel_plan 及归档存储中的方案，按块写出压缩文件（gzip JSONL，
+或安装pyarrow后的Parquet列式文件），导入时多线程并行批量插入；也支持在MySQL与SQLite之间直接流式迁移。
+归档中的方案导入到目标库的 travel_plan 热表，之后由目标库的归档任务重新归档
+
+用法：
+    python plan_io.py export <输出目录> [--source mysql|sqlite] [--format jsonl|parquet] [--chunk-rows 100000]
+    python plan_io.py import <输入目录> [--target mysql|sqlite] [--workers 4] [--batch 2000]
+    python plan_io.py copy --source sqlite --target mysql [--workers 4] [--batch 2000]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from database import Database, EXPORT_TABLES
+
+TABLE_COLUMNS = {
+    'user_demand': ('id', 'scene', 'days', 'budget', 'interest', 'demand', 'create_time'),
+    'travel_plan': ('id', 'demand_id', 'plan_content', 'create_time')
+}
+
+# 归档方案在导出文件中的表名，列与travel_plan相同，导入时写入travel_plan
+ARCHIVE_EXPORT = 'travel_plan_archive'
+TABLE_COLUMNS[ARCHIVE_EXPORT] = TABLE_COLUMNS['travel_plan']
+IMPORT_TARGETS = {ARCHIVE_EXPORT: 'travel_plan'}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def export_sources(db, batch_size):
+    """按导入顺序列出导出的表及其分批读取的行（需求表在前，满足外键）"""
+    sources = [(table, db.stream_rows(table, batch_size=batch_size)) for table in EXPORT_TABLES]
+    if db.archive.enabled:
+        sources.append((ARCHIVE_EXPORT, db.archive.iter_rows(batch_size)))
+    return sources
+
+
+def normalize_row(row, columns):
+    """将数据库行转换为可序列化的值（时间转为字符串，Decimal转为float）"""
+    normalized = {}
+    for column in columns:
+        value = row.get(column)
+        if isinstance(value, datetime):
+            value = value.isoformat(sep=' ')
+        elif isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = float(value)
+        normalized[column] = value
+    return normalized
+
+
+def _write_jsonl_chunk(path, rows):
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+
+
+def _read_jsonl_chunk(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_parquet_chunk(path, rows, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.table({column: [row[column] for row in rows] for column in columns})
+    pq.write_table(table, path, compression='zstd')
+
+
+def _read_parquet_chunk(path):
+    import pyarrow.parquet as pq
+    return pq.read_table(path).to_pylist()
+
+
+def export_data(db, output_dir, file_format='jsonl', chunk_rows=100000, batch_size=5000):
+    """流式导出全部表，每个表按 chunk_rows 行切分为压缩文件，并写出清单文件"""
+    if file_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("导出Parquet需要安装pyarrow: pip install pyarrow")
+
+    os.makedirs(output_dir, exist_ok=True)
+    extension = 'jsonl.gz' if file_format == 'jsonl' else 'parquet'
+    manifest = {"format": file_format, "tables": {}}
+
+    for table, batches in export_sources(db, batch_size):
+        columns = TABLE_COLUMNS[table]
+        chunks = []
+        buffer = []
+        total = 0
+
+        def flush():
+            name = f"{table}-{len(chunks):05d}.{extension}"
+            path = os.path.join(output_dir, name)
+            if file_format == 'jsonl':
+                _write_jsonl_chunk(path, buffer)
+            else:
+                _write_parquet_chunk(path, buffer, columns)
+            chunks.append({"file": name, "rows": len(buffer)})
+
+        started = time.time()
+        for rows in batches:
+            for row in rows:
+                buffer.append(normalize_row(row, columns))
+                if len(buffer) >= chunk_rows:
+                    flush()
+                    total += len(buffer)
+                    buffer = []
+        if buffer:
+            flush()
+            total += len(buffer)
+
+        manifest["tables"][table] = {"columns": list(columns), "rows": total, "chunks": chunks}
+        print(f"导出 {table}: {total} 行，{len(chunks)} 个文件，耗时 {time.time() - started:.1f} 秒")
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def check_columns(table, columns):
+    """校验清单中的列名：只允许该表已知的列（列名会拼入SQL语句），且必须包含id"""
+    allowed = TABLE_COLUMNS[table]
+    if not isinstance(columns, list) or 'id' not in columns or any(column not in allowed for column in columns):
+        raise ValueError(f"清单中 {table} 的列名无效: {columns!r}")
+    return tuple(columns)
+
+
+def insert_batch(db, table, columns, rows):
+    """批量插入一批行，返回 (插入数, 跳过数, 丢失数)
+
+    被跳过的行中，id已存在于目标表的视为重复（跳过），否则为违反外键等约束而未写入的行（丢失）
+    """
+    inserted = db.bulk_insert_rows(table, columns, rows)
+    skipped = len(rows) - inserted
+    if skipped <= 0:
+        return inserted, 0, 0
+    existing = db.count_existing_ids(table, [row['id'] for row in rows])
+    missing = max(len(rows) - existing, 0)
+    return inserted, skipped - missing, missing
+
+
+def _report(action, table, counts, elapsed):
+    inserted, skipped, missing = counts
+    print(f"{action} {table}: 插入 {inserted} 行，跳过已存在 {skipped} 行，"
+          f"未写入 {missing} 行，耗时 {elapsed:.1f} 秒（{inserted / elapsed if elapsed > 0 else 0:.0f} 行/秒）")
+    if missing:
+        print(f"警告: {table} 有 {missing} 行因外键等约束未写入，请检查源数据")
+
+
+def import_data(db, input_dir, workers=4, batch_size=2000):
+    """按清单并行导入各块文件（先导入需求表，再导入方案表以满足外键）
+
+    返回 {表名: {"inserted", "skipped", "missing"}}
+    """
+    with open(os.path.join(input_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    reader = _read_jsonl_chunk if manifest["format"] == 'jsonl' else _read_parquet_chunk
+    # SQLite同一时间只允许一个写事务，多线程写入只会互相等待
+    workers = 1 if db.use_sqlite else max(int(workers), 1)
+
+    def import_chunk(table, columns, chunk):
+        rows = reader(os.path.join(input_dir, chunk["file"]))
+        counts = [0, 0, 0]
+        for start in range(0, len(rows), batch_size):
+            for i, n in enumerate(insert_batch(db, table, columns, rows[start:start + batch_size])):
+                counts[i] += n
+        return counts
+
+    summary = {}
+    for table in EXPORT_TABLES + (ARCHIVE_EXPORT,):
+        info = manifest["tables"].get(table)
+        if not info:
+            continue
+        columns = check_columns(table, info["columns"])
+        target_table = IMPORT_TARGETS.get(table, table)
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(import_chunk, target_table, columns, chunk)
+                       for chunk in info["chunks"]]
+            counts = [sum(values) for values in zip(*(future.result() for future in futures))] or [0, 0, 0]
+        _report("导入", table, counts, time.time() - started)
+        summary[table] = dict(zip(("inserted", "skipped", "missing"), counts))
+    return summary
+
+
+def copy_data(source, target, workers=4, batch_size=2000):
+    """在两个数据库之间直接流式迁移：读取线程按批读取，写入线程并行批量插入
+
+    返回值与 import_data 相同
+    """
+    workers = 1 if target.use_sqlite else max(int(workers), 1)
+    summary = {}
+
+    for table, source_batches in export_sources(source, batch_size):
+        columns = TABLE_COLUMNS[table]
+        target_table = IMPORT_TARGETS.get(table, table)
+        batches = queue.Queue(maxsize=workers * 2)  # 有界队列，读快写慢时读取线程会阻塞
+        errors = []
+        counts = [0, 0, 0]
+        lock = threading.Lock()
+
+        def writer():
+            while True:
+                rows = batches.get()
+                if rows is None:
+                    break
+                try:
+                    result = insert_batch(target, target_table, columns, rows)
+                    with lock:
+                        for i, n in enumerate(result):
+                            counts[i] += n
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=writer, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        started = time.time()
+        for rows in source_batches:
+            if errors:
+                break
+            batches.put([normalize_row(row, columns) for row in rows])
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        _report("迁移", table, counts, time.time() - started)
+        summary[table] = dict(zip(("inserted", "skipped", "missing"), counts))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="需求/方案数据流式导入导出")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='导出数据')
+    export_parser.add_argument('output_dir')
+    export_parser.add_argument('--source', choices=['mysql', 'sqlite'])
+    export_parser.add_argument('--sqlite-path')
+    export_parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl')
+    export_parser.add_argument('--chunk-rows', type=int, default=100000)
+
+    import_parser = subparsers.add_parser('import', help='导入数据')
+    import_parser.add_argument('input_dir')
+    import_parser.add_argument('--target', choices=['mysql', 'sqlite'])
+    import_parser.add_argument('--sqlite-path')
+    import_parser.add_argument('--workers', type=int, default=4)
+    import_parser.add_argument('--batch', type=int, default=2000)
+
+    copy_parser = subparsers.add_parser('copy', help='在MySQL与SQLite之间直接迁移')
+    copy_parser.add_argument('--source', choices=['mysql', 'sqlite'], required=True)
+    copy_parser.add_argument('--target', choices=['mysql', 'sqlite'], required=True)
+    copy_parser.add_argument('--sqlite-path')
+    copy_parser.add_argument('--workers', type=int, default=4)
+    copy_parser.add_argument('--batch', type=int, default=2000)
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_data(Database(args.source, args.sqlite_path), args.output_dir,
+                    file_format=args.format, chunk_rows=args.chunk_rows)
+        return
+    if args.command == 'import':
+        summary = import_data(Database(args.target, args.sqlite_path), args.input_dir,
+                    workers=args.workers, batch_size=args.batch)
+    else:
+        if args.source == args.target:
+            parser.error("source与target不能相同")
+        summary = copy_data(Database(args.source, args.sqlite_path), Database(args.target, args.sqlite_path),
+                  workers=args.workers, batch_size=args.batch)
+    # 有行丢失时以非零状态退出，避免脚本化迁移误判为成功
+    if any(counts["missing"] for counts in summary.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旅游方案类型化模型
+以 __slots__ 类表示方案/每日行程/行程项，构造时校验并规范化字段；
+提供快速序列化（安装orjson时使用orjson，输出UTF-8字节）与紧凑的提示词渲染格式
+"""
+
+import json
+from budget_validator import to_number
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时退回标准库json
+    orjson = None
+
+
+class PlanValidationError(ValueError):
+    """方案结构不合法"""
+
+
+def _text(value, field):
+    """文本字段：None视为空字符串，数字转为字符串，其余类型不合法"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise PlanValidationError(f"{field}必须是字符串")
+
+
+def _number(value):
+    """金额字段：保留整数形式，便于与原JSON保持一致"""
+    number = to_number(value)
+    return int(number) if number.is_integer() else number
+
+
+def _extra(data, known_fields):
+    """收集模型未定义的字段，序列化时原样保留"""
+    extra = {key: value for key, value in data.items() if key not in known_fields}
+    return extra or None
+
+
+class ScheduleItem:
+    """单个行程项"""
+
+    __slots__ = ('time', 'attraction', 'transportation', 'dining', 'budget', 'extra')
+    FIELDS = ('time', 'attraction', 'transportation', 'dining', 'budget')
+
+    def __init__(self, time='', attraction='', transportation='', dining='', budget=0, extra=None):
+        self.time = _text(time, 'time')
+        self.attraction = _text(attraction, 'attraction')
+        self.transportation = _text(transportation, 'transportation')
+        self.dining = _text(dining, 'dining')
+        self.budget = _number(budget)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise PlanValidationError("行程项必须是对象")
+        return cls(
+            time=data.get('time'),
+            attraction=data.get('attraction'),
+            transportation=data.get('transportation'),
+            dining=data.get('dining'),
+            budget=data.get('budget'),
+            extra=_extra(data, cls.FIELDS)
+        )
+
+    def to_dict(self):
+        data = {
+            "time": self.time,
+            "attraction": self.attraction,
+            "transportation": self.transportation,
+            "dining": self.dining,
+            "budget": self.budget
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_prompt(self):
+        return f"{self.time}|{self.attraction}|{self.transportation}|{self.dining}|{self.budget}"
+
+
+class DayPlan:
+    """每日行程"""
+
+    __slots__ = ('day', 'date', 'schedule', 'daily_total', 'extra')
+    FIELDS = ('day', 'date', 'schedule', 'daily_total')
+
+    def __init__(self, day, date='', schedule=(), daily_total=0, extra=None):
+        try:
+            self.day = int(day)
+        except (TypeError, ValueError):
+            raise PlanValidationError("day必须是整数")
+        self.date = _text(date, 'date')
+        self.schedule = list(schedule)
+        self.daily_total = _number(daily_total)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data, default_day=1):
+        if not isinstance(data, dict):
+            raise PlanValidationError("每日行程必须是对象")
+        schedule = data.get('schedule') or []
+        if not isinstance(schedule, list):
+            raise PlanValidationError("schedule必须是数组")
+        return cls(
+            day=data.get('day', default_day),
+            date=data.get('date'),
+            schedule=[ScheduleItem.from_dict(item) for item in schedule],
+            daily_total=data.get('daily_total'),
+            extra=_extra(data, cls.FIELDS)
+        )
+
+    def to_dict(self):
+        data = {
+            "day": self.day,
+            "date": self.date,
+            "schedule": [item.to_dict() for item in self.schedule],
+            "daily_total": self.daily_total
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_prompt(self):
+        lines = [f"D{self.day} {self.date} 小计{self.daily_total}"]
+        lines.extend(item.to_prompt() for item in self.schedule)
+        return '\n'.join(lines)
+
+
+class TravelPlan:
+    """完整旅游方案"""
+
+    __slots__ = ('title', 'total_days', 'total_budget', 'daily_plans', 'tips', 'special_notes', 'extra')
+    FIELDS = ('title', 'total_days', 'total_budget', 'daily_plans', 'tips', 'special_notes')
+
+    def __init__(self, title='', total_days=None, total_budget=0, daily_plans=(), tips=(), special_notes='',
+                 extra=None):
+        self.title = _text(title, 'title')
+        self.daily_plans = list(daily_plans)
+        try:
+            self.total_days = int(total_days) if total_days not in (None, '') else len(self.daily_plans)
+        except (TypeError, ValueError):
+            raise PlanValidationError("total_days必须是整数")
+        self.total_budget = _number(total_budget)
+        self.tips = [_text(tip, 'tips') for tip in tips]
+        self.special_notes = _text(special_notes, 'special_notes')
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        """从方案字典构造并校验"""
+        if not isinstance(data, dict):
+            raise PlanValidationError("方案必须是对象")
+        if 'raw_content' in data:
+            raise PlanValidationError("方案不是结构化JSON")
+        daily_plans = data.get('daily_plans') or []
+        if not isinstance(daily_plans, list):
+            raise PlanValidationError("daily_plans必须是数组")
+        tips = data.get('tips') or []
+        if isinstance(tips, str):
+            tips = [tips]
+        if not isinstance(tips, list):
+            raise PlanValidationError("tips必须是数组")
+        return cls(
+            title=data.get('title'),
+            total_days=data.get('total_days'),
+            total_budget=data.get('total_budget'),
+            daily_plans=[DayPlan.from_dict(day, default_day=i + 1) for i, day in enumerate(daily_plans)],
+            tips=tips,
+            special_notes=data.get('special_notes'),
+            extra=_extra(data, cls.FIELDS)
+        )
+
+    @classmethod
+    def loads(cls, content):
+        """从JSON文本或字节反序列化"""
+        try:
+            data = orjson.loads(content) if orjson is not None else json.loads(content)
+        except (TypeError, ValueError) as e:
+            raise PlanValidationError(f"方案JSON格式错误: {e}")
+        return cls.from_dict(data)
+
+    def to_dict(self):
+        data = {
+            "title": self.title,
+            "total_days": self.total_days,
+            "total_budget": self.total_budget,
+            "daily_plans": [day.to_dict() for day in self.daily_plans],
+            "tips": list(self.tips),
+            "special_notes": self.special_notes
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def dumps(self):
+        """序列化为UTF-8 JSON字节（中文不转义）"""
+        return dumps_plan(self.to_dict())
+
+    def to_prompt(self):
+        """渲染为紧凑的提示词文本：每个行程项一行，字段以|分隔"""
+        lines = [
+            f"{self.title}|{self.total_days}天|预算{self.total_budget}",
+            "时间|景点|交通|餐饮|预算"
+        ]
+        lines.extend(day.to_prompt() for day in self.daily_plans)
+        if self.tips:
+            lines.append("贴士:" + "；".join(self.tips))
+        if self.special_notes:
+            lines.append("备注:" + self.special_notes)
+        if self.extra:
+            lines.append(dumps_plan(self.extra).decode('utf-8'))
+        return '\n'.join(lines)
+
+
+def dumps_plan(data):
+    """方案字典序列化为UTF-8 JSON字节"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def plan_to_prompt(plan):
+    """将方案字典渲染为提示词文本，无法按模型解析时退回紧凑JSON"""
+    try:
+        return TravelPlan.from_dict(plan).to_prompt()
+    except PlanValidationError:
+        return dumps_plan(plan).decode('utf-8')
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+接口限流模块
+按客户端（API Key或IP）与接口类别（input/generate/adjust）分别维护令牌桶，
+默认状态保存在进程内；配置共享文件后多个worker进程通过SQLite共享同一组令牌桶
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# 各接口类别的默认配额："次数/秒数"，桶容量等于次数
+DEFAULT_LIMITS = {
+    'input': '60/60',
+    'generate': '10/60',
+    'adjust': '30/60'
+}
+
+
+def parse_limit(text):
+    """解析"次数/秒数"格式的配额，返回 (桶容量, 每秒补充令牌数)，0或空表示不限流"""
+    try:
+        count, _, period = str(text).partition('/')
+        count = float(count)
+        period = float(period or 60)
+    except ValueError:
+        return None
+    if count <= 0 or period <= 0:
+        return None
+    return count, count / period
+
+
+class RateLimiter:
+    """令牌桶限流器"""
+
+    # 共享存储中清理已补满令牌桶的最小间隔（秒）
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, limits=None, shared_path=None, max_clients=None):
+        limits = limits or {
+            scope: os.getenv(f'RATE_LIMIT_{scope.upper()}', default)
+            for scope, default in DEFAULT_LIMITS.items()
+        }
+        self.limits = {}
+        for scope, text in limits.items():
+            parsed = parse_limit(text)
+            if parsed:
+                self.limits[scope] = parsed
+        # 进程内令牌桶：(类别, 客户端) -> [令牌数, 更新时间]，超过容量时淘汰最久未访问的客户端
+        self.max_clients = max_clients or int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000))
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = {scope: 0 for scope in self.limits}
+        self.rejected = {scope: 0 for scope in self.limits}
+
+        self.shared_path = shared_path or os.getenv('RATE_LIMIT_SHARED_PATH')
+        self._local = threading.local()
+        # 令牌桶闲置超过补满所需的最长时间后与新桶等价，可以删除
+        self.idle_seconds = max((capacity / rate for capacity, rate in self.limits.values()), default=0)
+        self._next_prune = 0.0
+        if self.shared_path:
+            try:
+                conn = self._connection()
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS rate_bucket (
+                        key TEXT PRIMARY KEY,
+                        tokens REAL NOT NULL,
+                        updated REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_bucket_updated ON rate_bucket (updated)')
+            except sqlite3.Error as e:
+                print(f"共享限流存储初始化失败: {e}，仅使用进程内限流")
+                self.shared_path = None
+
+    def _connection(self):
+        """获取当前线程的共享存储连接（自动提交模式，事务显式控制）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.shared_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _refill(tokens, updated, capacity, rate, now):
+        return min(capacity, tokens + (now - updated) * rate)
+
+    def _take_local(self, key, capacity, rate, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = self._refill(bucket[0], bucket[1], capacity, rate, now)
+                bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            return allowed, bucket[0]
+
+    def _take_shared(self, key, capacity, rate, now):
+        # 客户端标识可能包含API Key，共享文件中只保存其哈希
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else self._refill(row[0], row[1], capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_INTERVAL
+            self.prune_shared(now)
+        return allowed, tokens
+
+    def prune_shared(self, now=None):
+        """删除共享存储中已补满的令牌桶（闲置时间超过补满所需时间），返回删除的条数"""
+        if not self.shared_path:
+            return 0
+        now = time.time() if now is None else now
+        conn = self._connection()
+        try:
+            removed = conn.execute('DELETE FROM rate_bucket WHERE updated < ?', (now - self.idle_seconds,)).rowcount
+        except sqlite3.Error as e:
+            print(f"清理共享限流存储失败: {e}")
+            return 0
+        return removed
+
+    def check(self, scope, client_id):
+        """消耗一个令牌，返回 (是否允许, 响应头)；未配置该类别时不限流，返回 (True, None)"""
+        limit = self.limits.get(scope)
+        if limit is None:
+            return True, None
+        capacity, rate = limit
+        key = f"{scope}:{client_id}"
+        now = time.time()
+
+        if self.shared_path:
+            try:
+                allowed, tokens = self._take_shared(key, capacity, rate, now)
+            except sqlite3.Error as e:
+                print(f"共享限流存储访问失败: {e}，改用进程内限流")
+                allowed, tokens = self._take_local(key, capacity, rate, now)
+        else:
+            allowed, tokens = self._take_local(key, capacity, rate, now)
+
+        with self._lock:
+            if allowed:
+                self.allowed[scope] += 1
+            else:
+                self.rejected[scope] += 1
+
+        headers = {
+            'X-RateLimit-Limit': str(int(capacity)),
+            'X-RateLimit-Remaining': str(int(tokens)),
+            # 令牌桶补满所需秒数
+            'X-RateLimit-Reset': str(math.ceil((capacity - tokens) / rate))
+        }
+        if not allowed:
+            headers['Retry-After'] = str(max(1, math.ceil((1 - tokens) / rate)))
+        return allowed, headers
+
+    def stats(self):
+        """各类别配额与放行/拒绝次数"""
+        with self._lock:
+            return {
+                "limits": {
+                    scope: {"burst": capacity, "per_minute": round(rate * 60, 2)}
+                    for scope, (capacity, rate) in self.limits.items()
+                },
+                "shared": bool(self.shared_path),
+                "clients": len(self._buckets),
+                "allowed": dict(self.allowed),
+                "rejected": dict(self.rejected)
+            }
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求性能剖析模块
+定位方案接口变慢的原因：按阶段（JSON处理、数据库连接与查询、提示词构建、LLM排队、上游等待）累计每个请求的耗时，
+并在以下情况下收集调用栈：
+- 请求头 X-Profile: cprofile|stack（需同时携带有效的X-Admin-Key）或按 PROFILE_SAMPLE_RATE 随机抽样：
+  cprofile 对请求线程与其LLM任务线程做确定性剖析，stack 对请求全程做栈采样
+- 请求的本地耗时（不含LLM排队与等待模型响应的时间）超过 PROFILE_SLOW_MS 后：后台采样线程每
+  PROFILE_SAMPLE_INTERVAL_MS 毫秒采集请求线程及其LLM任务线程的调用栈（等待LLM期间不采集），统计最常出现的栈
+超过阈值或被剖析的请求写入慢请求日志（内存环形缓冲，PROFILE_LOG_SIZE条），包含阶段耗时与最常出现的栈；
+配置 PROFILE_SNAPSHOT_INTERVAL 后另有后台线程定期采集全部线程的调用栈快照
+
+空闲时的开销：每个请求只创建一个记录对象，阶段计时为两次perf_counter；采样线程只在有需要采样的请求时采集调用栈
+
+阶段耗时有嵌套关系：db 包含 db_connect，llm_task（在LLM工作线程中执行的部分）包含 prompt、upstream_llm、upstream_weather、llm_output_parse（解析模型输出）；
+other 为未归入任何阶段的耗时（参数校验、裁剪、Flask本身等）
+"""
+
+import cProfile
+import contextvars
+import functools
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from flask.json.provider import DefaultJSONProvider
+
+# 触发剖析的请求头（值为cprofile或stack）与响应中返回的剖析记录id
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_MODES = ('cprofile', 'stack')
+# 嵌套在其他阶段内的阶段（计算未归入任何阶段的耗时other时不重复扣除）
+NESTED_STAGES = ('db_connect', 'prompt', 'upstream_llm', 'upstream_weather', 'llm_output_parse')
+# 等待LLM的阶段：模型生成本身就需要数秒，判断慢请求时不计入
+LLM_WAIT_STAGES = ('llm_queue', 'upstream_llm')
+# 每个调用栈保留的帧数（从最内层开始）
+STACK_DEPTH = 12
+
+_current = contextvars.ContextVar('request_profile', default=None)
+# cProfile同一时间只对一个请求启用（Python 3.12起同一进程只能有一个剖析器处于启用状态）
+_cprofile_lock = threading.Lock()
+
+
+def format_stack(frame, depth=STACK_DEPTH):
+    """调用栈转为 "函数 (文件:行号)" 元组，最内层在前"""
+    frames = []
+    while frame is not None and len(frames) < depth:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return tuple(frames)
+
+
+def thread_stacks(exclude=()):
+    """全部线程当前的调用栈：[{"thread", "ident", "stack"}]"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return [
+        {"thread": names.get(ident, str(ident)), "ident": ident, "stack": list(format_stack(frame))}
+        for ident, frame in sys._current_frames().items()
+        if ident not in exclude
+    ]
+
+
+def top_stacks(samples, limit=5):
+    """出现次数最多的调用栈（samples的键为 (线程名, 调用栈)）"""
+    total = sum(samples.values())
+    return [
+        {"thread": thread, "stack": list(stack), "samples": count, "ratio": round(count / total, 3)}
+        for (thread, stack), count in samples.most_common(limit)
+    ]
+
+
+class RequestProfile:
+    """一个请求的剖析记录（请求线程与执行其LLM任务的线程共享）"""
+
+    def __init__(self, profile_id, method, path, mode=None):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.wall_start = time.time()
+        self.stages = {}
+        # 需要采样的线程：请求线程与正在执行其LLM任务的线程
+        self.threads = {threading.get_ident()}
+        self.samples = Counter()
+        # 已停止的cProfile剖析器（各线程一个），请求线程的剖析器在请求结束时停止
+        self.profilers = []
+        self._cprofile = None
+        self._open = set()
+        # 已提交但尚未开始执行的LLM任务数
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add_stage(self, name, ms):
+        with self._lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += ms
+            stage[1] += 1
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def llm_wait_ms(self):
+        """已结束的LLM排队与等待模型响应的耗时"""
+        with self._lock:
+            return sum(self.stages[name][0] for name in LLM_WAIT_STAGES if name in self.stages)
+
+    def waiting_on_llm(self):
+        """是否正在排队或等待模型响应"""
+        with self._lock:
+            return self._queued > 0 or any(name == 'upstream_llm' for _, name in list(self._open))
+
+
+class _Stage:
+    """阶段计时；同一线程内嵌套的同名阶段只计外层"""
+
+    __slots__ = ('name', 'profile', 'key', 'started')
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = _current.get()
+        self.key = None
+
+    def __enter__(self):
+        profile = self.profile
+        if profile is not None:
+            key = (threading.get_ident(), self.name)
+            if key not in profile._open:
+                profile._open.add(key)
+                self.key = key
+                self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.key is not None:
+            self.profile._open.discard(self.key)
+            self.profile.add_stage(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+def stage(name):
+    """累计当前请求在某阶段的耗时（不在被跟踪的请求中时不计时）：with stage('db'): ..."""
+    return _Stage(name)
+
+
+def profiled(name):
+    """把整个函数计入某阶段的装饰器"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfiledJSONProvider(DefaultJSONProvider):
+    """Flask JSON处理计入json阶段（请求体解析与jsonify响应序列化）"""
+
+    def dumps(self, obj, **kwargs):
+        with _Stage('json'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with _Stage('json'):
+            return super().loads(s, **kwargs)
+
+
+def _enable_cprofile():
+    """为当前线程启用cProfile，启用失败（已有剖析器处于启用状态）时返回None"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _cprofile_summary(profilers, limit):
+    """合并各线程的cProfile结果，按累计耗时取前limit个函数"""
+    stats = None
+    for profiler in profilers:
+        if stats is None:
+            stats = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+    if stats is None:
+        return []
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{func} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3)
+        }
+        for (filename, line, func), (_, calls, total, cumulative, _) in rows
+    ]
+
+
+class RequestProfiler:
+    """请求剖析器：跟踪进行中的请求，对慢请求采样调用栈，保存慢请求日志与全线程栈快照"""
+
+    def __init__(self, slow_ms=None, sample_rate=None, interval_ms=None, log_size=None,
+                 snapshot_interval=None, snapshot_keep=None, top_n=None):
+        # 慢请求阈值（毫秒，按不含LLM排队与等待的本地耗时判断），0表示只记录显式剖析的请求
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv('PROFILE_SLOW_MS', 1000))
+        # 随机抽样做cProfile剖析的请求比例
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        self.interval = (interval_ms if interval_ms is not None
+                         else float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 50))) / 1000
+        # 全线程栈快照间隔（秒），0表示不定期采集
+        self.snapshot_interval = (snapshot_interval if snapshot_interval is not None
+                                  else float(os.getenv('PROFILE_SNAPSHOT_INTERVAL', 0)))
+        self.top_n = top_n or int(os.getenv('PROFILE_TOP_N', 30))
+        self._log = deque(maxlen=log_size or int(os.getenv('PROFILE_LOG_SIZE', 100)))
+        self._snapshots = deque(maxlen=snapshot_keep or int(os.getenv('PROFILE_SNAPSHOT_KEEP', 120)))
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._snapshotter = None
+        self.requests = 0
+        self.slow_requests = 0
+        self.profiled_requests = 0
+        self.stack_samples = 0
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            with self._lock:
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+                    self._sampler.start()
+
+    def start(self):
+        """启动后台线程：慢请求采样（PROFILE_SLOW_MS>0时）与定期全线程栈快照（PROFILE_SNAPSHOT_INTERVAL>0时）"""
+        if self.slow_ms > 0:
+            self._ensure_sampler()
+        if self.snapshot_interval > 0 and self._snapshotter is None:
+            self._snapshotter = threading.Thread(target=self._snapshot_loop, name='profile-snapshot', daemon=True)
+            self._snapshotter.start()
+
+    def begin(self, method, path, mode=None):
+        """开始跟踪当前线程中的请求；mode为cprofile/stack时对请求做剖析，否则按抽样率决定"""
+        if mode is None and self.sample_rate > 0 and random.random() < self.sample_rate:
+            mode = 'cprofile'
+        profile = RequestProfile(next(self._ids), method, path, mode)
+        profile._token = _current.set(profile)
+        with self._lock:
+            self._active[profile.id] = profile
+            self.requests += 1
+        if mode == 'cprofile':
+            if _cprofile_lock.acquire(blocking=False):
+                profile._cprofile = _enable_cprofile()
+                if profile._cprofile is None:
+                    _cprofile_lock.release()
+                    profile.mode = 'stack'
+            else:
+                # 已有请求在做cProfile剖析时改为栈采样
+                profile.mode = 'stack'
+        if profile.mode == 'stack':
+            self._ensure_sampler()
+        return profile
+
+    def end(self, profile, status):
+        """请求结束：停止剖析；慢请求或被剖析的请求写入慢请求日志并返回日志记录"""
+        duration_ms = profile.elapsed_ms()
+        if profile._cprofile is not None:
+            profile._cprofile.disable()
+            with profile._lock:
+                profile.profilers.append(profile._cprofile)
+            profile._cprofile = None
+            _cprofile_lock.release()
+        with self._lock:
+            self._active.pop(profile.id, None)
+        if profile._token is not None:
+            try:
+                _current.reset(profile._token)
+            except ValueError:
+                # 不在开始跟踪时的上下文中（如teardown阶段），直接清除
+                _current.set(None)
+            profile._token = None
+
+        local_ms = duration_ms - profile.llm_wait_ms()
+        slow = self.slow_ms > 0 and local_ms >= self.slow_ms
+        if not slow and not profile.mode:
+            return None
+        entry = self._entry(profile, status, duration_ms, slow)
+        entry["local_ms"] = round(max(local_ms, 0.0), 2)
+        with self._lock:
+            self._log.append(entry)
+            self.slow_requests += slow
+            self.profiled_requests += bool(profile.mode)
+        if slow:
+            breakdown = ', '.join(f"{name} {item['ms']:.0f}ms" for name, item in entry['stages'].items())
+            print(f"慢请求 {profile.method} {profile.path} 状态{status} 耗时{duration_ms:.0f}ms"
+                  f"（本地{local_ms:.0f}ms）: {breakdown}")
+        return entry
+
+    def _entry(self, profile, status, duration_ms, slow):
+        with profile._lock:
+            stages = {
+                name: {"ms": round(ms, 2), "count": count}
+                for name, (ms, count) in sorted(profile.stages.items(), key=lambda item: -item[1][0])
+            }
+            profilers = list(profile.profilers)
+            samples = Counter(profile.samples)
+        accounted = sum(item["ms"] for name, item in stages.items() if name not in NESTED_STAGES)
+        stages["other"] = {"ms": round(max(duration_ms - accounted, 0.0), 2), "count": 1}
+        return {
+            "id": profile.id,
+            "time": profile.wall_start,
+            "method": profile.method,
+            "path": profile.path,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "slow": slow,
+            "mode": profile.mode,
+            "stages": stages,
+            "stack_samples": sum(samples.values()),
+            "top_stacks": top_stacks(samples),
+            "cprofile": _cprofile_summary(profilers, self.top_n) if profilers else None
+        }
+
+    def bind(self, fn):
+        """把当前请求的剖析记录带到执行LLM任务的工作线程：记录排队耗时（llm_queue）与任务耗时（llm_task），
+        并把工作线程加入栈采样；不在被跟踪的请求中时原样返回fn"""
+        profile = _current.get()
+        if profile is None:
+            return fn
+        submitted = time.perf_counter()
+        with profile._lock:
+            profile._queued += 1
+
+        @functools.wraps(fn)
+        def task(*args, **kwargs):
+            started = time.perf_counter()
+            profile.add_stage('llm_queue', (started - submitted) * 1000)
+            ident = threading.get_ident()
+            token = _current.set(profile)
+            with profile._lock:
+                profile._queued -= 1
+                profile.threads.add(ident)
+            profiler = _enable_cprofile() if profile.mode == 'cprofile' else None
+            try:
+                with _Stage('llm_task'):
+                    return fn(*args, **kwargs)
+            finally:
+                with profile._lock:
+                    if profiler is not None:
+                        # 请求已经结束（等待超时）时结果不再计入
+                        profiler.disable()
+                        profile.profilers.append(profiler)
+                    profile.threads.discard(ident)
+                _current.reset(token)
+        return task
+
+    def _sample_loop(self):
+        """对被剖析的请求全程、其余请求在本地耗时超过慢请求阈值后采集调用栈（不同请求的线程之间互不干扰）"""
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                active = list(self._active.values())
+            targets = [
+                profile for profile in active
+                if profile.mode == 'stack' or (
+                    self.slow_ms > 0 and not profile.waiting_on_llm()
+                    and (now - profile.started) * 1000 - profile.llm_wait_ms() >= self.slow_ms
+                )
+            ]
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = 0
+            for profile in targets:
+                with profile._lock:
+                    for ident in profile.threads:
+                        frame = frames.get(ident)
+                        if frame is not None and ident != own:
+                            profile.samples[(names.get(ident, str(ident)), format_stack(frame))] += 1
+                            sampled += 1
+            del frames
+            with self._lock:
+                self.stack_samples += sampled
+
+    def _snapshot_loop(self):
+        own = {threading.get_ident()}
+        while True:
+            time.sleep(self.snapshot_interval)
+            snapshot = {"time": time.time(), "threads": thread_stacks(exclude=own)}
+            with self._lock:
+                self._snapshots.append(snapshot)
+
+    def snapshot(self):
+        """当前全部线程的调用栈"""
+        return {"time": time.time(), "threads": thread_stacks(exclude={threading.get_ident()})}
+
+    def snapshot_history(self):
+        """定期快照汇总：各线程（按名称）最常出现的调用栈"""
+        with self._lock:
+            snapshots = list(self._snapshots)
+        by_thread = {}
+        for snapshot in snapshots:
+            for thread in snapshot["threads"]:
+                by_thread.setdefault(thread["thread"], Counter())[(thread["thread"], tuple(thread["stack"]))] += 1
+        return {
+            "interval": self.snapshot_interval,
+            "snapshots": len(snapshots),
+            "since": snapshots[0]["time"] if snapshots else None,
+            "threads": {name: top_stacks(samples, 3) for name, samples in sorted(by_thread.items())}
+        }
+
+    def recent(self, limit=20, slow_only=False):
+        """最近的慢请求/剖析记录摘要（新的在前，不含调用栈与cProfile结果）"""
+        with self._lock:
+            entries = [entry for entry in reversed(self._log) if entry["slow"] or not slow_only][:limit]
+        return [
+            {key: entry[key] for key in ("id", "time", "method", "path", "status", "duration_ms", "slow", "mode",
+                                         "stages")}
+            for entry in entries
+        ]
+
+    def get(self, profile_id):
+        with self._lock:
+            for entry in self._log:
+                if entry["id"] == profile_id:
+                    return entry
+        return None
+
+    def in_flight(self):
+        """进行中的请求及已耗时"""
+        with self._lock:
+            profiles = list(self._active.values())
+        return [
+            {"id": p.id, "method": p.method, "path": p.path, "elapsed_ms": round(p.elapsed_ms(), 2), "mode": p.mode}
+            for p in profiles
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slow_ms": self.slow_ms,
+                "sample_rate": self.sample_rate,
+                "snapshot_interval": self.snapshot_interval,
+                "requests": self.requests,
+                "in_flight": len(self._active),
+                "slow_requests": self.slow_requests,
+                "profiled_requests": self.profiled_requests,
+                "stack_samples": self.stack_samples,
+                "logged": len(self._log)
+            }
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应压缩与方案裁剪模块
+按Accept-Encoding协商brotli（安装brotli时）或gzip压缩JSON响应；
+按 fields / days 参数裁剪方案，客户端只获取摘要或需要的天数
+"""
+
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只支持gzip
+    brotli = None
+
+# 低于该字节数的响应不压缩（压缩收益抵不过开销）
+COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.getenv('RESPONSE_COMPRESS_LEVEL', 6))
+
+# fields=summary 对应的方案字段
+SUMMARY_FIELDS = ('title', 'total_days', 'total_budget', 'tips', 'special_notes')
+# 裁剪参数days允许的最大天数（范围按天展开为集合，需要限制上限）
+PROJECTION_MAX_DAYS = int(os.getenv('PROJECTION_MAX_DAYS', 365))
+
+
+def choose_encoding(accept_encoding):
+    """从Accept-Encoding中选择服务端支持且q值最高的编码（同q值优先br）"""
+    supported = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best = None
+    best_q = 0.0
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == '*':
+            name = supported[0]
+        if name in supported and (q > best_q or (q == best_q and best == 'gzip' and name == 'br')):
+            best, best_q = name, q
+    return best
+
+
+def compress_response(response, accept_encoding):
+    """按客户端支持的编码压缩JSON响应（就地修改并返回response）"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    if encoding == 'br':
+        # brotli质量参数为0-11，与gzip级别大致对应
+        body = brotli.compress(body, quality=min(COMPRESS_LEVEL, 11))
+    else:
+        body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def parse_projection(fields=None, days=None):
+    """解析 fields（逗号分隔的方案字段或summary）与 days（逗号分隔的天数），返回 (字段元组或None, 天数集合或None)"""
+    selected_fields = None
+    if fields:
+        names = []
+        for name in str(fields).split(','):
+            name = name.strip()
+            if name == 'summary':
+                names.extend(SUMMARY_FIELDS)
+            elif name:
+                names.append(name)
+        selected_fields = tuple(dict.fromkeys(names))
+
+    selected_days = None
+    if days:
+        selected_days = set()
+        for part in str(days).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            start, _, end = part.partition('-')
+            try:
+                start, end = int(start), int(end or start)
+            except ValueError:
+                raise ValueError("days格式应为逗号分隔的天数或范围，例如 1,3-4")
+            if not 1 <= start <= end <= PROJECTION_MAX_DAYS:
+                raise ValueError(f"days中的天数应在1到{PROJECTION_MAX_DAYS}之间，且范围起点不大于终点")
+            selected_days.update(range(start, end + 1))
+        # 指定天数时自动包含daily_plans字段
+        if selected_fields is not None and 'daily_plans' not in selected_fields:
+            selected_fields += ('daily_plans',)
+    return selected_fields, selected_days
+
+
+def _day_number(day, default):
+    try:
+        return int(day.get('day', default))
+    except (TypeError, ValueError):
+        return default
+
+
+def project_plan(plan, fields=None, days=None):
+    """按字段与天数裁剪方案（返回新字典，不修改原方案）"""
+    if not isinstance(plan, dict) or (fields is None and days is None):
+        return plan
+    projected = {key: value for key, value in plan.items() if fields is None or key in fields}
+    if days is not None and isinstance(projected.get('daily_plans'), list):
+        projected['daily_plans'] = [
+            day for i, day in enumerate(projected['daily_plans'])
+            if isinstance(day, dict) and _day_number(day, i + 1) in days
+        ]
+    return projected
+
+
+def plan_etag(plan_id, fields=None, days=None):
+    """方案写入后不再修改，ETag只取决于方案id与裁剪参数，命中时无需读取方案内容"""
+    projection = f"{','.join(fields or ())}|{','.join(map(str, sorted(days or ())))}"
+    digest = hashlib.sha1(f"{plan_id}|{projection}".encode('utf-8')).hexdigest()[:16]
+    # 同一内容可能以不同编码返回，使用弱校验器
+    return f'W/"plan-{plan_id}-{digest}"'
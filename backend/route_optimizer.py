@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行程路线优化模块
+基于离线预计算的景点间通行时间矩阵，在本地重排每日景点顺序以减少往返奔波，无需调用LLM
+
+矩阵文件格式（JSON，按城市存放于 ROUTE_MATRIX_DIR/<城市>.json）：
+{
+    "places": ["故宫博物院", "天坛公园", ...],
+    "minutes": [[0, 25, ...], [25, 0, ...], ...],
+    "time_windows": {"故宫博物院": ["08:30", "16:00"]}
+}
+
+离线构建矩阵（坐标文件格式：{"故宫博物院": {"location": [116.397, 39.918], "open": "08:30", "close": "16:00"}}）：
+    python route_optimizer.py build coords.json route_matrix/北京.json
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import numpy as np
+
+# 时间窗违规惩罚（分钟），远大于任何实际通行时间
+WINDOW_PENALTY = 10000
+
+_matrix_cache = {}
+_matrix_lock = threading.Lock()
+
+
+def parse_minutes(text):
+    """将"09:30"转换为当天分钟数，无法解析时返回None"""
+    try:
+        hour, minute = str(text).strip().split(':')[:2]
+        return int(hour) * 60 + int(minute[:2])
+    except (ValueError, AttributeError):
+        return None
+
+
+def slot_start(time_range):
+    """获取"09:00-11:00"格式时间段的开始分钟数"""
+    if not time_range:
+        return None
+    return parse_minutes(str(time_range).replace('～', '-').replace('~', '-').split('-')[0])
+
+
+class PlaceIndex:
+    """按景点名称编号的数据（通行时间矩阵、人流量曲线共用）：名称查找与开放时间窗"""
+
+    def __init__(self, places, time_windows=None):
+        self.places = list(places)
+        self.index = {name: i for i, name in enumerate(self.places)}
+        self.windows = {}
+        for name, window in (time_windows or {}).items():
+            if name in self.index and window and len(window) == 2:
+                self.windows[self.index[name]] = (parse_minutes(window[0]), parse_minutes(window[1]))
+
+    def lookup(self, attraction):
+        """按景点名称查找下标（先精确匹配，再做包含匹配）"""
+        if not attraction:
+            return None
+        attraction = str(attraction).strip()
+        if attraction in self.index:
+            return self.index[attraction]
+        for name, i in self.index.items():
+            if name in attraction or attraction in name:
+                return i
+        return None
+
+    def outside_window(self, place, start):
+        """在start分钟开始游览是否不在景点的开放时间内（没有时间窗或时间未知时视为开放）"""
+        window = self.windows.get(place)
+        if not window or start is None:
+            return False
+        open_at, close_at = window
+        return (open_at is not None and start < open_at) or (close_at is not None and start >= close_at)
+
+
+class DistanceMatrix(PlaceIndex):
+    """景点通行时间矩阵"""
+
+    def __init__(self, places, minutes, time_windows=None):
+        super().__init__(places, time_windows)
+        self.minutes = np.asarray(minutes, dtype=np.float64)
+
+    @classmethod
+    def load(cls, path):
+        """从JSON文件加载矩阵"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['places'], data['minutes'], data.get('time_windows'))
+
+
+def city_data_path(data_dir, city):
+    """城市数据文件路径 <目录>/<城市>.json；城市名来自请求参数，含路径分隔符或..等时返回None"""
+    city = str(city or '').strip()
+    if not city or city.startswith('.') or '..' in city or '\0' in city \
+            or any(sep in city for sep in ('/', '\\', os.sep)):
+        return None
+    base = os.path.realpath(data_dir)
+    path = os.path.realpath(os.path.join(base, f"{city}.json"))
+    if os.path.dirname(path) != base:
+        return None
+    return path
+
+
+def load_city_matrix(city, matrix_dir=None):
+    """加载城市矩阵（按文件修改时间缓存，文件不存在或城市名不合法时返回None）"""
+    matrix_dir = matrix_dir or os.getenv('ROUTE_MATRIX_DIR', 'route_matrix')
+    path = city_data_path(matrix_dir, city)
+    if path is None:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _matrix_lock:
+        cached = _matrix_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        matrix = DistanceMatrix.load(path)
+        _matrix_cache[path] = (mtime, matrix)
+        return matrix
+
+
+def travel_minutes(order, nodes, matrix):
+    """给定访问顺序的实际通行分钟数（不含时间窗惩罚）"""
+    return float(sum(matrix.minutes[nodes[a], nodes[b]] for a, b in zip(order, order[1:])))
+
+
+def route_cost(order, nodes, slot_times, matrix):
+    """计算给定访问顺序的优化目标：通行时间 + 时间窗违规惩罚"""
+    cost = travel_minutes(order, nodes, matrix)
+    for position, k in enumerate(order):
+        if matrix.outside_window(nodes[k], slot_times[position]):
+            cost += WINDOW_PENALTY
+    return cost
+
+
+def _nearest_neighbour(start, nodes, slot_times, matrix):
+    """从指定起点出发的最近邻构造，优先选择满足下一时段时间窗的景点"""
+    order = [start]
+    remaining = set(range(len(nodes))) - {start}
+    while remaining:
+        current = nodes[order[-1]]
+        start_time = slot_times[len(order)]
+
+        def step_cost(k):
+            cost = matrix.minutes[current, nodes[k]]
+            if matrix.outside_window(nodes[k], start_time):
+                cost += WINDOW_PENALTY
+            return cost
+
+        best = min(sorted(remaining), key=step_cost)
+        order.append(best)
+        remaining.remove(best)
+    return order
+
+
+def _two_opt(order, nodes, slot_times, matrix):
+    """2-opt局部搜索：反转子路径，直到无法再改进"""
+    best_cost = route_cost(order, nodes, slot_times, matrix)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 1):
+            for k in range(i + 1, len(order)):
+                candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                cost = route_cost(candidate, nodes, slot_times, matrix)
+                if cost < best_cost - 1e-9:
+                    order, best_cost = candidate, cost
+                    improved = True
+    return order, best_cost
+
+
+def optimize_order(nodes, slot_times, matrix):
+    """为一组景点求解较优访问顺序（最近邻 + 2-opt），返回(顺序, 优化后耗时, 原始耗时)"""
+    identity = list(range(len(nodes)))
+    original_cost = route_cost(identity, nodes, slot_times, matrix)
+    if len(nodes) < 2:
+        return identity, original_cost, original_cost
+
+    best_order, best_cost = identity, original_cost
+    for start in range(len(nodes)):
+        order, cost = _two_opt(_nearest_neighbour(start, nodes, slot_times, matrix), nodes, slot_times, matrix)
+        if cost < best_cost - 1e-9:
+            best_order, best_cost = order, cost
+    return best_order, best_cost, original_cost
+
+
+def optimize_day_schedule(schedule, matrix):
+    """重排单日行程：时间段保持不变，仅调整各时段对应的景点
+
+    返回(新行程, 节省的通行分钟数)；节省分钟数不含时间窗惩罚，为满足开放时间而重排时可能为负；
+    没有更优顺序时原样返回schedule
+    """
+    positions = []
+    nodes = []
+    for position, item in enumerate(schedule):
+        if isinstance(item, dict):
+            node = matrix.lookup(item.get('attraction'))
+            if node is not None:
+                positions.append(position)
+                nodes.append(node)
+
+    # 矩阵中查不到的景点保持原位，只在可识别的景点之间重排
+    if len(nodes) < 2 or len(set(nodes)) != len(nodes):
+        return schedule, 0.0
+
+    slot_times = [slot_start(schedule[p].get('time')) for p in positions]
+    order, best_cost, original_cost = optimize_order(nodes, slot_times, matrix)
+    if best_cost >= original_cost:
+        return schedule, 0.0
+
+    new_schedule = list(schedule)
+    for slot, k in zip(positions, order):
+        item = dict(schedule[positions[k]])
+        item['time'] = schedule[slot].get('time')
+        new_schedule[slot] = item
+    saved = travel_minutes(list(range(len(nodes))), nodes, matrix) - travel_minutes(order, nodes, matrix)
+    return new_schedule, saved
+
+
+def optimize_plan_route(plan, matrix):
+    """对方案中每天的景点顺序进行路线优化，返回(新方案, 总共节省的通行分钟数)"""
+    daily_plans = plan.get('daily_plans') if isinstance(plan, dict) else None
+    if not isinstance(daily_plans, list):
+        return plan, 0.0
+
+    saved_total = 0.0
+    new_days = []
+    for day in daily_plans:
+        schedule = day.get('schedule') if isinstance(day, dict) else None
+        if not isinstance(schedule, list):
+            new_days.append(day)
+            continue
+        new_schedule, saved = optimize_day_schedule(schedule, matrix)
+        saved_total += saved
+        if new_schedule is not schedule:
+            day = dict(day)
+            day['schedule'] = new_schedule
+        new_days.append(day)
+
+    new_plan = dict(plan)
+    new_plan['daily_plans'] = new_days
+    return new_plan, saved_total
+
+
+def build_matrix(coords, speed_kmh=25.0, detour_factor=1.3):
+    """根据经纬度坐标离线构建通行时间矩阵（球面距离 × 绕行系数 / 平均速度）"""
+    places = list(coords.keys())
+    locations = np.radians(np.asarray([coords[name]['location'] for name in places], dtype=np.float64))
+    lng, lat = locations[:, 0], locations[:, 1]
+
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlng / 2) ** 2
+    distance_km = 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    minutes = np.round(distance_km * detour_factor / speed_kmh * 60, 1)
+
+    time_windows = {
+        name: [info['open'], info['close']]
+        for name, info in coords.items()
+        if info.get('open') and info.get('close')
+    }
+    return {"places": places, "minutes": minutes.tolist(), "time_windows": time_windows}
+
+
+def main():
+    """命令行入口：python route_optimizer.py build <坐标文件> <输出矩阵文件> [平均速度km/h]"""
+    if len(sys.argv) < 4 or sys.argv[1] != 'build':
+        print("用法: python route_optimizer.py build <坐标文件> <输出矩阵文件> [平均速度km/h]")
+        sys.exit(1)
+
+    with open(sys.argv[2], 'r', encoding='utf-8') as f:
+        coords = json.load(f)
+    speed = float(sys.argv[4]) if len(sys.argv) > 4 else 25.0
+    matrix = build_matrix(coords, speed_kmh=speed)
+
+    output_dir = os.path.dirname(sys.argv[3])
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(sys.argv[3], 'w', encoding='utf-8') as f:
+        json.dump(matrix, f, ensure_ascii=False)
+    print(f"通行时间矩阵已生成: {sys.argv[3]}（{len(matrix['places'])} 个景点）")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,25 +2,163 @@ import dashscope
 import requests
 import json
 import os
+import time
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
+from budget_validator import validate_plan_budget, rebalance_plan_budget, plan_to_arrays, to_number
+from route_optimizer import load_city_matrix, optimize_plan_route
+from crowd_data import load_crowd_provider, shift_plan_crowds, apply_replacements
+from llm_cache import LLMResponseCache, request_key
+from shared_cache import get_shared_cache
+from traffic_capture import get_traffic_recorder, get_upstream_replay, llm_response_record
+from request_profiler import stage
+from model_router import ModelRouter, TASK_GENERATE, TASK_CROWD
+from plan_model import plan_to_prompt
+from plan_compact import expand_plan, format_instructions as plan_format_instructions
+from token_budget import (
+    TokenRateLimiter, estimate_messages_tokens, fit_max_tokens, size_plan_max_tokens,
+    plan_density, compact_json, summarize_weather
+)
 
 # 加载环境变量
 load_dotenv()
 
+def is_plan_json(content):
+    """模型输出能否解析为JSON对象"""
+    try:
+        return isinstance(json.loads(content), dict)
+    except (TypeError, ValueError):
+        return False
+
 class AIGCService:
     def __init__(self):
         # 设置DashScope API密钥
         dashscope.api_key = os.getenv('DASHSCOPE_API_KEY')
         # 高德地图API密钥
         self.amap_key = os.getenv('AMAP_API_KEY')
+        # 预算再平衡方式：scale（按比例缩放）或 trim（裁剪最贵项目）
+        self.budget_rebalance_mode = os.getenv('BUDGET_REBALANCE_MODE', 'scale')
+        # LLM响应缓存（以完整请求哈希为键）
+        self.llm_cache = LLMResponseCache()
+        # 模型上下文窗口与单次输出上限（token）
+        self.context_window = int(os.getenv('LLM_CONTEXT_WINDOW', 30000))
+        self.max_output_tokens = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', 8000))
+        # 每分钟token配额（0表示不限制），额度不足时最多排队等待的秒数
+        self.token_limiter = TokenRateLimiter(
+            int(os.getenv('LLM_TOKENS_PER_MINUTE', 0)),
+            max_wait=float(os.getenv('LLM_TOKEN_QUEUE_WAIT', 5))
+        )
+        # 多模型路由：按任务选择模型档位，失败回退，可选对冲请求
+        self.model_router = ModelRouter()
+        # 跨进程共享缓存层（天气等外部接口结果在各worker之间共享）与天气缓存有效期（秒）
+        self.shared_cache = get_shared_cache()
+        self.weather_ttl = float(os.getenv('WEATHER_CACHE_TTL', 1800))
+        # 景点人流量数据源与高峰热度阈值（0-100）
+        self.crowd_provider = load_crowd_provider()
+        self.crowd_peak_level = float(os.getenv('CROWD_PEAK_LEVEL', 80))
+        # 生成方案的输出格式：compact（短键名+行程行，本地展开）或 json（完整JSON）
+        self.compact_output = os.getenv('PLAN_OUTPUT_FORMAT', 'compact') != 'json'
+        # 流量录制（记录上游响应）与回放模式（上游响应从录制文件返回）
+        self.traffic_recorder = get_traffic_recorder()
+        self.upstream_replay = get_upstream_replay()
     
-    def generate_travel_plan(self, scene, days, budget, interest, demand):
-        """使用qwen3-max生成旅游方案"""
-        try:
-            # 构建提示词模板
-            prompt = f"""作为{scene}规划师，基于{days}天/{budget}元/{interest}，生成含{demand}的行程。
+    def call_llm(self, messages, model='qwen-max', max_tokens=2000, temperature=0.7, validate=None,
+                 use_cache=True):
+        """调用DashScope生成接口（带响应缓存），返回 {"success", "content"/"error"}
 
-请按照以下JSON格式输出旅游方案：
+        validate(content) 为False或输出因max_tokens被截断时不写入缓存，避免重复返回无法使用的结果；
+        use_cache为False时（强制重新生成）不读取缓存，新的结果仍会写入
+        """
+        # 在模型上下文窗口内确定本次输出上限
+        with stage('prompt'):
+            prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_max_tokens(prompt_tokens, min(max_tokens, self.max_output_tokens), self.context_window)
+        if max_tokens is None:
+            return {"success": False, "error": "提示词过长，超出模型上下文窗口"}
+        
+        request = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        cached_content = self.llm_cache.get(request) if use_cache else None
+        if cached_content is not None:
+            return {"success": True, "content": cached_content, "cached": True}
+        
+        # 按最坏情况预占每分钟token额度，额度不足时排队或直接拒绝
+        reservation = self.token_limiter.acquire(prompt_tokens + max_tokens)
+        if reservation is None:
+            return {"success": False, "error": "LLM调用额度已满，请稍后重试", "throttled": True}
+        
+        used_tokens = prompt_tokens
+        try:
+            started = time.perf_counter()
+            if self.upstream_replay is not None:
+                # 回放模式：从录制文件返回上游响应
+                response = self.upstream_replay.llm(request_key(**request))
+                if response is None:
+                    return {"success": False, "error": "回放数据中没有对应的LLM响应"}
+            else:
+                with stage('upstream_llm'):
+                    response = dashscope.Generation.call(
+                        model=model,
+                        messages=messages,
+                        result_format='message',
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+            if self.traffic_recorder is not None:
+                self.traffic_recorder.record_upstream('llm', request_key(**request), llm_response_record(response),
+                                                      (time.perf_counter() - started) * 1000)
+            
+            # 检查响应状态
+            if response.status_code != 200:
+                return {"success": False, "error": f"API调用失败: {response.message}"}
+            
+            usage = getattr(response, 'usage', None)
+            if usage:
+                used_tokens = (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+            else:
+                used_tokens = prompt_tokens + max_tokens
+            choice = response.output.choices[0]
+            content = choice.message.content
+            truncated = getattr(choice, 'finish_reason', None) == 'length'
+        finally:
+            self.token_limiter.settle(reservation, used_tokens)
+        
+        if not truncated and (validate is None or validate(content)):
+            self.llm_cache.put(request, content)
+        return {"success": True, "content": content, "cached": False}
+    
+    def call_routed(self, task, messages, max_tokens=2000, temperature=0.7, plan_items=None, use_cache=True):
+        """按任务路由选择模型调用，输出不是JSON对象时回退到下一个模型"""
+        return self.model_router.call(
+            lambda model: self.call_llm(messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                                        validate=is_plan_json, use_cache=use_cache),
+            task,
+            plan_items=plan_items,
+            validate=is_plan_json
+        )
+    
+    def ensure_plan_budget(self, plan, budget):
+        """本地校验方案预算，超支或每日小计不一致时直接再平衡，无需再次调用LLM修正"""
+        if not isinstance(plan, dict) or "raw_content" in plan or not budget:
+            return plan
+        
+        report = validate_plan_budget(plan, budget)
+        if report["valid"]:
+            return plan
+        return rebalance_plan_budget(plan, budget, mode=self.budget_rebalance_mode)
+    
+    def output_instructions(self, days, budget, demand=None, compact=None):
+        """方案输出格式说明（compact为None时按 PLAN_OUTPUT_FORMAT 配置选择紧凑格式或完整JSON结构）"""
+        if compact is None:
+            compact = self.compact_output
+        if compact:
+            return plan_format_instructions(days, budget, demand)
+        notes = f"{demand}相关注意事项" if demand else "注意事项"
+        return f"""请按照以下JSON格式输出旅游方案：
 {{
     "title": "旅游方案标题",
     "total_days": {days},
@@ -42,8 +180,27 @@ class AIGCService:
         }}
     ],
     "tips": ["旅游小贴士1", "旅游小贴士2"],
-    "special_notes": "{demand}相关注意事项"
-}}
+    "special_notes": "{notes}"
+}}"""
+
+    def build_plan_prompt(self, scene, days, budget, interest, demand, compact=None):
+        """构建生成方案的提示词（compact为None时按 PLAN_OUTPUT_FORMAT 配置选择输出格式）"""
+        if compact is None:
+            compact = self.compact_output
+        if compact:
+            return f"""作为{scene}规划师，基于{days}天/{budget}元/{interest}，生成含{demand}的行程。
+
+{self.output_instructions(days, budget, demand, compact=True)}
+
+请确保：
+1. 每个行程项包含时间、景点、交通、餐饮、预算
+2. 总预算控制在{budget}元以内
+3. 充分考虑{interest}兴趣偏好
+4. 满足{demand}特殊需求"""
+
+        return f"""作为{scene}规划师，基于{days}天/{budget}元/{interest}，生成含{demand}的行程。
+
+{self.output_instructions(days, budget, demand, compact=False)}
 
 请确保：
 1. 每日行程包含时间、景点、交通、餐饮、预算
@@ -51,39 +208,52 @@ class AIGCService:
 3. 充分考虑{interest}兴趣偏好
 4. 满足{demand}特殊需求
 5. 返回标准JSON格式"""
+    
+    def generate_travel_plan(self, scene, days, budget, interest, demand, refresh=False):
+        """使用qwen3-max生成旅游方案（refresh为True时不使用LLM响应缓存）"""
+        try:
+            # 构建提示词模板
+            with stage('prompt'):
+                prompt = self.build_plan_prompt(scene, days, budget, interest, demand)
 
-            # 调用qwen3-max API
-            response = dashscope.Generation.call(
-                model='qwen-max',
+            # 完整生成优先使用qwen-max
+            llm_result = self.call_routed(
+                TASK_GENERATE,
                 messages=[
                     {"role": "system", "content": "你是一个专业的旅游规划师，擅长制定详细的旅游计划。"},
                     {"role": "user", "content": prompt}
                 ],
-                result_format='message',
-                max_tokens=2000,
-                temperature=0.7
+                max_tokens=size_plan_max_tokens(days, compact=self.compact_output),
+                temperature=0.7,
+                use_cache=not refresh
             )
             
-            # 检查响应状态
-            if response.status_code == 200:
-                # 提取生成的内容
-                plan_content = response.output.choices[0].message.content
-                
-                # 尝试解析JSON
-                try:
-                    plan_json = json.loads(plan_content)
-                    return {"success": True, "data": plan_json}
-                except json.JSONDecodeError:
-                    # 如果不是标准JSON，返回原始文本
-                    return {"success": True, "data": {"raw_content": plan_content}}
-            else:
-                return {"success": False, "error": f"API调用失败: {response.message}"}
+            if not llm_result["success"]:
+                return llm_result
+            
+            # 提取生成的内容
+            plan_content = llm_result["content"]
+            
+            # 尝试解析JSON
+            try:
+                # 紧凑格式在本地展开为完整方案结构，派生字段在本地计算
+                with stage('llm_output_parse'):
+                    plan_json = expand_plan(json.loads(plan_content), budget)
+                plan_json = self.ensure_plan_budget(plan_json, budget)
+                return {"success": True, "data": plan_json}
+            except json.JSONDecodeError:
+                # 如果不是标准JSON，返回原始文本
+                return {"success": True, "data": {"raw_content": plan_content}}
                 
         except Exception as e:
             return {"success": False, "error": f"生成旅游方案失败: {str(e)}"}
     
     def get_weather_info(self, city):
-        """获取城市天气信息"""
+        """获取城市天气信息（结果在共享缓存中保留 WEATHER_CACHE_TTL 秒）"""
+        if self.shared_cache is not None and self.weather_ttl:
+            cached = self.shared_cache.get_json('weather', city)
+            if cached is not None:
+                return {"success": True, "data": cached}
         try:
             # 高德地图天气API
             url = f"https://restapi.amap.com/v3/weather/weatherInfo"
@@ -93,10 +263,21 @@ class AIGCService:
                 'extensions': 'all'  # 获取预报天气
             }
             
-            response = requests.get(url, params=params)
-            data = response.json()
+            started = time.perf_counter()
+            if self.upstream_replay is not None:
+                data = self.upstream_replay.weather(city)
+                if data is None:
+                    return {"success": False, "error": "回放数据中没有对应的天气数据"}
+            else:
+                with stage('upstream_weather'):
+                    response = requests.get(url, params=params)
+                    data = response.json()
+            if self.traffic_recorder is not None:
+                self.traffic_recorder.record_upstream('weather', city, data, (time.perf_counter() - started) * 1000)
             
             if data.get('status') == '1':
+                if self.shared_cache is not None and self.weather_ttl:
+                    self.shared_cache.set_json('weather', city, data, ttl=self.weather_ttl)
                 return {"success": True, "data": data}
             else:
                 return {"success": False, "error": "获取天气信息失败"}
@@ -107,20 +288,31 @@ class AIGCService:
     def adjust_plan_by_weather(self, original_plan, city, adjust_type):
         """根据天气调整旅游方案"""
         try:
-            # 获取天气信息
-            weather_result = self.get_weather_info(city)
-            
-            if not weather_result["success"]:
-                return weather_result
-            
-            weather_data = weather_result["data"]
-            
+            # 调整结果与生成方案使用相同的输出格式（紧凑格式在本地展开），保持天数与总预算不变
+            days, items_per_day = plan_density(original_plan)
+            budget = 0.0
+            if isinstance(original_plan, dict):
+                # 原方案没有总预算时以各行程项预算之和为准
+                budget = to_number(original_plan.get('total_budget')) or float(plan_to_arrays(original_plan)[1].sum())
+            budget = int(budget) if budget.is_integer() else budget
+            instructions = self.output_instructions(days, budget)
+
             # 构建调整提示词
             if adjust_type == "weather":
-                prompt = f"""基于以下天气信息调整旅游方案：
-天气数据：{json.dumps(weather_data, ensure_ascii=False)}
+                # 获取天气信息（人流量调整不需要天气数据）
+                weather_result = self.get_weather_info(city)
+                
+                if not weather_result["success"]:
+                    return weather_result
+                
+                weather_data = weather_result["data"]
+                
+                with stage('prompt'):
+                    prompt = f"""基于以下天气信息调整旅游方案：
+天气数据：{compact_json(summarize_weather(weather_data))}
 
-原始方案：{json.dumps(original_plan, ensure_ascii=False)}
+原始方案（每个行程项一行：时间|景点|交通|餐饮|预算）：
+{plan_to_prompt(original_plan)}
 
 请根据天气情况调整方案：
 1. 如果有雨天，推荐室内景点
@@ -128,11 +320,13 @@ class AIGCService:
 3. 根据温度调整服装建议
 4. 保持原有的预算和天数不变
 
-请返回调整后的完整JSON方案。"""
+{instructions}"""
             
             elif adjust_type == "crowd":
-                prompt = f"""基于人流量情况调整旅游方案：
-原始方案：{json.dumps(original_plan, ensure_ascii=False)}
+                with stage('prompt'):
+                    prompt = f"""基于人流量情况调整旅游方案：
+原始方案（每个行程项一行：时间|景点|交通|餐饮|预算）：
+{plan_to_prompt(original_plan)}
 
 请根据人流量调整方案：
 1. 避开热门景点的高峰时段
@@ -140,32 +334,113 @@ class AIGCService:
 3. 调整游览时间安排
 4. 保持原有的预算和天数不变
 
-请返回调整后的完整JSON方案。"""
+{instructions}"""
             
-            # 调用qwen3-max API进行调整
-            response = dashscope.Generation.call(
-                model='qwen-max',
+            # 小方案的调整使用更快的模型档位
+            llm_result = self.call_routed(
+                adjust_type,
                 messages=[
                     {"role": "system", "content": "你是一个专业的旅游规划师，擅长根据实时信息调整旅游计划。"},
                     {"role": "user", "content": prompt}
                 ],
-                result_format='message',
-                max_tokens=2000,
-                temperature=0.7
+                max_tokens=size_plan_max_tokens(days, items_per_day, compact=self.compact_output),
+                temperature=0.7,
+                plan_items=days * items_per_day
             )
             
-            # 检查响应状态
-            if response.status_code == 200:
-                adjusted_content = response.output.choices[0].message.content
-                
-                # 尝试解析JSON
-                try:
-                    adjusted_plan = json.loads(adjusted_content)
-                    return {"success": True, "data": adjusted_plan}
-                except json.JSONDecodeError:
-                    return {"success": True, "data": {"raw_content": adjusted_content}}
-            else:
-                return {"success": False, "error": f"API调用失败: {response.message}"}
+            if not llm_result["success"]:
+                return llm_result
+            
+            adjusted_content = llm_result["content"]
+            
+            # 尝试解析JSON
+            try:
+                with stage('llm_output_parse'):
+                    adjusted_plan = expand_plan(json.loads(adjusted_content), budget or None)
+                adjusted_plan = self.ensure_plan_budget(adjusted_plan, budget)
+                return {"success": True, "data": adjusted_plan}
+            except json.JSONDecodeError:
+                return {"success": True, "data": {"raw_content": adjusted_content}}
                 
         except Exception as e:
-            return {"success": False, "error": f"方案调整失败: {str(e)}"}
\ No newline at end of file
+            return {"success": False, "error": f"方案调整失败: {str(e)}"}
+    
+    def adjust_plan_by_crowd(self, original_plan, city, start_date=None):
+        """基于景点热度曲线在本地错峰（不调用LLM），返回仍处于高峰、需要替代景点的行程项"""
+        try:
+            if not isinstance(original_plan, dict) or not original_plan.get('daily_plans'):
+                return {"success": False, "error": "原始方案缺少每日行程，无法进行错峰调整"}
+            if self.crowd_provider is None:
+                return {"success": False, "error": "未配置人流量数据源", "no_data": True}
+            
+            try:
+                first_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else date.today()
+            except (TypeError, ValueError):
+                return {"success": False, "error": "start_date格式应为YYYY-MM-DD"}
+            
+            def profiles_for_day(i):
+                return self.crowd_provider.profiles(city, (first_day + timedelta(days=i)).weekday())
+            
+            if profiles_for_day(0) is None:
+                return {"success": False, "error": f"未找到{city}的人流量数据", "no_data": True}
+            
+            adjusted_plan, moved, crowded = shift_plan_crowds(original_plan, profiles_for_day, self.crowd_peak_level)
+            return {"success": True, "data": adjusted_plan, "moved": moved, "crowded": crowded}
+            
+        except Exception as e:
+            return {"success": False, "error": f"错峰调整失败: {str(e)}"}
+    
+    def substitute_crowded_items(self, plan, city, crowded):
+        """仅为错峰后仍处于高峰的行程项请求LLM推荐替代景点，其余行程保持不变"""
+        try:
+            items = "\n".join(
+                f"第{item['day']}天|{item['index']}|{item['time']}|{item['attraction']}|热度{item['level']}"
+                for item in crowded
+            )
+            prompt = f"""以下{city}行程项在安排的时间段内人流量过高（热度0-100），请为每一项推荐一个人少、同类型的替代景点：
+天数|位置|时间|景点|热度
+{items}
+
+返回JSON：{{"replacements":[{{"day":1,"index":0,"attraction":"替代景点","transportation":"交通方式","budget":100}}]}}
+day与index与上表一致，预算与原行程项相近。"""
+            
+            llm_result = self.call_routed(
+                TASK_CROWD,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的旅游规划师，熟悉各城市景点。"},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=100 + 60 * len(crowded),
+                temperature=0.7,
+                plan_items=len(crowded)
+            )
+            if not llm_result["success"]:
+                return llm_result
+            
+            try:
+                replacements = json.loads(llm_result["content"]).get('replacements')
+            except (ValueError, AttributeError):
+                return {"success": True, "data": plan, "substituted": 0}
+            
+            adjusted_plan, substituted = apply_replacements(plan, replacements)
+            adjusted_plan = self.ensure_plan_budget(adjusted_plan, to_number(plan.get('total_budget')))
+            return {"success": True, "data": adjusted_plan, "substituted": substituted}
+            
+        except Exception as e:
+            return {"success": False, "error": f"替代景点推荐失败: {str(e)}"}
+    
+    def adjust_plan_by_route(self, original_plan, city):
+        """基于本地通行时间矩阵重排每日景点顺序（不调用LLM）"""
+        try:
+            if not isinstance(original_plan, dict) or not original_plan.get('daily_plans'):
+                return {"success": False, "error": "原始方案缺少每日行程，无法进行路线优化"}
+            
+            matrix = load_city_matrix(city)
+            if matrix is None:
+                return {"success": False, "error": f"未找到{city}的通行时间矩阵"}
+            
+            adjusted_plan, saved_minutes = optimize_plan_route(original_plan, matrix)
+            return {"success": True, "data": adjusted_plan, "saved_minutes": round(saved_minutes, 1)}
+            
+        except Exception as e:
+            return {"success": False, "error": f"路线优化失败: {str(e)}"}
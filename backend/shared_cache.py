@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨进程共享缓存层
+同一节点上的多个worker进程共用一个SQLite单文件（WAL + 内存映射读取），无需额外部署缓存服务；
+按命名空间区分数据，支持条目过期时间、原子更新与LRU淘汰，进程重启后缓存仍然有效
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from llm_cache import DiskLRUStore
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class SharedNamespace:
+    """共享缓存中的一个命名空间，提供与DiskLRUStore相同的 get/set/delete 接口"""
+
+    def __init__(self, cache, namespace):
+        self.cache = cache
+        self.namespace = namespace
+
+    def get(self, key):
+        return self.cache.get(self.namespace, key)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(self.namespace, key, value, ttl)
+
+    def delete(self, key):
+        self.cache.delete(self.namespace, key)
+
+
+class SharedCache:
+    """命名空间 + TTL 的跨进程缓存，读写失败时按未命中处理，不影响主流程"""
+
+    def __init__(self, path=None, max_bytes=None, mmap_bytes=None):
+        self.path = path or os.getenv('SHARED_CACHE_PATH', 'shared_cache.db')
+        max_bytes = max_bytes or int(float(os.getenv('SHARED_CACHE_MAX_MB', 256)) * 1024 * 1024)
+        if mmap_bytes is None:
+            mmap_bytes = int(float(os.getenv('SHARED_CACHE_MMAP_MB', 256)) * 1024 * 1024)
+        # 条目多为已压缩过的JSON或小对象，不再做zlib压缩，读取时省去解压
+        self.store = DiskLRUStore(self.path, max_bytes, compress=False, mmap_bytes=mmap_bytes)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(namespace, key):
+        return f"{namespace}:{key}"
+
+    def _count(self, namespace, hit):
+        with self._lock:
+            counter = self._counters.setdefault(namespace, [0, 0])
+            counter[0 if hit else 1] += 1
+
+    def namespace(self, namespace):
+        return SharedNamespace(self, namespace)
+
+    def get(self, namespace, key):
+        """读取字节值，未命中或已过期返回None"""
+        try:
+            value = self.store.get(self._key(namespace, key))
+        except sqlite3.Error as e:
+            print(f"读取共享缓存失败: {e}")
+            value = None
+        self._count(namespace, value is not None)
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        """写入字节值，ttl为有效秒数"""
+        try:
+            self.store.set(self._key(namespace, key), value, ttl)
+        except sqlite3.Error as e:
+            print(f"写入共享缓存失败: {e}")
+
+    def delete(self, namespace, key):
+        try:
+            self.store.delete(self._key(namespace, key))
+        except sqlite3.Error as e:
+            print(f"删除共享缓存失败: {e}")
+
+    def get_json(self, namespace, key):
+        value = self.get(namespace, key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, namespace, key, data, ttl=None):
+        self.set(namespace, key, json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'), ttl)
+
+    def update_json(self, namespace, key, fn, ttl=None):
+        """原子更新：fn(旧数据或None)返回新数据，所有worker对同一键的更新依次执行"""
+        def apply(value):
+            data = fn(json.loads(value) if value is not None else None)
+            return json.dumps(data, ensure_ascii=False, default=str).encode('utf-8') if data is not None else None
+        try:
+            value = self.store.update(self._key(namespace, key), apply, ttl)
+        except sqlite3.Error as e:
+            print(f"更新共享缓存失败: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def stats(self):
+        """各命名空间命中统计与存储容量"""
+        with self._lock:
+            namespaces = {
+                namespace: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0
+                }
+                for namespace, (hits, misses) in self._counters.items()
+            }
+        stats = {"path": self.path, "namespaces": namespaces}
+        try:
+            stats.update(self.store.stats())
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+def get_shared_cache():
+    """进程内共享同一个实例；SHARED_CACHE_PATH设为空时关闭，初始化失败时返回None"""
+    global _shared_cache
+    if os.getenv('SHARED_CACHE_PATH') == '':
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = SharedCache()
+            except sqlite3.Error as e:
+                print(f"共享缓存初始化失败: {e}，将只使用进程内缓存")
+                _shared_cache = False  # 不再重复尝试
+        return _shared_cache or None
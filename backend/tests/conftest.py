@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置：把backend目录加入导入路径，数据库与各缓存文件放在临时目录中，LLM调用以假响应替换"""
+
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# 在导入任何业务模块之前设置（共享缓存等为进程内单例）
+_TMP = tempfile.mkdtemp(prefix='travel_tests_')
+for _name, _value in {
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(_TMP, 'travel.db'),
+    'LLM_CACHE_PATH': os.path.join(_TMP, 'llm_cache.db'),
+    'PLAN_CACHE_PATH': os.path.join(_TMP, 'plan_cache.db'),
+    'SHARED_CACHE_PATH': os.path.join(_TMP, 'shared_cache.db'),
+    'BULK_JOB_DIR': os.path.join(_TMP, 'bulk_jobs'),
+    'ROUTE_MATRIX_DIR': os.path.join(_TMP, 'route_matrix'),
+    'CROWD_DATA_DIR': os.path.join(_TMP, 'crowd_data'),
+    'PLAN_ARCHIVE_INTERVAL': '0',
+    'PROFILE_SNAPSHOT_INTERVAL': '0',
+    'ADMIN_API_KEY': 'test-admin-key',
+    'DASHSCOPE_API_KEY': '',
+    'AMAP_API_KEY': '',
+}.items():
+    os.environ[_name] = _value
+
+
+def llm_response(content, status_code=200, finish_reason='stop'):
+    """与DashScope响应结构相同的假响应"""
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(
+        status_code=status_code,
+        message='',
+        usage=SimpleNamespace(input_tokens=10, output_tokens=20),
+        output=SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)])
+    )
+
+
+class FakeGeneration:
+    """替换 dashscope.Generation.call：按顺序返回预设内容（用完后重复最后一个），记录每次调用的参数"""
+
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.contents[min(len(self.calls), len(self.contents)) - 1]
+        if isinstance(content, SimpleNamespace):
+            return content
+        return llm_response(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """安装假的DashScope生成接口：fake_llm(内容1, 内容2, ...)"""
+    import dashscope
+
+    def install(*contents):
+        fake = FakeGeneration(*contents)
+        monkeypatch.setattr(dashscope.Generation, 'call', fake)
+        return fake
+    return install
+
+
+@pytest.fixture
+def app_module():
+    """导入Flask应用模块（首次导入时按上面的环境变量初始化数据库与各组件）"""
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+ADMIN_HEADERS = {"X-Admin-Key": os.environ['ADMIN_API_KEY']}
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""接口层行为：强制重新生成、批量任务参数校验与调整方案的输出结构"""
+
+import json
+import uuid
+import pytest
+from conftest import ADMIN_HEADERS
+from llm_cache import LLMResponseCache
+
+
+def compact_plan(title):
+    return json.dumps({"t": title, "d": [["09:00-11:00|故宫|地铁|烤鸭|200"]], "tips": [], "n": ""},
+                      ensure_ascii=False)
+
+
+def demand(**overrides):
+    body = {"scene": "大学生独自游", "days": 1, "budget": 1000, "interest": "美食",
+            "demand": f"测试需求{uuid.uuid4().hex}"}
+    body.update(overrides)
+    return body
+
+
+def test_refresh_bypasses_llm_cache(client, app_module, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module.aigc_service, 'llm_cache',
+                        LLMResponseCache(path=str(tmp_path / 'llm.db')))
+    fake = fake_llm(compact_plan("第一版"), compact_plan("第二版"))
+    body = demand()
+    first = client.post('/api/plan/generate', json=body).get_json()
+    second = client.post('/api/plan/generate', json=dict(body, refresh=True)).get_json()
+    assert first["data"]["plan"]["title"] == "第一版"
+    assert second["data"]["plan"]["title"] == "第二版"
+    assert len(fake.calls) == 2
+
+
+@pytest.mark.parametrize("concurrency", ["abc", None, [1], 0, 10 ** 6])
+def test_bulk_generate_rejects_bad_concurrency(client, concurrency):
+    response = client.post('/api/admin/bulk_generate', headers=ADMIN_HEADERS,
+                           json={"demands": [demand()], "concurrency": concurrency})
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_crowd_adjust_returns_full_plan_structure(client, app_module, fake_llm):
+    original = {
+        "title": "北京两日游", "total_days": 2, "total_budget": 1000,
+        "daily_plans": [
+            {"day": d, "date": f"第{d}天", "daily_total": 300,
+             "schedule": [{"time": "09:00-11:00", "attraction": "故宫", "transportation": "地铁",
+                           "dining": "烤鸭", "budget": 300}]}
+            for d in (1, 2)
+        ],
+        "tips": [], "special_notes": ""
+    }
+    demand_id = app_module.db.insert_user_demand('家庭游', 2, 1000, '历史', '北京两日游')
+    plan_id = app_module.db.insert_travel_plan(demand_id, json.dumps(original, ensure_ascii=False))
+    # 没有人流量数据时退回LLM整体调整，模型按提示词要求输出紧凑格式
+    fake = fake_llm(json.dumps({"t": "错峰版", "d": [["08:00-10:00|天坛|地铁|豆汁|200"],
+                                                   ["15:00-17:00|颐和园|公交|便餐|250"]],
+                                "tips": ["早出发"], "n": ""}, ensure_ascii=False))
+
+    body = client.post('/api/plan/adjust', json={"plan_id": plan_id, "adjust_type": "crowd"}).get_json()
+
+    prompt = fake.calls[0]["messages"][-1]["content"]
+    assert '"d":' in prompt and "不超过1000元" in prompt
+    plan = body["data"]["adjusted_plan"]
+    assert plan["total_days"] == 2
+    assert plan["total_budget"] == 1000
+    assert plan["daily_plans"][1]["schedule"][0] == {
+        "time": "15:00-17:00", "attraction": "颐和园", "transportation": "公交", "dining": "便餐", "budget": 250
+    }
+    assert plan["daily_plans"][1]["daily_total"] == 250
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""预算校验与再平衡：scale按比例缩放，trim从最贵项目裁剪，均重算每日小计"""
+
+from budget_validator import rebalance_plan_budget, validate_plan_budget
+
+
+def make_plan(*days):
+    return {
+        "title": "测试方案",
+        "daily_plans": [
+            {"day": d + 1, "schedule": [{"activity": f"项目{d}-{i}", "budget": b} for i, b in enumerate(items)],
+             "daily_total": 0}
+            for d, items in enumerate(days)
+        ]
+    }
+
+
+def budgets(plan):
+    return [[item["budget"] for item in day["schedule"]] for day in plan["daily_plans"]]
+
+
+def test_scale_mode_shrinks_items_proportionally():
+    plan = make_plan([100, "300元"], [50, 50])
+    result = rebalance_plan_budget(plan, 250, mode='scale')
+    assert budgets(result) == [[50, 150], [25, 25]]
+    assert [day["daily_total"] for day in result["daily_plans"]] == [200, 50]
+    assert validate_plan_budget(result, 250)["valid"]
+    # 原方案不被修改
+    assert plan["daily_plans"][0]["schedule"][1]["budget"] == "300元"
+
+
+def test_scale_mode_only_fixes_totals_within_budget():
+    plan = make_plan([100, 200], [50])
+    result = rebalance_plan_budget(plan, 1000, mode='scale')
+    assert budgets(result) == [[100, 200], [50]]
+    assert [day["daily_total"] for day in result["daily_plans"]] == [300, 50]
+
+
+def test_trim_mode_drops_most_expensive_items_first():
+    plan = make_plan([100, 300], [50, 200])
+    result = rebalance_plan_budget(plan, 400, mode='trim')
+    assert budgets(result) == [[100], [50, 200]]
+    assert [day["daily_total"] for day in result["daily_plans"]] == [100, 250]
+    assert validate_plan_budget(result, 400)["valid"]
+
+
+def test_trim_mode_keeps_one_item_per_day_and_scales_the_rest():
+    plan = make_plan([400, 600], [300])
+    result = rebalance_plan_budget(plan, 350, mode='trim')
+    # 每天最便宜的一项保留，仍超支的部分按比例缩放
+    assert [len(day["schedule"]) for day in result["daily_plans"]] == [1, 1]
+    assert budgets(result) == [[200], [150]]
+    assert validate_plan_budget(result, 350)["valid"]
+
+
+def test_plan_without_days_is_returned_as_is():
+    plan = {"title": "空方案"}
+    assert rebalance_plan_budget(plan, 100) is plan
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""人流量错峰：数据源基类、文件数据源的城市名校验与本地调换时间段"""
+
+import json
+import pytest
+from crowd_data import CrowdProvider, FileCrowdProvider, shift_plan_crowds
+
+QUIET = [10] * 24
+# 上午人多、下午人少
+MORNING_PEAK = [90] * 12 + [10] * 12
+
+
+class DictCrowdProvider(CrowdProvider):
+    """内存数据源：{城市: {景点: {"curve": [...]}}}，各星期几使用同一曲线"""
+
+    def __init__(self, data):
+        super().__init__(ttl=0)
+        self.data = data
+
+    def fetch(self, city, weekday):
+        return self.data.get(city)
+
+
+def test_provider_must_implement_fetch():
+    with pytest.raises(TypeError):
+        CrowdProvider()
+
+
+def test_shift_moves_crowded_attraction_to_quiet_slot():
+    provider = DictCrowdProvider({"北京": {"故宫": {"curve": MORNING_PEAK}, "景山": {"curve": QUIET}}})
+    plan = {"daily_plans": [{"day": 1, "schedule": [
+        {"time": "09:00-11:00", "attraction": "故宫"},
+        {"time": "14:00-16:00", "attraction": "景山"},
+    ]}]}
+    new_plan, moved, crowded = shift_plan_crowds(plan, lambda i: provider.profiles("北京", i), peak_level=80)
+    schedule = new_plan["daily_plans"][0]["schedule"]
+    assert [item["attraction"] for item in schedule] == ["景山", "故宫"]
+    assert moved == 2 and crowded == []
+    # 原方案不被修改
+    assert plan["daily_plans"][0]["schedule"][0]["attraction"] == "故宫"
+
+
+def test_file_provider_rejects_traversal_city(tmp_path):
+    data_dir = tmp_path / 'crowd'
+    data_dir.mkdir()
+    outside = {"attractions": {"故宫": {"default": QUIET}}}
+    (tmp_path / 'secret.json').write_text(json.dumps(outside), encoding='utf-8')
+    (data_dir / '北京.json').write_text(json.dumps(outside), encoding='utf-8')
+
+    provider = FileCrowdProvider(str(data_dir), ttl=0)
+    assert provider.fetch('北京', 0) is not None
+    for city in ('../secret', '..', str(tmp_path / 'secret')):
+        assert provider.fetch(city, 0) is None
+        assert provider.version(city) is None
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""读写分离：副本轮询与延迟检测、读己之写走主库、副本中查不到时回退主库"""
+
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import pytest
+from database import Database
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """主库写入一个方案后复制出两个SQLite副本，返回 (db, [副本路径])"""
+    primary = str(tmp_path / 'primary.db')
+    seed = Database('sqlite', primary)
+    demand_id = seed.insert_user_demand('家庭游', 3, 3000, '美食', '成都三日游')
+    seed.insert_travel_plan(demand_id, json.dumps({"title": "主库"}, ensure_ascii=False))
+    paths = [str(tmp_path / 'r1.db'), str(tmp_path / 'r2.db')]
+    for path in paths:
+        shutil.copy(primary, path)
+        set_title(path, 1, f"副本{path[-4]}")
+
+    db = Database('sqlite', primary, replicas=paths)
+    db.shared_cache = SharedCache(path=str(tmp_path / 'shared.db'))
+    return db, paths
+
+
+def set_title(path, plan_id, title):
+    conn = sqlite3.connect(path)
+    conn.execute('UPDATE travel_plan SET plan_content = ? WHERE id = ?',
+                 (json.dumps({"title": title}, ensure_ascii=False), plan_id))
+    conn.commit()
+    conn.close()
+
+
+def title(row):
+    return json.loads(row['plan_content'])['title']
+
+
+def test_reads_rotate_across_replicas(replicated):
+    db, paths = replicated
+    assert [db._pick_replica().address for _ in range(4)] == paths * 2
+    assert [title(db.get_travel_plan(1)) for _ in range(2)] == ['副本1', '副本2']
+
+
+def test_lagging_and_failing_replicas_are_benched(replicated, monkeypatch):
+    db, paths = replicated
+    lags = {paths[0]: db.replica_max_lag + 1, paths[1]: 0.0}
+    monkeypatch.setattr(db, '_check_replica_lag', lambda replica: lags[replica.address])
+    assert {db._pick_replica().address for _ in range(4)} == {paths[1]}
+
+    def broken(replica):
+        raise sqlite3.OperationalError("unreachable")
+
+    # 下一个检测周期（共享缓存中的检测结果也已过期）
+    for replica in db.replicas:
+        replica.last_check = 0
+        db.shared_cache.delete('replica', replica.address)
+    monkeypatch.setattr(db, '_check_replica_lag', broken)
+    assert db._pick_replica() is None
+    assert [status["available"] for status in db.replica_status()] == [False, False]
+    # 副本全部不可用时读取回退主库
+    assert title(db.get_travel_plan(1)) == '主库'
+
+
+def test_replica_state_is_shared_between_workers(replicated, monkeypatch):
+    db, paths = replicated
+    db._mark_replica_down(db.replicas[0])
+    other = Database('sqlite', db.sqlite_path, replicas=paths)
+    other.shared_cache = db.shared_cache
+    monkeypatch.setattr(other, '_check_replica_lag', lambda replica: 0.0)
+    assert {other._pick_replica().address for _ in range(4)} == {paths[1]}
+
+
+def test_lag_is_checked_once_per_interval_under_concurrency(replicated, monkeypatch):
+    db, paths = replicated
+    db.shared_cache = None
+    checks = []
+
+    def slow_check(replica):
+        checks.append(replica.address)
+        time.sleep(0.05)
+        return 0.0
+
+    monkeypatch.setattr(db, '_check_replica_lag', slow_check)
+    threads = [threading.Thread(target=db._pick_replica) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(checks) == paths
+
+
+def test_recent_writes_are_read_from_primary(replicated):
+    db, paths = replicated
+    demand_id = db.insert_user_demand('情侣游', 2, 2000, '拍照', '厦门两日游')
+    plan_id = db.insert_travel_plan(demand_id, json.dumps({"title": "新方案"}, ensure_ascii=False))
+    for path in paths:
+        shutil.copy(db.sqlite_path, path)
+        set_title(path, plan_id, "副本旧版本")
+    assert db._recently_written(plan_id)
+    assert title(db.get_travel_plan(plan_id)) == '新方案'
+
+    # 窗口期过后读取副本
+    db._recent_writes.clear()
+    db.shared_cache.delete('write', plan_id)
+    assert title(db.get_travel_plan(plan_id)) == '副本旧版本'
+
+
+def test_replica_miss_falls_back_to_primary(replicated):
+    db, _ = replicated
+    demand_id = db.insert_user_demand('情侣游', 2, 2000, '拍照', '厦门两日游')
+    plan_id = db.insert_travel_plan(demand_id, json.dumps({"title": "新方案"}, ensure_ascii=False))
+    db._recent_writes.clear()
+    db.shared_cache.delete('write', plan_id)
+    assert not db._recently_written(plan_id)
+    # 副本尚未同步到该方案，回退主库读取
+    assert title(db.get_travel_plan(plan_id)) == '新方案'
+    assert db.get_travel_plan(plan_id + 1) is None
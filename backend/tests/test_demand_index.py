@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""需求相似度索引：按目的地分区，不同城市的相近表述不会互相匹配，未识别出目的地时不直接复用"""
+
+import json
+from demand_index import DemandIndex, extract_destinations
+
+CHENGDU = "成都三日游，想吃火锅、看熊猫"
+CHONGQING = "重庆三日游，想吃火锅、看熊猫"
+
+
+def _index():
+    index = DemandIndex(dim=1024, sync_interval=0)
+    index.add(1, 101, '家庭游', 3, 3000, '美食,火锅', CHENGDU)
+    return index
+
+
+def test_extract_destinations():
+    assert extract_destinations('美食', '成都市区+乐山两日游') == ('乐山', '成都')
+    assert extract_destinations('美食', '随便走走') == ()
+
+
+def test_other_city_with_similar_wording_does_not_match():
+    assert _index().search('家庭游', 3, 3000, '美食,火锅', CHONGQING) is None
+
+
+def test_same_city_matches_with_destination():
+    similar = _index().search('家庭游', 3, 3000, '美食,火锅', "成都市三日游，想吃火锅，看熊猫")
+    assert similar["plan_id"] == 101
+    assert similar["destinations"] == ['成都']
+    assert similar["similarity"] > 0.85
+
+
+def test_unknown_destination_is_flagged():
+    index = DemandIndex(dim=1024, sync_interval=0)
+    index.add(1, 101, '家庭游', 3, 3000, '美食', "小城慢游三日")
+    similar = index.search('家庭游', 3, 3000, '美食', "小城慢游三日")
+    assert similar["destinations"] == []
+
+
+def test_generate_reuses_only_matches_with_known_destination(client, fake_llm):
+    plan = {"t": "方案", "d": [["09:00-11:00|景点|地铁|午餐|100"]], "tips": [], "n": ""}
+    fake = fake_llm(json.dumps(plan, ensure_ascii=False))
+    body = {"scene": "相似复用测试", "days": 1, "budget": 500, "interest": "美食"}
+
+    for demand in ("成都一日游吃火锅", "成都一日游，吃火锅"):
+        client.post('/api/plan/generate', json=dict(body, demand=demand))
+    assert len(fake.calls) == 1
+
+    for demand in ("小城慢游一日吃火锅", "小城慢游一日，吃火锅"):
+        client.post('/api/plan/generate', json=dict(body, demand=demand))
+    assert len(fake.calls) == 3
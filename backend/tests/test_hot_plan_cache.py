@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""热点方案缓存：按存储原样返回方案，命中时不复制"""
+
+import json
+from hot_plan_cache import HotPlanCache
+
+# 字段形式不符合TravelPlan模型的规范（金额带单位、缺少字段），缓存与接口都应原样保留
+STORED_PLAN = {
+    "title": "北京一日游",
+    "total_budget": "200元",
+    "daily_plans": [{"day": 1, "schedule": [{"time": "09:00", "attraction": "故宫", "budget": "200元"}]}],
+    "custom": {"note": "自定义字段"}
+}
+
+
+def _row(plan_id):
+    return {"id": plan_id, "demand_id": 1, "plan_content": json.dumps(STORED_PLAN, ensure_ascii=False)}
+
+
+def test_hits_return_stored_shape_without_copying(tmp_path):
+    cache = HotPlanCache(max_bytes=1024 * 1024, shared_path=str(tmp_path / 'shared.db'))
+    put_row = cache.put(1, _row(1))
+    first = cache.get(1)
+    second = cache.get(1)
+
+    assert put_row['plan'] == STORED_PLAN
+    assert 'plan_content' not in first
+    assert first['plan'] == STORED_PLAN
+    assert first is not second
+    assert first['plan'] is second['plan']
+
+
+def test_shared_layer_returns_stored_shape(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    HotPlanCache(max_bytes=1024 * 1024, shared_path=path).put(2, _row(2))
+    row = HotPlanCache(max_bytes=1024 * 1024, shared_path=path).get(2)
+    assert row['plan'] == STORED_PLAN
+
+
+def test_get_plan_endpoint_keeps_stored_shape(client, app_module):
+    demand_id = app_module.db.insert_user_demand('家庭游', 1, 1000, '历史', '北京一日游')
+    plan_id = app_module.db.insert_travel_plan(demand_id, json.dumps(STORED_PLAN, ensure_ascii=False))
+    for _ in range(2):
+        body = client.get(f'/api/plan/{plan_id}').get_json()
+        assert body["data"]["plan"] == STORED_PLAN
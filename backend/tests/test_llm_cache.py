@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""LLM响应缓存：总字节数计数与淘汰、默认缓存策略、无法使用的输出不写入缓存"""
+
+import sqlite3
+import pytest
+from conftest import llm_response
+from llm_cache import DiskLRUStore, LLMResponseCache
+
+
+def actual_total(store):
+    return store._connection().execute('SELECT COALESCE(SUM(size), 0) FROM cache_entry').fetchone()[0]
+
+
+def test_running_total_tracks_writes(tmp_path):
+    store = DiskLRUStore(str(tmp_path / 'c.db'), max_bytes=10 ** 6, compress=False)
+    store.set('a', b'x' * 100)
+    store.set('b', b'y' * 50)
+    store.set('a', b'z' * 10)  # 覆盖已有键
+    store.update('b', lambda old: old + b'!')
+    store.delete('missing')
+    assert store.stats()['bytes'] == actual_total(store) == 61
+    store.delete('a')
+    store.update('b', lambda old: None)
+    assert store.stats()['bytes'] == actual_total(store) == 0
+
+
+def test_expired_and_evicted_entries_leave_total_consistent(tmp_path):
+    store = DiskLRUStore(str(tmp_path / 'c.db'), max_bytes=250, compress=False)
+    for i in range(10):
+        store.set(f'k{i}', b'v' * 100)
+    assert actual_total(store) == store.stats()['bytes'] <= 250
+    assert store.get('k9') == b'v' * 100
+    assert store.get('k0') is None
+
+
+def test_existing_file_initialises_total(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE cache_entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                 'last_access REAL NOT NULL, expires_at REAL)')
+    conn.execute("INSERT INTO cache_entry VALUES ('a', x'00', 42, 0, NULL)")
+    conn.commit()
+    conn.close()
+    store = DiskLRUStore(path, max_bytes=10 ** 6)
+    assert store.stats()['bytes'] == 42
+    # 其他进程再次打开同一文件时不重复累加
+    assert DiskLRUStore(path, max_bytes=10 ** 6).stats()['bytes'] == 42
+
+
+def test_default_policy_caches_sampled_calls(tmp_path, monkeypatch, fake_llm):
+    from services import AIGCService
+    monkeypatch.delenv('LLM_CACHE_POLICY', raising=False)
+    monkeypatch.setenv('LLM_CACHE_PATH', str(tmp_path / 'llm.db'))
+    service = AIGCService()
+    assert service.llm_cache.policy == 'all'
+    fake = fake_llm('{"title": "第一版"}', '{"title": "第二版"}')
+    messages = [{"role": "user", "content": "hi"}]
+    first = service.call_llm(messages, temperature=0.7)
+    second = service.call_llm(messages, temperature=0.7)
+    assert not first["cached"] and second["cached"]
+    assert second["content"] == '{"title": "第一版"}' and len(fake.calls) == 1
+    # use_cache=False（refresh）跳过读取，新结果覆盖旧结果
+    third = service.call_llm(messages, temperature=0.7, use_cache=False)
+    assert third["content"] == '{"title": "第二版"}' and len(fake.calls) == 2
+    assert service.call_llm(messages, temperature=0.7)["content"] == '{"title": "第二版"}'
+
+
+def test_deterministic_policy_skips_sampled_requests(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / 'llm.db'), policy='deterministic')
+    sampled = {"model": "m", "messages": [], "max_tokens": 10, "temperature": 0.7}
+    cache.put(sampled, '{"a": 1}')
+    assert cache.get(sampled) is None
+    fixed = dict(sampled, temperature=0)
+    cache.put(fixed, '{"a": 1}')
+    assert cache.get(fixed) == '{"a": 1}'
+
+
+@pytest.fixture
+def caching_service(tmp_path, monkeypatch):
+    from services import AIGCService
+    service = AIGCService()
+    service.llm_cache = LLMResponseCache(path=str(tmp_path / 'llm.db'))
+    return service
+
+
+def test_unparsable_output_not_cached(caching_service, fake_llm):
+    fake = fake_llm('不是JSON', '{"title": "ok"}')
+    messages = [{"role": "user", "content": "hi"}]
+    first = caching_service.call_llm(messages, validate=lambda c: c.startswith('{'))
+    assert first["content"] == '不是JSON'
+    second = caching_service.call_llm(messages, validate=lambda c: c.startswith('{'))
+    assert second["content"] == '{"title": "ok"}' and not second["cached"]
+    third = caching_service.call_llm(messages, validate=lambda c: c.startswith('{'))
+    assert third["cached"] and len(fake.calls) == 2
+
+
+def test_truncated_output_not_cached(caching_service, fake_llm):
+    fake = fake_llm(llm_response('{"title": "cut', finish_reason='length'))
+    messages = [{"role": "user", "content": "hi"}]
+    caching_service.call_llm(messages)
+    caching_service.call_llm(messages)
+    assert len(fake.calls) == 2
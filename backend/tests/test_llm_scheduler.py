@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""LLM调度器：客户端完成时间记录有界，清理后仍按加权公平顺序调度"""
+
+import threading
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
+
+
+def test_finish_tags_do_not_grow_with_distinct_clients():
+    scheduler = LLMScheduler(workers=2, interactive_reserved=0)
+    for i in range(3000):
+        assert scheduler.run(lambda: i, client_id=f"key:{i}") == i
+    assert scheduler.stats()["tracked_clients"] <= LLMScheduler.PRUNE_MIN
+
+
+def test_busy_period_prunes_stale_clients():
+    scheduler = LLMScheduler(workers=1, interactive_reserved=0)
+    gate = threading.Event()
+    blocker = scheduler.submit(gate.wait, client_id="blocker")
+    tasks = [scheduler.submit(lambda: None, client_id=f"ip:{i}") for i in range(LLMScheduler.PRUNE_MIN * 3)]
+    gate.set()
+    for task in tasks:
+        assert task.wait(10)
+    assert blocker.wait(10)
+    assert scheduler.stats()["tracked_clients"] <= LLMScheduler.PRUNE_MIN
+
+
+def test_fair_order_between_clients():
+    scheduler = LLMScheduler(workers=1, interactive_reserved=0)
+    gate = threading.Event()
+    order = []
+    scheduler.submit(gate.wait, client_id="blocker")
+    heavy = [scheduler.submit(order.append, "a", client_id="a") for _ in range(5)]
+    light = scheduler.submit(order.append, "b", client_id="b", priority=PRIORITY_INTERACTIVE)
+    gate.set()
+    for task in heavy + [light]:
+        assert task.wait(10)
+    # b只提交了一个任务，排在a的第一个任务之后，而不是全部任务之后
+    assert order.index("b") <= 1
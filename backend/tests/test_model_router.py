@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""多模型路由：按任务选择档位、输出不合法时回退、对冲请求的计时与胜出统计"""
+
+import threading
+import time
+from model_router import ModelRouter, TASK_CROWD, TASK_GENERATE, TASK_WEATHER
+
+
+def is_json(content):
+    return content.startswith('{')
+
+
+def stub(replies, delays=None):
+    """按模型返回固定结果的调用桩，记录各模型被调用的顺序"""
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        time.sleep((delays or {}).get(model, 0))
+        reply = replies[model]
+        return reply if isinstance(reply, dict) else {"success": True, "content": reply}
+
+    call.calls = calls
+    return call
+
+
+def make_router(**kwargs):
+    kwargs.setdefault('hedge', False)
+    return ModelRouter(full_model='full', fast_model='fast', small_plan_items=8, **kwargs)
+
+
+def test_route_by_task_and_plan_size():
+    router = make_router()
+    assert router.route(TASK_GENERATE, plan_items=2) == ['full', 'fast']
+    assert router.route(TASK_WEATHER, plan_items=8) == ['fast', 'full']
+    assert router.route(TASK_CROWD, plan_items=9) == ['full', 'fast']
+    assert router.route(TASK_WEATHER) == ['full', 'fast']
+    assert ModelRouter(full_model='same', fast_model='same', hedge=False).route(TASK_GENERATE) == ['same']
+
+
+def test_invalid_output_falls_back_to_next_model():
+    router = make_router()
+    call = stub({"full": "不是JSON", "fast": '{"ok": 1}'})
+    result = router.call(call, TASK_GENERATE, validate=is_json)
+    assert result["content"] == '{"ok": 1}' and result["model"] == 'fast'
+    assert call.calls == ['full', 'fast']
+    models = router.stats()["models"]
+    assert models["full"]["invalid"] == 1 and models["fast"]["valid_rate"] == 1
+
+
+def test_all_invalid_returns_first_successful_output():
+    router = make_router()
+    call = stub({"full": "原始文本", "fast": {"success": False, "error": "boom"}})
+    result = router.call(call, TASK_GENERATE, validate=is_json)
+    assert result["content"] == "原始文本"
+    assert router.stats()["models"]["fast"]["errors"] == 1
+
+
+def test_throttled_call_does_not_fall_back():
+    router = make_router()
+    call = stub({"full": {"success": False, "error": "额度已满", "throttled": True}, "fast": '{}'})
+    assert router.call(call, TASK_GENERATE, validate=is_json)["throttled"]
+    assert call.calls == ['full']
+
+
+def test_fast_primary_is_not_hedged():
+    router = make_router(hedge=True, hedge_delay=0.5)
+    call = stub({"full": '{"m": "full"}', "fast": '{"m": "fast"}'})
+    assert router.call(call, TASK_GENERATE, validate=is_json)["model"] == 'full'
+    assert call.calls == ['full']
+    assert "fast" not in router.stats()["models"]
+
+
+def test_slow_primary_is_hedged_and_backup_win_is_counted():
+    router = make_router(hedge=True, hedge_delay=0.05)
+    call = stub({"full": '{"m": "full"}', "fast": '{"m": "fast"}'}, delays={"full": 0.5})
+    started = time.monotonic()
+    result = router.call(call, TASK_GENERATE, validate=is_json)
+    assert result["model"] == 'fast'
+    assert time.monotonic() - started < 0.4
+    stats = router.stats()["models"]["fast"]
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_primary_win_after_hedge_is_not_counted_for_backup():
+    router = make_router(hedge=True, hedge_delay=0.05)
+    call = stub({"full": '{"m": "full"}', "fast": '{"m": "fast"}'}, delays={"full": 0.1, "fast": 0.5})
+    assert router.call(call, TASK_GENERATE, validate=is_json)["model"] == 'full'
+    stats = router.stats()["models"]["fast"]
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 0
+
+
+def test_queue_time_does_not_trigger_hedge():
+    router = make_router(hedge=True, hedge_delay=0.1, hedge_workers=1)
+    release = threading.Event()
+    router._executor.submit(release.wait)
+    threading.Timer(0.3, release.set).start()
+    # 主模型在线程池中排队0.3秒，实际执行只需0.01秒，不应触发对冲
+    call = stub({"full": '{"m": "full"}', "fast": '{"m": "fast"}'}, delays={"full": 0.01})
+    assert router.call(call, TASK_GENERATE, validate=is_json)["model"] == 'full'
+    assert call.calls == ['full']
+
+
+def test_hedge_pool_defaults_to_twice_the_llm_workers(monkeypatch):
+    monkeypatch.delenv('LLM_HEDGE_WORKERS', raising=False)
+    monkeypatch.setenv('LLM_WORKERS', '3')
+    assert make_router()._executor._max_workers == 6
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""紧凑输出展开：格式不规范的行程行、完整JSON原样返回、小计与总预算在本地重新计算"""
+
+import pytest
+from plan_compact import compact_plan, expand_plan, parse_row
+
+
+def test_rows_are_expanded_and_totals_recomputed():
+    plan = expand_plan({
+        "t": "成都三日游",
+        "d": [["09:00-11:00|宽窄巷子|地铁|小吃|100", "14:00-17:00|武侯祠|步行|火锅|200.5"],
+              ["09:00-12:00|熊猫基地|打车|简餐|300"]],
+        "tips": "带好身份证",
+        "n": "注意防晒"
+    })
+    assert plan["title"] == "成都三日游"
+    assert plan["total_days"] == 2
+    assert [day["date"] for day in plan["daily_plans"]] == ["第一天", "第二天"]
+    assert [day["daily_total"] for day in plan["daily_plans"]] == [300.5, 300]
+    assert plan["total_budget"] == 600.5
+    assert plan["tips"] == ["带好身份证"]
+    assert plan["daily_plans"][0]["schedule"][0] == {
+        "time": "09:00-11:00", "attraction": "宽窄巷子", "transportation": "地铁", "dining": "小吃", "budget": 100
+    }
+
+
+def test_requested_budget_is_kept_as_total():
+    plan = expand_plan({"t": "x", "d": [["09:00|a|b|c|100"]]}, budget="3000")
+    assert plan["total_budget"] == 3000
+    assert plan["daily_plans"][0]["daily_total"] == 100
+
+
+@pytest.mark.parametrize("row, expected", [
+    # 字段内误用了|：多出的部分并入餐饮
+    ("09:00|景点|地铁|早餐|午餐|80", {"dining": "早餐|午餐", "budget": 80}),
+    # 缺少字段：末尾的金额仍作为预算
+    ("09:00|景点|80元", {"attraction": "景点", "transportation": "", "dining": "", "budget": 80}),
+    ("09:00|景点", {"attraction": "景点", "budget": 0}),
+    # 非数字预算按0处理
+    ("09:00|景点|地铁|午餐|免费", {"budget": 0}),
+    ("09:00|景点|地铁|午餐|约1,200元", {"budget": 1200}),
+    (["09:00", "景点", "地铁", "午餐", 150], {"attraction": "景点", "budget": 150}),
+    ({"time": "09:00", "attraction": "景点", "budget": "60元"}, {"attraction": "景点", "budget": 60}),
+])
+def test_malformed_rows(row, expected):
+    item = parse_row(row)
+    for field, value in expected.items():
+        assert item[field] == value
+
+
+def test_missing_or_malformed_days():
+    plan = expand_plan({"t": "只有标题"})
+    assert plan["daily_plans"] == [] and plan["total_days"] == 0 and plan["total_budget"] == 0
+
+    plan = expand_plan({"t": "x", "d": "09:00|a|b|c|100"})
+    assert plan["daily_plans"] == []
+
+    plan = expand_plan({"t": "x", "d": [None, {"s": ["09:00|a|b|c|50"]}, "10:00|a|b|c|20", ["", None]]})
+    assert [len(day["schedule"]) for day in plan["daily_plans"]] == [0, 1, 1, 0]
+    assert [day["daily_total"] for day in plan["daily_plans"]] == [0, 50, 20, 0]
+
+
+@pytest.mark.parametrize("data", [
+    {"title": "完整方案", "daily_plans": [{"day": 1, "schedule": [], "daily_total": 0}]},
+    {"title": "带d字段的完整方案", "d": [], "daily_plans": []},
+    {"raw": "不是方案"},
+    ["不是对象"],
+])
+def test_full_json_passes_through(data):
+    assert expand_plan(data) is data
+
+
+def test_compact_round_trip():
+    plan = expand_plan({"t": "x", "d": [["09:00|a|b|c|100", "14:00|d|e|f|50"]], "tips": [], "n": ""})
+    assert expand_plan(compact_plan(plan)) == plan
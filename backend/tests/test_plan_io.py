@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""plan_io 导入导出：重复导入与约束失败的行应如实计入跳过/未写入，归档中的方案同样导出"""
+
+import json
+import os
+import pytest
+from database import Database
+from demand_index import DemandIndex
+from plan_archive import PlanArchive
+import plan_io
+
+
+def _db(tmp_path, name):
+    return Database('sqlite', str(tmp_path / name))
+
+
+def _seed(db):
+    demand_id = db.insert_user_demand('家庭游', 3, 3000, '美食', '成都三日游')
+    db.insert_travel_plan(demand_id, json.dumps({"title": "成都三日游"}, ensure_ascii=False))
+
+
+def test_reimport_reports_duplicates_as_skipped(tmp_path):
+    source = _db(tmp_path, 'source.db')
+    _seed(source)
+    plan_io.export_data(source, str(tmp_path / 'dump'))
+
+    target = _db(tmp_path, 'target.db')
+    first = plan_io.import_data(target, str(tmp_path / 'dump'))
+    second = plan_io.import_data(target, str(tmp_path / 'dump'))
+
+    assert first['travel_plan'] == {"inserted": 1, "skipped": 0, "missing": 0}
+    assert second['user_demand'] == {"inserted": 0, "skipped": 1, "missing": 0}
+    assert second['travel_plan'] == {"inserted": 0, "skipped": 1, "missing": 0}
+
+
+def test_manifest_columns_are_validated_before_import(tmp_path):
+    source = _db(tmp_path, 'source.db')
+    _seed(source)
+    dump = str(tmp_path / 'dump')
+    plan_io.export_data(source, dump)
+    manifest_path = os.path.join(dump, plan_io.MANIFEST_NAME)
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest["tables"]["user_demand"]["columns"].append("id) VALUES (1); DROP TABLE travel_plan; --")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    target = _db(tmp_path, 'target.db')
+    with pytest.raises(ValueError):
+        plan_io.import_data(target, dump)
+    assert target.count_existing_ids('travel_plan', [1]) == 0
+
+
+def test_rows_ignored_by_constraints_are_reported_missing(tmp_path):
+    target = _db(tmp_path, 'target.db')
+    columns = plan_io.TABLE_COLUMNS['travel_plan']
+    rows = [
+        {"id": 1, "demand_id": None, "plan_content": "{}", "create_time": None},
+        # 违反NOT NULL约束，INSERT OR IGNORE会静默跳过
+        {"id": 2, "demand_id": None, "plan_content": None, "create_time": None},
+    ]
+    assert plan_io.insert_batch(target, 'travel_plan', columns, rows) == (1, 0, 1)
+    assert plan_io.insert_batch(target, 'travel_plan', columns, rows) == (0, 1, 1)
+
+
+def test_archived_plans_are_exported_and_indexed(tmp_path):
+    source = _db(tmp_path, 'source.db')
+    demand_id = source.insert_user_demand('家庭游', 3, 3000, '美食', '成都三日游')
+    first = source.insert_travel_plan(demand_id, json.dumps({"title": "第一版"}, ensure_ascii=False))
+    second = source.insert_travel_plan(demand_id, json.dumps({"title": "第二版"}, ensure_ascii=False))
+    # 创建时间早于"明天"的方案全部归档
+    PlanArchive(source, superseded_days=-1, max_age_days=-1).run()
+    assert source.count_existing_ids('travel_plan', [first, second]) == 0
+
+    index = DemandIndex(loader=source.iter_demand_plans_since, sync_interval=0)
+    assert index.sync(force=True) == 1
+    assert index.search('家庭游', 3, 3000, '美食', '成都三日游')["plan_id"] == first
+
+    plan_io.export_data(source, str(tmp_path / 'dump'))
+    target = _db(tmp_path, 'target.db')
+    summary = plan_io.import_data(target, str(tmp_path / 'dump'))
+    assert summary[plan_io.ARCHIVE_EXPORT] == {"inserted": 2, "skipped": 0, "missing": 0}
+    assert target.get_travel_plan(first)['plan_content'] == json.dumps({"title": "第一版"}, ensure_ascii=False)
+
+    copied = _db(tmp_path, 'copied.db')
+    assert plan_io.copy_data(source, copied)[plan_io.ARCHIVE_EXPORT]["inserted"] == 2
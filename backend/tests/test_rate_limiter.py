@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""接口限流：未登记的API Key不能绕过按IP的配额，共享存储清理已补满的令牌桶"""
+
+import uuid
+from rate_limiter import RateLimiter
+
+
+def _post_input(client, api_key=None):
+    headers = {"X-API-Key": api_key} if api_key else {}
+    # 请求体为空时返回400，被限流时返回429
+    return client.post('/api/plan/input', json={}, headers=headers).status_code
+
+
+def test_rotating_unregistered_keys_share_ip_bucket(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'rate_limiter', RateLimiter({'input': '2/60'}))
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_API_KEYS', set())
+    codes = [_post_input(client, uuid.uuid4().hex) for _ in range(3)]
+    assert codes == [400, 400, 429]
+
+
+def test_registered_key_has_own_bucket(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'rate_limiter', RateLimiter({'input': '1/60'}))
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_API_KEYS', {'partner-key'})
+    assert _post_input(client) == 400
+    assert _post_input(client) == 429
+    assert _post_input(client, 'partner-key') == 400
+    assert _post_input(client, 'partner-key') == 429
+
+
+def test_shared_store_prunes_refilled_buckets(tmp_path):
+    limiter = RateLimiter({'input': '2/60', 'generate': '1/120'}, shared_path=str(tmp_path / 'rate.db'))
+    assert limiter.idle_seconds == 120
+    for i in range(5):
+        limiter.check('input', f"ip:10.0.0.{i}")
+    assert limiter.prune_shared(now=limiter._next_prune) == 0
+    assert limiter.prune_shared(now=limiter._next_prune + 120) == 5
+    # 清理后的客户端与新客户端一样拥有满额令牌
+    assert limiter.check('input', "ip:10.0.0.1")[0]
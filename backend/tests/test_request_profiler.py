@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""请求剖析：慢请求按不含LLM等待的本地耗时判断"""
+
+import time
+from request_profiler import RequestProfiler, stage
+
+
+def _request(profiler, stage_name, seconds):
+    profile = profiler.begin('POST', '/api/plan/generate')
+    with stage(stage_name):
+        time.sleep(seconds)
+    return profiler.end(profile, 200)
+
+
+def test_llm_wait_does_not_make_request_slow():
+    profiler = RequestProfiler(slow_ms=50)
+    assert _request(profiler, 'upstream_llm', 0.1) is None
+    assert profiler.stats()["slow_requests"] == 0
+
+
+def test_local_work_over_threshold_is_logged():
+    profiler = RequestProfiler(slow_ms=50)
+    entry = _request(profiler, 'db', 0.1)
+    assert entry["slow"] is True
+    assert entry["local_ms"] >= 50
+    assert profiler.stats()["slow_requests"] == 1
+
+
+def test_hedged_llm_wait_is_attributed_to_the_request():
+    from model_router import ModelRouter, TASK_GENERATE
+    router = ModelRouter(full_model='full', fast_model='fast', hedge=True, hedge_delay=0.05)
+
+    def call(model):
+        # 与call_llm相同，在对冲线程中以upstream_llm阶段等待模型
+        with stage('upstream_llm'):
+            time.sleep(0.3 if model == 'full' else 0.05)
+        return {"success": True, "content": "{}"}
+
+    profiler = RequestProfiler(slow_ms=50)
+    profile = profiler.begin('POST', '/api/plan/generate')
+    assert router.call(call, TASK_GENERATE)["model"] == 'fast'
+    # 等待对冲结果的时间只计一次（约0.1秒），两个并行调用的耗时不重复计入
+    assert 80 <= profile.llm_wait_ms() < 250
+    assert profiler.end(profile, 200) is None
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""方案裁剪参数：days的范围有上限，越界时接口返回400；ETag重新验证时方案已删除则返回404"""
+
+import json
+import pytest
+from database import Database
+from plan_archive import PlanArchive
+from response_utils import PROJECTION_MAX_DAYS, parse_projection
+
+
+def test_days_ranges_are_expanded():
+    fields, days = parse_projection('title', '1,3-4')
+    assert days == {1, 3, 4}
+    assert fields == ('title', 'daily_plans')
+
+
+@pytest.mark.parametrize("days", ["1-999999999", f"{PROJECTION_MAX_DAYS + 1}", "0", "4-2", "-1", "a-b"])
+def test_invalid_days_are_rejected(days):
+    with pytest.raises(ValueError):
+        parse_projection(None, days)
+
+
+def test_get_plan_rejects_huge_days_range(client):
+    response = client.get('/api/plan/1?days=1-999999999')
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_etag_revalidation_checks_the_plan_still_exists(client, app_module, tmp_path, monkeypatch):
+    db = Database('sqlite', str(tmp_path / 'etag.db'))
+    monkeypatch.setattr(app_module, 'db', db)
+    demand_id = db.insert_user_demand('家庭游', 3, 3000, '美食', '成都三日游')
+    plan_id = db.insert_travel_plan(demand_id, json.dumps({"title": "成都三日游", "daily_plans": []}))
+    etag = client.get(f'/api/plan/{plan_id}').headers['ETag']
+    revalidate = lambda: client.get(f'/api/plan/{plan_id}', headers={'If-None-Match': etag})
+    assert revalidate().status_code == 304
+
+    # 归档后仍然存在
+    PlanArchive(db, superseded_days=-1, max_age_days=-1).run()
+    assert db.count_existing_ids('travel_plan', [plan_id]) == 0
+    assert revalidate().status_code == 304
+
+    # 超过保留期的归档分区被删除后不再返回304（即使方案仍在热点缓存中）
+    assert PlanArchive(db, retention_months=-1).drop_expired()
+    assert revalidate().status_code == 404
+    assert client.get(f'/api/plan/{plan_id + 1}', headers={'If-None-Match': etag}).status_code == 404
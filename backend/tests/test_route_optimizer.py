@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""路线优化：节省分钟数不含时间窗惩罚，城市名不能越出矩阵目录"""
+
+import json
+from route_optimizer import DistanceMatrix, city_data_path, load_city_matrix, optimize_plan_route
+
+PLACES = ["A", "B", "C"]
+MINUTES = [[0, 10, 50], [10, 0, 10], [50, 10, 0]]
+
+
+def plan_of(*attractions):
+    times = ["09:00-10:00", "11:00-12:00", "14:00-15:00"]
+    return {"daily_plans": [{"day": 1, "schedule": [
+        {"time": time, "attraction": name} for time, name in zip(times, attractions)
+    ]}]}
+
+
+def test_saved_minutes_is_travel_time():
+    matrix = DistanceMatrix(PLACES, MINUTES)
+    plan, saved = optimize_plan_route(plan_of("A", "C", "B"), matrix)
+    # A->C->B = 60分钟，A->B->C = 20分钟
+    assert saved == 40
+    assert [item["attraction"] for item in plan["daily_plans"][0]["schedule"]] == ["A", "B", "C"]
+
+
+def test_window_fix_does_not_report_penalty():
+    # B只在13:00以后开放：A->B->C（B在11:00）违规，C->A->B 满足时间窗但通行更远
+    matrix = DistanceMatrix(PLACES, MINUTES, {"B": ["13:00", "18:00"]})
+    plan, saved = optimize_plan_route(plan_of("A", "B", "C"), matrix)
+    schedule = plan["daily_plans"][0]["schedule"]
+    assert schedule[2]["attraction"] == "B"
+    # 通行时间由20分钟变为60分钟，不应计入10000的时间窗惩罚
+    assert saved == -40
+
+
+def test_unchanged_plan_saves_nothing():
+    matrix = DistanceMatrix(PLACES, MINUTES)
+    original = plan_of("A", "B", "C")
+    plan, saved = optimize_plan_route(original, matrix)
+    assert saved == 0
+    assert plan["daily_plans"][0] is original["daily_plans"][0]
+
+
+def test_city_path_traversal_rejected(tmp_path):
+    matrix_dir = tmp_path / "route_matrix"
+    matrix_dir.mkdir()
+    (matrix_dir / "北京.json").write_text(json.dumps({"places": PLACES, "minutes": MINUTES}), encoding="utf-8")
+    (tmp_path / "secret.json").write_text(json.dumps({"places": PLACES, "minutes": MINUTES}), encoding="utf-8")
+
+    assert load_city_matrix("北京", str(matrix_dir)) is not None
+    for city in ("../secret", "..", "a/b", "a\\b", "/etc/passwd", ".hidden", ""):
+        assert city_data_path(str(matrix_dir), city) is None
+        assert load_city_matrix(city, str(matrix_dir)) is None
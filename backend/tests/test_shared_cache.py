@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""跨进程共享缓存：命名空间隔离、条目过期、并发读取-修改-写入不丢更新"""
+
+import threading
+import time
+from shared_cache import SharedCache
+
+
+def make_cache(tmp_path):
+    return SharedCache(path=str(tmp_path / 'shared.db'), max_bytes=10 ** 6, mmap_bytes=0)
+
+
+def test_namespaces_are_isolated_and_counted(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set('weather', 'beijing', b'sunny')
+    assert cache.get('weather', 'beijing') == b'sunny'
+    assert cache.get('plan', 'beijing') is None
+    cache.namespace('plan').set('beijing', b'plan')
+    assert cache.get('plan', 'beijing') == b'plan'
+    cache.delete('weather', 'beijing')
+    assert cache.get('weather', 'beijing') is None
+    namespaces = cache.stats()["namespaces"]
+    assert namespaces["weather"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert namespaces["plan"]["hits"] == 1 and namespaces["plan"]["misses"] == 1
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set_json('weather', 'shanghai', {"temp": 20}, ttl=0.05)
+    cache.set_json('weather', 'forever', {"temp": 10})
+    assert cache.get_json('weather', 'shanghai') == {"temp": 20}
+    time.sleep(0.1)
+    assert cache.get_json('weather', 'shanghai') is None
+    assert cache.get_json('weather', 'forever') == {"temp": 10}
+    # 其他worker打开同一文件也看不到已过期的条目
+    assert make_cache(tmp_path).get_json('weather', 'shanghai') is None
+
+
+def test_update_treats_expired_entries_as_missing(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set_json('counter', 'n', 41, ttl=0.05)
+    time.sleep(0.1)
+    assert cache.update_json('counter', 'n', lambda old: (old or 0) + 1) == 1
+
+
+def test_update_returning_none_deletes_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set_json('counter', 'n', 1)
+    assert cache.update_json('counter', 'n', lambda old: None) is None
+    assert cache.get_json('counter', 'n') is None
+
+
+def test_concurrent_updates_from_several_workers_are_not_lost(tmp_path):
+    # 两个实例打开同一文件，模拟两个worker进程
+    workers = [make_cache(tmp_path), make_cache(tmp_path)]
+
+    def increment(cache):
+        for _ in range(25):
+            cache.update_json('counter', 'n', lambda old: (old or 0) + 1)
+
+    threads = [threading.Thread(target=increment, args=(workers[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert workers[0].get_json('counter', 'n') == 200
+    assert workers[1].get_json('counter', 'n') == 200
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""每分钟token配额：额度不足时排队、超过最长等待时间拒绝、按实际用量结算"""
+
+import threading
+import time
+from token_budget import TokenRateLimiter, fit_max_tokens
+
+
+def test_unlimited_limiter_never_blocks():
+    limiter = TokenRateLimiter(0)
+    reservation = limiter.acquire(10 ** 9)
+    assert reservation is not None
+    limiter.settle(reservation, 5)
+    assert limiter.stats()["used"] == 0
+
+
+def test_acquire_queues_until_window_frees_quota():
+    limiter = TokenRateLimiter(100, max_wait=2, window=0.2)
+    assert limiter.acquire(100) is not None
+    started = time.monotonic()
+    assert limiter.acquire(50) is not None
+    waited = time.monotonic() - started
+    assert 0.1 < waited < 1.5
+    assert limiter.stats()["used"] == 50 and limiter.rejected == 0
+
+
+def test_acquire_sheds_when_wait_exceeds_limit():
+    limiter = TokenRateLimiter(100, max_wait=0.05, window=60)
+    limiter.acquire(80)
+    started = time.monotonic()
+    assert limiter.acquire(30) is None
+    assert time.monotonic() - started < 0.5
+    assert limiter.stats() == {"tokens_per_minute": 100, "used": 80, "rejected": 1}
+
+
+def test_oversized_request_is_capped_to_the_quota():
+    limiter = TokenRateLimiter(100, max_wait=0.05, window=60)
+    assert limiter.acquire(500)[1] == 100
+
+
+def test_settle_refunds_unused_tokens_and_wakes_waiters():
+    limiter = TokenRateLimiter(100, max_wait=5, window=3)
+    reservation = limiter.acquire(90)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire(50)))
+    started = time.monotonic()
+    waiter.start()
+    time.sleep(0.05)
+    assert not results  # 额度不足，排队等待窗口释放
+    limiter.settle(reservation, 30)
+    waiter.join(2)
+    # 结算退回的额度立即唤醒排队者，不必等到窗口过期
+    assert results and results[0] is not None
+    assert time.monotonic() - started < 2
+    assert limiter.stats()["used"] == 80
+
+
+def test_settle_charges_extra_usage():
+    limiter = TokenRateLimiter(100, max_wait=0.05, window=60)
+    reservation = limiter.acquire(20)
+    limiter.settle(reservation, 60)
+    assert limiter.stats()["used"] == 60
+    assert limiter.acquire(50) is None
+
+
+def test_fit_max_tokens_respects_context_window():
+    assert fit_max_tokens(1000, 2000, 30000) == 2000
+    assert fit_max_tokens(29000, 2000, 30000) == 1000
+    assert fit_max_tokens(29900, 2000, 30000) is None
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""流量录制与回放：记录请求到达时间、回放时方案id映射与按录制间隔发送、回放客户端的限流标识"""
+
+import time
+from types import SimpleNamespace
+import dashscope
+import traffic_replay
+from database import Database
+from traffic_capture import TrafficRecorder, read_capture
+from traffic_replay import Replayer, replay_api_key, replay_api_keys
+from test_app import compact_plan, demand
+
+
+def forward_to(client, sent):
+    """把回放请求转发给Flask测试客户端，记录发送时间与路径"""
+    def request(method, url, json=None, headers=None, timeout=None):
+        path = url[len('http://replay'):]
+        sent.append((time.monotonic(), method, path))
+        response = client.open(path, method=method, json=json, headers=headers)
+        return SimpleNamespace(status_code=response.status_code, json=response.get_json)
+    return request
+
+
+def test_capture_then_replay_remaps_plan_ids(client, app_module, fake_llm, tmp_path, monkeypatch):
+    capture_path = str(tmp_path / 'capture.jsonl')
+    monkeypatch.setattr(app_module, 'traffic_recorder', TrafficRecorder(capture_path, sample_rate=1))
+    fake = fake_llm(compact_plan("录制版本"))
+    monkeypatch.setattr(dashscope.Generation, 'call', lambda **kwargs: (time.sleep(0.3), fake(**kwargs))[1])
+
+    before = time.time()
+    generated = client.post('/api/plan/generate', json=demand(refresh=True)).get_json()
+    recorded_id = generated["data"]["plan_id"]
+    assert client.get(f'/api/plan/{recorded_id}').status_code == 200
+
+    records = [record for record in read_capture(capture_path) if record['type'] == 'request']
+    assert [record['path'] for record in records] == ['/api/plan/generate', f'/api/plan/{recorded_id}']
+    # ts为请求到达时间，而不是LLM调用结束后的完成时间
+    assert records[0]['duration_ms'] >= 300
+    assert records[0]['ts'] - before < 0.2
+    assert records[0]['plan_id'] == recorded_id
+
+    # 在另一个数据库上回放：生成的方案id不同，后续查询应改用本次生成的id
+    replay_db = Database('sqlite', str(tmp_path / 'replay.db'))
+    placeholder = replay_db.insert_user_demand('占位', 1, 100, '', '')
+    for _ in range(recorded_id + 3):
+        replay_db.insert_travel_plan(placeholder, '{}')
+    monkeypatch.setattr(app_module, 'db', replay_db)
+    fake_llm(compact_plan("回放版本"))
+    sent = []
+    monkeypatch.setattr(traffic_replay.requests, 'request', forward_to(client, sent))
+    report = Replayer(records, 'http://replay', speed=0, concurrency=4).run()
+
+    replayed_id = int(sent[-1][2].rsplit('/', 1)[1])
+    assert replayed_id != recorded_id
+    assert replay_db.get_travel_plan(replayed_id) is not None
+    assert report["requests"] == 2
+    assert all(item["errors"] == 0 and item["status_mismatches"] == 0 for item in report["endpoints"].values())
+
+
+def test_replay_follows_recorded_arrival_intervals(monkeypatch):
+    sent = []
+
+    def request(method, url, json=None, headers=None, timeout=None):
+        sent.append(time.monotonic())
+        return SimpleNamespace(status_code=200, json=lambda: {})
+
+    monkeypatch.setattr(traffic_replay.requests, 'request', request)
+    records = [{"ts": 1000.0 + offset, "method": "GET", "path": "/api/plan/1", "status": 200, "client": "c"}
+               for offset in (0.8, 0.0, 0.4)]
+    Replayer(records, 'http://replay', speed=2).run()
+    gaps = [b - a for a, b in zip(sent, sent[1:])]
+    assert len(gaps) == 2 and all(0.15 < gap < 0.35 for gap in gaps)
+
+
+def test_registered_replay_keys_keep_clients_apart(app_module, monkeypatch):
+    records = [{"client": "aaa"}, {"client": "bbb"}, {"client": "aaa"}]
+    keys = replay_api_keys(records)
+    assert keys == 'replay-aaa,replay-bbb'
+
+    def client_id(key):
+        with app_module.app.test_request_context(headers={"X-API-Key": key}):
+            return app_module.get_client_id()
+
+    # 未登记时回放请求全部计为本机IP
+    assert client_id(replay_api_key('aaa')) == client_id(replay_api_key('bbb'))
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_API_KEYS', set(keys.split(',')))
+    assert client_id(replay_api_key('aaa')) == 'key:replay-aaa'
+    assert client_id(replay_api_key('bbb')) == 'key:replay-bbb'
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token预算管理模块
+本地近似估算token数，按行程天数和每日行程密度动态确定max_tokens，
+裁剪提示词上下文以适配模型窗口，并按分钟统计token用量，在DashScope限流前排队或拒绝请求
+"""
+
+import json
+import re
+import threading
+import time
+from collections import deque
+
+# 中日韩字符（含全角标点），通义千问分词器中大约每个字符对应一个token
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+# 英文单词、数字串与其余符号
+_WORD_PATTERN = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# 输出方案的token估算参数（完整JSON格式，含中文键值）
+PLAN_BASE_TOKENS = 250
+DAY_OVERHEAD_TOKENS = 40
+ITEM_TOKENS = 70
+# 紧凑输出格式（plan_compact）的估算参数：短键名、每个行程项一行文本
+COMPACT_BASE_TOKENS = 120
+COMPACT_DAY_OVERHEAD_TOKENS = 6
+COMPACT_ITEM_TOKENS = 48
+SAFETY_MARGIN = 1.2
+
+
+def estimate_tokens(text):
+    """近似估算文本的token数（偏保守，宁多勿少）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    tokens = 0
+    for word in _WORD_PATTERN.findall(text):
+        # 英文约4个字母一个token，数字约3位一个token，符号各占一个token
+        if word[0].isalpha():
+            tokens += (len(word) + 3) // 4
+        elif word[0].isdigit():
+            tokens += (len(word) + 2) // 3
+        else:
+            tokens += 1
+    return cjk + tokens
+
+
+def estimate_messages_tokens(messages):
+    """估算对话消息的token数（每条消息额外计入角色标记开销）"""
+    return sum(estimate_tokens(message.get('content', '')) + 4 for message in messages)
+
+
+def size_plan_max_tokens(days, items_per_day=4, limit=8000, minimum=600, compact=False):
+    """根据天数与每日行程密度估算生成方案所需的max_tokens（compact为True时按紧凑输出格式估算）"""
+    days = max(int(days), 1)
+    if compact:
+        estimated = COMPACT_BASE_TOKENS + days * (COMPACT_DAY_OVERHEAD_TOKENS + items_per_day * COMPACT_ITEM_TOKENS)
+    else:
+        estimated = PLAN_BASE_TOKENS + days * (DAY_OVERHEAD_TOKENS + items_per_day * ITEM_TOKENS)
+    return max(minimum, min(int(estimated * SAFETY_MARGIN), limit))
+
+
+def plan_density(plan):
+    """统计方案的天数与平均每日行程项数"""
+    daily_plans = plan.get('daily_plans') if isinstance(plan, dict) else None
+    if not isinstance(daily_plans, list) or not daily_plans:
+        return 1, 4
+    items = sum(len(day.get('schedule') or []) for day in daily_plans if isinstance(day, dict))
+    return len(daily_plans), max(1, round(items / len(daily_plans)))
+
+
+def compact_json(data):
+    """紧凑序列化（去掉多余空白，减少提示词token）"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def summarize_weather(weather_data):
+    """仅保留天气预报中与行程调整相关的字段"""
+    forecasts = weather_data.get('forecasts') if isinstance(weather_data, dict) else None
+    if not forecasts:
+        return weather_data
+
+    keep_fields = ('date', 'week', 'dayweather', 'nightweather', 'daytemp', 'nighttemp', 'daywind', 'daypower')
+    summary = []
+    for forecast in forecasts:
+        summary.append({
+            "city": forecast.get('city'),
+            "casts": [
+                {field: cast.get(field) for field in keep_fields if field in cast}
+                for cast in forecast.get('casts', [])
+            ]
+        })
+    return summary
+
+
+def fit_max_tokens(prompt_tokens, desired_max_tokens, context_window, minimum=256):
+    """在模型上下文窗口内确定max_tokens，窗口不足时返回None"""
+    available = context_window - prompt_tokens
+    if available < minimum:
+        return None
+    return min(desired_max_tokens, available)
+
+
+class TokenRateLimiter:
+    """按分钟滑动窗口统计token用量：额度不足时在最长等待时间内排队，超时则拒绝"""
+
+    def __init__(self, tokens_per_minute, max_wait=5.0, window=60.0):
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self.window = window
+        self._events = deque()  # (时间戳, token数)
+        self._used = 0
+        self._condition = threading.Condition()
+        self.rejected = 0
+
+    def _expire(self, now):
+        """移除窗口外的记录"""
+        while self._events and self._events[0][0] <= now - self.window:
+            self._used -= self._events.popleft()[1]
+
+    def acquire(self, tokens):
+        """预占token额度，成功返回预占记录，无法在max_wait内获得额度时返回None"""
+        if not self.tokens_per_minute:
+            return [time.time(), 0]
+        tokens = min(tokens, self.tokens_per_minute)
+        deadline = time.time() + self.max_wait
+        with self._condition:
+            while True:
+                now = time.time()
+                self._expire(now)
+                if self._used + tokens <= self.tokens_per_minute:
+                    reservation = [now, tokens]
+                    self._events.append(reservation)
+                    self._used += tokens
+                    return reservation
+
+                # 计算最早可获得足够额度的时间
+                freed = 0
+                ready_at = now
+                for timestamp, used in self._events:
+                    freed += used
+                    ready_at = timestamp + self.window
+                    if self._used - freed + tokens <= self.tokens_per_minute:
+                        break
+                if ready_at > deadline:
+                    self.rejected += 1
+                    return None
+                self._condition.wait(max(ready_at - now, 0.01))
+
+    def settle(self, reservation, actual_tokens):
+        """用实际用量修正预占额度（多退少补）"""
+        if not reservation or not self.tokens_per_minute:
+            return
+        with self._condition:
+            for event in self._events:
+                if event is reservation:
+                    self._used += actual_tokens - event[1]
+                    event[1] = actual_tokens
+                    break
+            self._condition.notify_all()
+
+    def stats(self):
+        """当前窗口内的token用量"""
+        with self._condition:
+            self._expire(time.time())
+            return {
+                "tokens_per_minute": self.tokens_per_minute,
+                "used": self._used,
+                "rejected": self.rejected
+            }
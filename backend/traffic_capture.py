@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量录制与上游回放模块
+录制：配置 TRAFFIC_CAPTURE_PATH 后，方案接口的请求（脱敏后的请求体、状态码、耗时）与DashScope/高德的上游响应
+以JSON Lines追加写入录制文件，超过 TRAFFIC_CAPTURE_MAX_MB 时轮转为 <文件>.1
+回放：以录制文件启动服务（TRAFFIC_REPLAY_PATH）时，上游调用不再访问外网，而是按请求键从录制结果中返回，
+并按录制的上游耗时等待（TRAFFIC_REPLAY_UPSTREAM_SPEED 可缩放），配合 traffic_replay.py 在本地复现生产流量
+
+记录格式（每行一个JSON对象）：
+{"type": "request", "ts"（到达时间）, "method", "path", "query", "body", "client", "status", "duration_ms", "response_bytes", "plan_id"}
+{"type": "upstream", "ts", "kind": "llm" | "weather", "key", "duration_ms", "response"}
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+# 字段名匹配时值替换为***（API Key、口令等）
+SENSITIVE_FIELD = re.compile(r'key|token|secret|password|authorization', re.IGNORECASE)
+REDACTED = '***'
+
+_recorder = None
+_replay = None
+_singleton_lock = threading.Lock()
+
+
+def sanitize(value, redact_fields=()):
+    """递归脱敏：敏感字段与指定字段的值替换为***"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if SENSITIVE_FIELD.search(str(key)) or key in redact_fields else sanitize(item, redact_fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [sanitize(item, redact_fields) for item in value]
+    return value
+
+
+def read_capture(path):
+    """按时间顺序读取录制记录（先读轮转出的 <文件>.1），跳过写入中断的残行"""
+    for file_path in (f"{path}.1", path):
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+
+
+def llm_response_record(response):
+    """DashScope响应中回放需要的字段"""
+    usage = getattr(response, 'usage', None)
+    record = {"status_code": response.status_code, "message": getattr(response, 'message', '')}
+    if response.status_code == 200:
+        record["content"] = response.output.choices[0].message.content
+    if usage:
+        record["input_tokens"] = getattr(usage, 'input_tokens', 0) or 0
+        record["output_tokens"] = getattr(usage, 'output_tokens', 0) or 0
+    return record
+
+
+def replay_llm_response(record):
+    """由录制的字段还原与DashScope响应相同结构的对象"""
+    usage = None
+    if 'output_tokens' in record:
+        usage = SimpleNamespace(input_tokens=record.get('input_tokens', 0), output_tokens=record['output_tokens'])
+    output = None
+    if record.get('status_code') == 200:
+        message = SimpleNamespace(content=record.get('content', ''))
+        output = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    return SimpleNamespace(status_code=record.get('status_code', 500), message=record.get('message', ''),
+                           usage=usage, output=output)
+
+
+class TrafficRecorder:
+    """录制文件写入器：各worker进程以O_APPEND追加整行，超过容量时轮转"""
+
+    def __init__(self, path, max_bytes=None, sample_rate=None, redact_fields=None):
+        self.path = path
+        self.max_bytes = max_bytes or int(float(os.getenv('TRAFFIC_CAPTURE_MAX_MB', 100)) * 1024 * 1024)
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('TRAFFIC_CAPTURE_SAMPLE', 1.0))
+        if redact_fields is None:
+            redact_fields = [field.strip() for field in os.getenv('TRAFFIC_CAPTURE_REDACT', '').split(',')]
+        self.redact_fields = {field for field in redact_fields if field}
+        self._fd = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.upstreams = 0
+        self.rotations = 0
+
+    def sampled(self):
+        """本次请求是否录制"""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _open(self):
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def _rotate_if_full(self):
+        """文件超过容量时轮转；其他进程已经轮转过时只重新打开"""
+        current = os.fstat(self._fd)
+        if current.st_size < self.max_bytes:
+            return
+        try:
+            same_file = os.stat(self.path).st_ino == current.st_ino
+        except FileNotFoundError:
+            same_file = False
+        if same_file:
+            os.replace(self.path, f"{self.path}.1")
+            self.rotations += 1
+        os.close(self._fd)
+        self._fd = self._open()
+
+    def _write(self, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        with self._lock:
+            try:
+                if self._fd is None:
+                    self._fd = self._open()
+                else:
+                    self._rotate_if_full()
+                # 整行一次写入，多个进程追加时不会交错
+                os.write(self._fd, line)
+            except OSError as e:
+                print(f"写入流量录制文件失败: {e}")
+
+    def record_request(self, method, path, query, body, client, status, duration_ms, response_bytes=None,
+                       plan_id=None, ts=None):
+        """记录一个接口请求（客户端标识只保存哈希）
+
+        ts为请求到达时间（回放按到达时间安排发送），未提供时由完成时间减去耗时推算
+        """
+        self._write({
+            "type": "request",
+            "ts": ts if ts is not None else time.time() - duration_ms / 1000,
+            "method": method,
+            "path": path,
+            "query": query,
+            "body": sanitize(body, self.redact_fields),
+            "client": hashlib.sha1(str(client).encode('utf-8')).hexdigest()[:12],
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "response_bytes": response_bytes,
+            "plan_id": plan_id
+        })
+        self.requests += 1
+
+    def record_upstream(self, kind, key, response, duration_ms):
+        """记录一次上游调用的响应与耗时"""
+        self._write({
+            "type": "upstream",
+            "ts": time.time(),
+            "kind": kind,
+            "key": key,
+            "duration_ms": round(duration_ms, 2),
+            "response": response
+        })
+        self.upstreams += 1
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "requests": self.requests,
+            "upstreams": self.upstreams,
+            "rotations": self.rotations
+        }
+
+
+class UpstreamReplay:
+    """从录制文件返回上游响应：先按请求键精确匹配（同一键多次录制时依次循环），
+    找不到时（如请求体字段被脱敏导致提示词不同）按录制顺序返回同类响应"""
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        # 上游耗时缩放：2表示按录制耗时的一半等待，0表示不等待
+        self.speed = speed if speed is not None else float(os.getenv('TRAFFIC_REPLAY_UPSTREAM_SPEED', 1.0))
+        self._by_key = {}
+        self._by_kind = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        for record in read_capture(path):
+            if record.get('type') != 'upstream':
+                continue
+            self._by_key.setdefault((record['kind'], record['key']), deque()).append(record)
+            self._by_kind.setdefault(record['kind'], []).append(record)
+
+    def _next(self, kind, key):
+        with self._lock:
+            queue = self._by_key.get((kind, key))
+            if queue:
+                record = queue[0]
+                queue.rotate(-1)
+                self.hits += 1
+            else:
+                records = self._by_kind.get(kind)
+                if not records:
+                    self.misses += 1
+                    return None
+                cursor = self._cursors.get(kind, 0)
+                self._cursors[kind] = cursor + 1
+                record = records[cursor % len(records)]
+                self.fallbacks += 1
+        if self.speed:
+            time.sleep(record.get('duration_ms', 0) / 1000 / self.speed)
+        return record['response']
+
+    def llm(self, key):
+        """返回录制的DashScope响应对象，没有录制数据时返回None"""
+        record = self._next('llm', key)
+        return replay_llm_response(record) if record is not None else None
+
+    def weather(self, city):
+        """返回录制的高德天气响应JSON，没有录制数据时返回None"""
+        return self._next('weather', city)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "speed": self.speed,
+                "recorded": sum(len(records) for records in self._by_kind.values()),
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "misses": self.misses
+            }
+
+
+def get_traffic_recorder():
+    """进程内共享同一个录制器，未配置 TRAFFIC_CAPTURE_PATH 时返回None"""
+    global _recorder
+    path = os.getenv('TRAFFIC_CAPTURE_PATH')
+    if not path:
+        return None
+    with _singleton_lock:
+        if _recorder is None:
+            _recorder = TrafficRecorder(path)
+        return _recorder
+
+
+def get_upstream_replay():
+    """回放模式（配置 TRAFFIC_REPLAY_PATH）下的上游响应来源，否则返回None"""
+    global _replay
+    path = os.getenv('TRAFFIC_REPLAY_PATH')
+    if not path:
+        return None
+    with _singleton_lock:
+        if _replay is None:
+            _replay = UpstreamReplay(path)
+            print(f"上游回放模式：从 {path} 加载了 {_replay.stats()['recorded']} 条上游响应")
+        return _replay
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量回放工具
+按录制文件中的请求顺序与间隔（可用 --speed 加速或减速）向本地服务重放请求，统计各接口延迟与吞吐量，
+并对比两个代码版本的回放报告
+
+被测服务需以回放模式启动，上游（DashScope/高德）响应从同一录制文件返回；每次回放使用全新的数据库与缓存文件，
+保证两个版本的对比条件一致。回放请求全部来自本机，每个录制客户端以 replay-<客户端哈希> 作为X-API-Key发送，
+被测服务需通过 RATE_LIMIT_API_KEYS 登记这些Key，才会按录制时的客户端分别限流与公平排队
+（否则全部按127.0.0.1计为同一个客户端，产生录制时没有的429）：
+
+    TRAFFIC_REPLAY_PATH=capture.jsonl DB_BACKEND=sqlite SQLITE_PATH=/tmp/replay.db \\
+    LLM_CACHE_PATH=/tmp/replay_llm.db PLAN_CACHE_PATH=/tmp/replay_plan.db SHARED_CACHE_PATH=/tmp/replay_shared.db \\
+    RATE_LIMIT_API_KEYS="$(python traffic_replay.py keys capture.jsonl)" \\
+    python app.py
+
+用法：
+    python traffic_replay.py keys capture.jsonl
+    python traffic_replay.py run capture.jsonl --target http://localhost:5000 --speed 2 --output new.json
+    python traffic_replay.py compare old.json new.json
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from traffic_capture import read_capture
+
+_PLAN_PATH = re.compile(r'^/api/plan/(\d+)$')
+
+
+def percentile(values, q):
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def endpoint_name(method, path):
+    """按接口归类（路径中的方案id替换为<id>）"""
+    return f"{method} {_PLAN_PATH.sub('/api/plan/<id>', path)}"
+
+
+def replay_api_key(client):
+    """录制客户端（标识哈希）在回放时使用的X-API-Key"""
+    return f"replay-{client or ''}"
+
+
+def replay_api_keys(records):
+    """录制文件中全部客户端的回放Key（逗号分隔，用于被测服务的RATE_LIMIT_API_KEYS）"""
+    return ','.join(sorted({replay_api_key(record.get('client')) for record in records}))
+
+
+class Replayer:
+    """重放录制的请求：录制时生成的方案id映射为本次生成的id，引用尚未生成的方案时等待其生成请求完成"""
+
+    def __init__(self, records, target, speed=1.0, concurrency=16, timeout=120):
+        self.records = sorted(records, key=lambda record: record['ts'])
+        self.target = target.rstrip('/')
+        self.speed = speed
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._plan_ids = {}
+        self._produced = {record['plan_id']: threading.Event() for record in self.records if record.get('plan_id')}
+        self._lock = threading.Lock()
+        self.results = []
+
+    def _local_plan_id(self, recorded_id):
+        """录制的方案id对应的本地id；由本次回放中较早的请求生成时等待其完成"""
+        event = self._produced.get(recorded_id)
+        if event is not None:
+            event.wait(self.timeout)
+        return self._plan_ids.get(recorded_id, recorded_id)
+
+    def _rewrite(self, record):
+        path = record['path']
+        match = _PLAN_PATH.match(path)
+        if match:
+            path = f"/api/plan/{self._local_plan_id(int(match.group(1)))}"
+        body = record.get('body')
+        if isinstance(body, dict) and body.get('plan_id') is not None:
+            body = dict(body)
+            try:
+                body['plan_id'] = self._local_plan_id(int(body['plan_id']))
+            except (TypeError, ValueError):
+                pass
+        return path, body
+
+    def _send(self, record, scheduled_at):
+        produced = record.get('plan_id')
+        status = None
+        # 等待所引用方案生成的时间不计入延迟
+        path, body = self._rewrite(record)
+        started = time.perf_counter()
+        try:
+            url = self.target + path + (f"?{record['query']}" if record.get('query') else '')
+            response = requests.request(
+                record['method'], url,
+                json=body if record['method'] != 'GET' else None,
+                headers={"X-API-Key": replay_api_key(record.get('client'))},
+                timeout=self.timeout
+            )
+            status = response.status_code
+            if produced and status == 200:
+                data = (response.json() or {}).get('data') or {}
+                local_id = data.get('plan_id') or data.get('new_plan_id')
+                if local_id:
+                    self._plan_ids[produced] = local_id
+        except requests.RequestException as e:
+            print(f"请求失败 {record['method']} {record['path']}: {e}")
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            if produced in self._produced:
+                self._produced[produced].set()
+        with self._lock:
+            self.results.append({
+                "endpoint": endpoint_name(record['method'], record['path']),
+                "status": status,
+                "recorded_status": record.get('status'),
+                "latency_ms": latency_ms,
+                "recorded_ms": record.get('duration_ms'),
+                # 发出时间相对计划时间的延后（回放端并发不足时增大）
+                "lag_ms": (time.time() - scheduled_at) * 1000 - latency_ms
+            })
+
+    def run(self):
+        if not self.records:
+            return self.report(0.0)
+        first_ts = self.records[0]['ts']
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for record in self.records:
+                # speed为0时不等待，按最大并发连续发送
+                scheduled_at = start + (record['ts'] - first_ts) / self.speed if self.speed else time.time()
+                delay = scheduled_at - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, record, scheduled_at)
+        return self.report(time.time() - start)
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for result in self.results:
+            endpoints.setdefault(result['endpoint'], []).append(result)
+        summary = {}
+        for name, results in sorted(endpoints.items()):
+            latencies = [r['latency_ms'] for r in results]
+            recorded = [r['recorded_ms'] for r in results if r['recorded_ms'] is not None]
+            summary[name] = {
+                "count": len(results),
+                "errors": sum(1 for r in results if r['status'] is None or r['status'] >= 500),
+                "status_mismatches": sum(1 for r in results if r['status'] != r['recorded_status']),
+                "mean_ms": round(sum(latencies) / len(latencies), 2),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "recorded_p50_ms": percentile(recorded, 50),
+                "recorded_p95_ms": percentile(recorded, 95)
+            }
+        return {
+            "target": self.target,
+            "speed": self.speed,
+            "requests": len(self.results),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput": round(len(self.results) / wall_seconds, 2) if wall_seconds else None,
+            "max_lag_ms": round(max((r['lag_ms'] for r in self.results), default=0), 2),
+            "endpoints": summary
+        }
+
+
+def print_report(report):
+    print(f"回放 {report['requests']} 个请求，耗时 {report['wall_seconds']}s，吞吐量 {report['throughput']} req/s，"
+          f"最大发送延后 {report['max_lag_ms']}ms")
+    print("=" * 96)
+    print(f"{'接口':<28}{'次数':>6}{'错误':>6}{'状态不一致':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'录制p50':>10}")
+    for name, item in report['endpoints'].items():
+        print(f"{name:<28}{item['count']:>6}{item['errors']:>6}{item['status_mismatches']:>10}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}{str(item['recorded_p50_ms']):>10}")
+
+
+def _delta(old, new):
+    if not old or new is None:
+        return '-'
+    return f"{(new - old) / old:+.1%}"
+
+
+def compare(baseline, candidate):
+    """对比两份回放报告：延迟与吞吐量的变化（负值表示延迟降低）"""
+    print(f"吞吐量: {baseline['throughput']} -> {candidate['throughput']} req/s "
+          f"({_delta(baseline['throughput'], candidate['throughput'])})")
+    print("=" * 96)
+    print(f"{'接口':<28}{'p50(ms)':>22}{'变化':>9}{'p95(ms)':>22}{'变化':>9}")
+    for name, old in baseline['endpoints'].items():
+        new = candidate['endpoints'].get(name)
+        if new is None:
+            continue
+        print(f"{name:<28}{old['p50_ms']:>10} -> {new['p50_ms']:<8}{_delta(old['p50_ms'], new['p50_ms']):>9}"
+              f"{old['p95_ms']:>10} -> {new['p95_ms']:<8}{_delta(old['p95_ms'], new['p95_ms']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流量回放与版本对比")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="重放录制文件中的请求")
+    run_parser.add_argument('capture', help="录制文件（TRAFFIC_CAPTURE_PATH）")
+    run_parser.add_argument('--target', default='http://localhost:5000', help="被测服务地址")
+    run_parser.add_argument('--speed', type=float, default=1.0, help="回放速度倍数，0表示不按录制间隔等待")
+    run_parser.add_argument('--concurrency', type=int, default=16, help="最大并发请求数")
+    run_parser.add_argument('--output', help="回放报告输出文件（JSON）")
+
+    keys_parser = commands.add_parser('keys', help="输出回放使用的客户端Key（被测服务的RATE_LIMIT_API_KEYS）")
+    keys_parser.add_argument('capture', help="录制文件（TRAFFIC_CAPTURE_PATH）")
+
+    compare_parser = commands.add_parser('compare', help="对比两份回放报告")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+
+    args = parser.parse_args()
+    if args.command == 'keys':
+        print(replay_api_keys(record for record in read_capture(args.capture) if record.get('type') == 'request'))
+    elif args.command == 'run':
+        records = [record for record in read_capture(args.capture) if record.get('type') == 'request']
+        if not records:
+            print("录制文件中没有请求记录")
+            sys.exit(1)
+        report = Replayer(records, args.target, args.speed, args.concurrency).run()
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.candidate, 'r', encoding='utf-8') as f:
+            candidate = json.load(f)
+        compare(baseline, candidate)
+
+
+if __name__ == '__main__':
+    main()